@@ -0,0 +1,356 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Management of JIT cache directories.
+
+A cache directory holds, for each JIT module, its C source
+(``<module>.c``), the compiled module, a ``<module>.c.cached`` marker
+written once the module is ready (or ``<module>.c.failed``, holding the
+compiler diagnostic, if the build failed) and a ``<module>.lock`` file. Object files of separately
+compiled translation units are kept in the ``objects`` subdirectory,
+intermediate representations of integrals in the ``ir`` subdirectory,
+and the generated code of modules, which does not depend on the compiler
+flags, in the ``code`` subdirectory.
+
+The JIT refreshes the modification time of the marker whenever a module
+is loaded from the cache, so entries can be evicted in least recently
+used order. An entry is only evicted while holding its lock, and never
+within ``min_age`` seconds of its last use, so modules that are being
+built or loaded are left alone.
+
+Run ``python -m ffcx.cache --help`` for the command-line interface.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+import typing
+from pathlib import Path
+
+from ffcx.codegeneration.filelock import FileLock
+
+logger = logging.getLogger("ffcx")
+
+# Environment variable with the maximum size of JIT cache directories
+MAX_SIZE_VARIABLE = "FFCX_CACHE_MAX_SIZE"
+
+# Subdirectory of each kind of entry other than modules, and the
+# suffixes of the files of ready entries
+_subdirectories = {
+    "object": ("objects", (".o",)),
+    "ir": ("ir", (".pkl",)),
+    "code": ("code", (".json", ".split.json")),
+}
+
+_size_units = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+class CacheEntry(typing.NamedTuple):
+    """A JIT module, or a cached object file, representation or code, in a cache directory."""
+
+    name: str
+    kind: str
+    files: list[Path]
+    size: int
+    last_access: float
+    status: str
+
+
+class CacheStats(typing.NamedTuple):
+    """Summary of a cache directory."""
+
+    modules: int
+    ready: int
+    failed: int
+    incomplete: int
+    objects: int
+    representations: int
+    code: int
+    size: int
+
+
+def parse_size(size: str) -> int:
+    """Parse a size in bytes, with an optional K, M, G or T suffix."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d*)?)\s*([KMGT]?)i?B?\s*", size, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size '{size}'.")
+    return int(float(match.group(1)) * _size_units[match.group(2).upper()])
+
+
+def max_size_from_environment() -> int | None:
+    """Return the maximum cache size set in the environment, if any."""
+    size = os.environ.get(MAX_SIZE_VARIABLE)
+    return None if not size else parse_size(size)
+
+
+def entries(cache_dir: str | os.PathLike) -> list[CacheEntry]:
+    """Return the entries of a cache directory, least recently used first."""
+    cache_dir = Path(cache_dir)
+    groups: dict[str, dict[str, list[Path]]] = {"module": {}}
+    if cache_dir.is_dir():
+        for path in cache_dir.iterdir():
+            if path.name.startswith("libffcx_") and path.is_file():
+                groups["module"].setdefault(path.name.split(".")[0], []).append(path)
+    for kind, (subdirectory, _) in _subdirectories.items():
+        groups[kind] = {}
+        if cache_dir.joinpath(subdirectory).is_dir():
+            for path in cache_dir.joinpath(subdirectory).iterdir():
+                groups[kind].setdefault(path.name.split(".")[0], []).append(path)
+
+    result = []
+    for kind, group in groups.items():
+        for name, files in group.items():
+            stats = {}
+            for path in files:
+                try:
+                    stats[path] = path.stat()
+                except FileNotFoundError:
+                    pass
+            if not stats:
+                continue
+            names = {path.name for path in stats}
+            if kind != "module":
+                suffixes = _subdirectories[kind][1]
+                ready = any(f"{name}{suffix}" in names for suffix in suffixes)
+                status = "ready" if ready else "incomplete"
+            elif f"{name}.c.cached" in names:
+                status = "ready"
+            elif f"{name}.c.failed" in names:
+                status = "failed"
+            else:
+                status = "incomplete"
+            marker = cache_dir.joinpath(f"{name}.c.cached")
+            if marker in stats:
+                last_access = stats[marker].st_mtime
+            else:
+                last_access = max(stat.st_mtime for stat in stats.values())
+            size = sum(stat.st_size for stat in stats.values())
+            result.append(CacheEntry(name, kind, sorted(stats), size, last_access, status))
+    return sorted(result, key=lambda entry: entry.last_access)
+
+
+def stats(cache_dir: str | os.PathLike) -> CacheStats:
+    """Return statistics of a cache directory."""
+    current = entries(cache_dir)
+    status = [entry.status for entry in current if entry.kind == "module"]
+    kinds = [entry.kind for entry in current]
+    return CacheStats(
+        modules=len(status),
+        ready=status.count("ready"),
+        failed=status.count("failed"),
+        incomplete=status.count("incomplete"),
+        objects=kinds.count("object"),
+        representations=kinds.count("ir"),
+        code=kinds.count("code"),
+        size=sum(entry.size for entry in current),
+    )
+
+
+def evict(cache_dir: str | os.PathLike, entry: CacheEntry, min_age: float = 60.0) -> bool:
+    """Remove an entry from a cache directory.
+
+    Modules are removed while holding their lock. Entries are only
+    removed if they have not been used within min_age seconds.
+
+    Returns:
+        True if the entry was removed.
+    """
+    cache_dir = Path(cache_dir)
+    if entry.kind != "module":
+        if time.time() - entry.last_access < min_age:
+            return False
+        for path in sorted(entry.files, key=lambda path: path.suffix != ".o"):
+            path.unlink(missing_ok=True)
+        return True
+
+    lock = FileLock(cache_dir.joinpath(f"{entry.name}.lock"))
+    if not lock.acquire(0):
+        return False
+    try:
+        marker = cache_dir.joinpath(f"{entry.name}.c.cached")
+        try:
+            last_access = marker.stat().st_mtime
+        except FileNotFoundError:
+            last_access = entry.last_access
+        if time.time() - max(last_access, entry.last_access) < min_age:
+            return False
+        # Remove the marker first, so the module is no longer looked up
+        marker.unlink(missing_ok=True)
+        for path in cache_dir.glob(f"{entry.name}.*"):
+            if path != lock.path:
+                path.unlink(missing_ok=True)
+        # Waiters on the removed lock file notice and take a new one
+        lock.path.unlink(missing_ok=True)
+    finally:
+        lock.release()
+    logger.info(f"Evicted {entry.name} from JIT cache {cache_dir}.")
+    return True
+
+
+def clear_failed(cache_dir: str | os.PathLike) -> list[str]:
+    """Clear the recorded failures of modules, so they are compiled again.
+
+    Returns:
+        Names of the modules whose failure was cleared.
+    """
+    cache_dir = Path(cache_dir)
+    cleared = []
+    for entry in entries(cache_dir):
+        if entry.kind == "module" and entry.status == "failed":
+            cache_dir.joinpath(f"{entry.name}.c.failed").unlink(missing_ok=True)
+            cleared.append(entry.name)
+    return cleared
+
+
+def prune(
+    cache_dir: str | os.PathLike,
+    max_size: int | None = None,
+    max_age: float | None = None,
+    min_age: float = 60.0,
+) -> list[CacheEntry]:
+    """Evict least recently used entries from a cache directory.
+
+    Args:
+        cache_dir: Cache directory.
+        max_size: Evict entries until the directory holds at most this
+            many bytes.
+        max_age: Evict entries not used for this many seconds.
+        min_age: Never evict entries used within this many seconds.
+
+    Returns:
+        The evicted entries.
+    """
+    current = entries(cache_dir)
+    size = sum(entry.size for entry in current)
+    now = time.time()
+    evicted = []
+    for entry in current:
+        too_big = max_size is not None and size > max_size
+        too_old = max_age is not None and now - entry.last_access > max_age
+        if not (too_big or too_old):
+            continue
+        if evict(cache_dir, entry, min_age):
+            evicted.append(entry)
+            size -= entry.size
+    return evicted
+
+
+def verify(cache_dir: str | os.PathLike, min_age: float = 60.0) -> list[tuple[CacheEntry, str]]:
+    """Check the entries of a cache directory.
+
+    Returns:
+        (entry, problem) for each entry with a problem.
+    """
+    cache_dir = Path(cache_dir)
+    problems = []
+    now = time.time()
+    for entry in entries(cache_dir):
+        names = {path.name for path in entry.files}
+        if entry.kind != "module":
+            if entry.status == "incomplete" and now - entry.last_access > min_age:
+                problems.append((entry, f"{entry.kind} file is missing"))
+        elif entry.status == "ready":
+            libraries = [name for name in names if re.search(r"\.(so|pyd|dylib)$", name)]
+            if not libraries:
+                problems.append((entry, "module is marked ready but has no library"))
+        elif entry.status == "failed":
+            problems.append((entry, "module failed to compile"))
+        elif entry.status == "incomplete" and now - entry.last_access > min_age:
+            lock = FileLock(cache_dir.joinpath(f"{entry.name}.lock"))
+            if lock.acquire(0):
+                lock.release()
+                problems.append((entry, "module build was interrupted"))
+        if any(name.endswith(".tmp") for name in names) and now - entry.last_access > min_age:
+            problems.append((entry, "leftover temporary files"))
+    return problems
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            break
+        size /= 1024
+    return f"{size:.1f} {unit}"
+
+
+parser = argparse.ArgumentParser(
+    prog="python -m ffcx.cache", description="Manage an FFCx JIT cache directory."
+)
+parser.add_argument("cache_dir", help="cache directory")
+parser.add_argument(
+    "--min-age",
+    type=float,
+    default=60.0,
+    help="never touch entries used within this many seconds (default=60)",
+)
+subparsers = parser.add_subparsers(dest="command", required=True)
+subparsers.add_parser("list", help="list entries, least recently used first")
+subparsers.add_parser("stats", help="report statistics")
+prune_parser = subparsers.add_parser("prune", help="evict least recently used entries")
+prune_parser.add_argument(
+    "--max-size",
+    type=parse_size,
+    default=None,
+    help=f"maximum size, e.g. 500M or 2G (default: ${MAX_SIZE_VARIABLE})",
+)
+prune_parser.add_argument(
+    "--max-age", type=float, default=None, help="evict entries unused for this many days"
+)
+subparsers.add_parser("clear-failed", help="compile failed modules again when next used")
+verify_parser = subparsers.add_parser("verify", help="check entries")
+verify_parser.add_argument("--fix", action="store_true", help="evict entries with problems")
+
+
+def main(args=None):
+    """Run the cache maintenance command."""
+    xargs = parser.parse_args(args)
+    cache_dir = Path(xargs.cache_dir)
+
+    if xargs.command == "list":
+        for entry in entries(cache_dir):
+            last_access = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.last_access))
+            print(
+                f"{last_access}  {_format_size(entry.size):>10}  {entry.kind:6}  "
+                f"{entry.status:10}  {entry.name}"
+            )
+    elif xargs.command == "stats":
+        s = stats(cache_dir)
+        print(f"Modules:    {s.modules}")
+        print(f"  ready:      {s.ready}")
+        print(f"  failed:     {s.failed}")
+        print(f"  incomplete: {s.incomplete}")
+        print(f"Objects:    {s.objects}")
+        print(f"IRs:        {s.representations}")
+        print(f"Code:       {s.code}")
+        print(f"Size:       {_format_size(s.size)}")
+    elif xargs.command == "prune":
+        max_size = xargs.max_size if xargs.max_size is not None else max_size_from_environment()
+        max_age = None if xargs.max_age is None else xargs.max_age * 86400
+        if max_size is None and max_age is None:
+            parser.error(f"prune needs --max-size, --max-age or ${MAX_SIZE_VARIABLE}")
+        evicted = prune(cache_dir, max_size, max_age, xargs.min_age)
+        size = sum(entry.size for entry in evicted)
+        print(f"Evicted {len(evicted)} entries ({_format_size(size)})")
+    elif xargs.command == "clear-failed":
+        for name in clear_failed(cache_dir):
+            print(f"Cleared failure of {name}")
+    elif xargs.command == "verify":
+        problems = verify(cache_dir, xargs.min_age)
+        for entry, problem in problems:
+            print(f"{entry.name}: {problem}")
+            if xargs.fix:
+                evict(cache_dir, entry, xargs.min_age)
+        if problems and not xargs.fix:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Utilities shared by the in-process memos and the on-disk caches."""
+
+from __future__ import annotations
+
+import collections
+import contextlib
+import os
+import threading
+import typing
+from pathlib import Path
+
+
+class MemoInfo(typing.NamedTuple):
+    """Statistics of an in-process memo."""
+
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUMemo:
+    """Thread-safe, size-bounded memo evicting the least recently used entries."""
+
+    def __init__(self, maxsize: int):
+        """Initialise."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> typing.Any | None:
+        """Return the value stored under key, or None."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store value under key, evicting the least recently used entries."""
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def resize(self, maxsize: int):
+        """Change the maximum number of entries."""
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> MemoInfo:
+        """Return memo statistics."""
+        with self._lock:
+            return MemoInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def _evict(self):
+        """Remove the least recently used entries beyond the maximum size."""
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+
+
+@contextlib.contextmanager
+def atomic_path(path: Path) -> typing.Iterator[Path]:
+    """Yield a temporary path to write, moved to path once complete.
+
+    The temporary file is in the same directory, so it is moved
+    atomically, and is unique to the process and thread, so concurrent
+    writers do not interfere. Readers of path never see a partial file.
+    The temporary file is removed if the body raises.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_atomic(path: Path, data: str | bytes):
+    """Write text or bytes to a file atomically, see :func:`atomic_path`."""
+    with atomic_path(path) as tmp:
+        if isinstance(data, bytes):
+            tmp.write_bytes(data)
+        else:
+            tmp.write_text(data)
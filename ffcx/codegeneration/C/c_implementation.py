@@ -5,6 +5,8 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 """C implementation."""
 
+import io
+import typing
 import warnings
 
 import numpy as np
@@ -143,7 +145,13 @@ math_table = {
 
 
 class CFormatter:
-    """C formatter."""
+    """C formatter.
+
+    Statements are written line by line to a stream, with the indentation
+    of the enclosing blocks, so formatting time is linear in the size of
+    the code whatever its nesting depth. Expressions are formatted as
+    strings.
+    """
 
     scalar_type: np.dtype
     real_type: np.dtype
@@ -152,6 +160,10 @@ class CFormatter:
         """Initialise."""
         self.scalar_type = np.dtype(dtype)
         self.real_type = dtype_to_scalar_dtype(dtype)
+        self._write: typing.Callable[[str], typing.Any] = io.StringIO().write
+        self._indent = ""
+        self._in_loop = False
+        self._num_lines = 0
 
     def _dtype_to_name(self, dtype) -> str:
         """Convert dtype to C name."""
@@ -176,6 +188,11 @@ class CFormatter:
 
     def _build_initializer_lists(self, values):
         """Build initializer lists."""
+        if isinstance(values, np.ndarray) and values.ndim > 0 and values.size > 0:
+            if values.dtype == np.float64:
+                return _format_float64_array(values)
+            if np.issubdtype(values.dtype, np.integer):
+                return _nested_lists(values.astype(str))
         arr = "{"
         if len(values.shape) == 1:
             arr += ", ".join(self._format_number(v) for v in values)
@@ -184,35 +201,61 @@ class CFormatter:
         arr += "}"
         return arr
 
-    def format_statement_list(self, slist) -> str:
-        """Format a statement list."""
-        return "".join(self.c_format(s) for s in slist.statements)
+    def _line(self, line: str):
+        """Write a line, indented to the current block."""
+        if line or not self._in_loop:
+            # Empty lines are dropped from loop bodies
+            self._write(self._indent + line + "\n")
+            self._num_lines += 1
+
+    def _lines(self, text: str):
+        """Write the lines of a text, indented to the current block."""
+        if "\n" in text:
+            for line in text.split("\n"):
+                self._line(line)
+        else:
+            self._line(text)
 
-    def format_section(self, section) -> str:
-        """Format a section."""
+    def _block(self, statement, in_loop: bool):
+        """Write a statement in a block nested in the current block."""
+        indent, self._indent = self._indent, self._indent + "  "
+        outer_in_loop, self._in_loop = self._in_loop, in_loop
+        try:
+            self.c_write(statement)
+        finally:
+            self._indent = indent
+            self._in_loop = outer_in_loop
+
+    def write_statement_list(self, slist):
+        """Write a statement list."""
+        for s in slist.statements:
+            self.c_write(s)
+
+    def write_section(self, section):
+        """Write a section."""
         # add new line before section
-        comments = "// ------------------------ \n"
-        comments += "// Section: " + section.name + "\n"
-        comments += "// Inputs: " + ", ".join(w.name for w in section.input) + "\n"
-        comments += "// Outputs: " + ", ".join(w.name for w in section.output) + "\n"
-        declarations = "".join(self.c_format(s) for s in section.declarations)
+        self._line("// ------------------------ ")
+        self._line("// Section: " + section.name)
+        self._line("// Inputs: " + ", ".join(w.name for w in section.input))
+        self._line("// Outputs: " + ", ".join(w.name for w in section.output))
+        for s in section.declarations:
+            self.c_write(s)
 
-        body = ""
         if len(section.statements) > 0:
-            declarations += "{\n  "
-            body = "".join(self.c_format(s) for s in section.statements)
-            body = body.replace("\n", "\n  ")
-            body = body[:-2] + "}\n"
+            self._line("{")
+            num_lines = self._num_lines
+            for s in section.statements:
+                self._block(s, False)
+            self._line("}" if self._num_lines > num_lines else "  }")
 
-        body += "// ------------------------ \n"
-        return comments + declarations + body
+        self._line("// ------------------------ ")
 
-    def format_comment(self, c) -> str:
-        """Format a comment."""
-        return "// " + c.comment + "\n"
+    def write_comment(self, c):
+        """Write a comment."""
+        self._lines("// " + c.comment)
 
-    def format_array_decl(self, arr) -> str:
-        """Format an array declaration."""
+    def write_array_decl(self, arr):
+        """Write an array declaration."""
         dtype = arr.symbol.dtype
         typename = self._dtype_to_name(dtype)
 
@@ -220,11 +263,39 @@ class CFormatter:
         dims = "".join([f"[{i}]" for i in arr.sizes])
         if arr.values is None:
             assert arr.const is False
-            return f"{typename} {symbol}{dims};\n"
+            self._line(f"{typename} {symbol}{dims};")
+            return
 
         vals = self._build_initializer_lists(arr.values)
         cstr = "static const " if arr.const else ""
-        return f"{cstr}{typename} {symbol}{dims} = {vals};\n"
+        self._lines(f"{cstr}{typename} {symbol}{dims} = {vals};")
+
+    def write_variable_decl(self, v):
+        """Write a variable declaration."""
+        val = self.c_format(v.value)
+        symbol = self.c_format(v.symbol)
+        typename = self._dtype_to_name(v.symbol.dtype)
+        self._lines(f"{typename} {symbol} = {val};")
+
+    def write_for_range(self, r):
+        """Write a for loop over a range."""
+        begin = self.c_format(r.begin)
+        end = self.c_format(r.end)
+        index = self.c_format(r.index)
+        self._line(f"for (int {index} = {begin}; {index} < {end}; ++{index})")
+        self._line("{")
+        self._block(r.body, True)
+        self._line("}")
+
+    def write_statement(self, s):
+        """Write a statement."""
+        self.c_write(s.expr)
+
+    def write_assign(self, expr):
+        """Write an assignment."""
+        rhs = self.c_format(expr.rhs)
+        lhs = self.c_format(expr.lhs)
+        self._lines(f"{lhs} {expr.op} {rhs};")
 
     def format_array_access(self, arr) -> str:
         """Format an array access."""
@@ -232,13 +303,6 @@ class CFormatter:
         indices = f"[{']['.join(self.c_format(i) for i in arr.indices)}]"
         return f"{name}{indices}"
 
-    def format_variable_decl(self, v) -> str:
-        """Format a variable declaration."""
-        val = self.c_format(v.value)
-        symbol = self.c_format(v.symbol)
-        typename = self._dtype_to_name(v.symbol.dtype)
-        return f"{typename} {symbol} = {val};\n"
-
     def format_nary_op(self, oper) -> str:
         """Format an n-ary operation."""
         # Format children
@@ -283,30 +347,6 @@ class CFormatter:
         """Format a literal int."""
         return f"{val.value}"
 
-    def format_for_range(self, r) -> str:
-        """Format a for loop over a range."""
-        begin = self.c_format(r.begin)
-        end = self.c_format(r.end)
-        index = self.c_format(r.index)
-        output = f"for (int {index} = {begin}; {index} < {end}; ++{index})\n"
-        output += "{\n"
-        body = self.c_format(r.body)
-        for line in body.split("\n"):
-            if len(line) > 0:
-                output += f"  {line}\n"
-        output += "}\n"
-        return output
-
-    def format_statement(self, s) -> str:
-        """Format a statement."""
-        return self.c_format(s.expr)
-
-    def format_assign(self, expr) -> str:
-        """Format an assignment."""
-        rhs = self.c_format(expr.rhs)
-        lhs = self.c_format(expr.lhs)
-        return f"{lhs} {expr.op} {rhs};\n"
-
     def format_conditional(self, s) -> str:
         """Format a conditional."""
         # Format children
@@ -351,17 +391,8 @@ class CFormatter:
         return f"{func}({args})"
 
     c_impl = {
-        "Section": format_section,
-        "StatementList": format_statement_list,
-        "Comment": format_comment,
-        "ArrayDecl": format_array_decl,
         "ArrayAccess": format_array_access,
         "MultiIndex": format_multi_index,
-        "VariableDecl": format_variable_decl,
-        "ForRange": format_for_range,
-        "Statement": format_statement,
-        "Assign": format_assign,
-        "AssignAdd": format_assign,
         "Product": format_nary_op,
         "Neg": format_unary_op,
         "Sum": format_nary_op,
@@ -385,10 +416,78 @@ class CFormatter:
         "LT": format_binary_op,
     }
 
+    c_write_impl = {
+        "Section": write_section,
+        "StatementList": write_statement_list,
+        "Comment": write_comment,
+        "ArrayDecl": write_array_decl,
+        "VariableDecl": write_variable_decl,
+        "ForRange": write_for_range,
+        "Statement": write_statement,
+        "Assign": write_assign,
+        "AssignAdd": write_assign,
+    }
+
     def c_format(self, s) -> str:
         """Format as C."""
         name = s.__class__.__name__
+        if name in self.c_write_impl:
+            output = io.StringIO()
+            self.write(s, output)
+            return output.getvalue()
         try:
             return self.c_impl[name](self, s)
         except KeyError:
             raise RuntimeError("Unknown statement: ", name)
+
+    def c_write(self, s):
+        """Write a statement as C to the current stream."""
+        name = s.__class__.__name__
+        try:
+            write = self.c_write_impl[name]
+        except KeyError:
+            raise RuntimeError("Unknown statement: ", name)
+        write(self, s)
+
+    def write(self, s, stream: typing.TextIO):
+        """Write a statement as C to a stream.
+
+        Args:
+            s: Statement.
+            stream: Text stream, such as an open file, written to line by
+                line.
+        """
+        state = (self._write, self._indent, self._in_loop)
+        self._write, self._indent, self._in_loop = stream.write, "", False
+        try:
+            self.c_write(s)
+        finally:
+            self._write, self._indent, self._in_loop = state
+
+
+def _nested_lists(tokens: npt.NDArray[np.str_]) -> str:
+    """Join an array of formatted values into nested initializer lists."""
+    if tokens.ndim == 1:
+        return "{" + ", ".join(tokens.tolist()) + "}"
+    return "{" + ",\n  ".join(_nested_lists(t) for t in tokens) + "}"
+
+
+def _format_float64_array(values: npt.NDArray[np.float64]) -> str:
+    """Format an array as nested initializer lists of 16 significant digits.
+
+    Gives the same result as formatting each value with f"{x:.16}", but
+    formats all values with one printf-style operation. Values that
+    printf would format differently, those that round to an integer
+    (which f"{x:.16}" formats with a trailing ".0") and large ones
+    (which f"{x:.16}" formats in scientific notation from 1e15 on), are
+    formatted one by one.
+    """
+    flat = values.ravel()
+    with np.errstate(invalid="ignore"):
+        magnitude = np.abs(flat)
+        printf = (np.abs(flat - np.rint(flat)) > magnitude * 1e-14) & (magnitude < 1e14)
+    formatted: list[typing.Any] = flat.tolist()
+    for i in np.flatnonzero(~printf).tolist():
+        formatted[i] = f"{formatted[i]:.16}"
+    tokens = np.where(printf, "%.16g", "%s").reshape(values.shape)
+    return _nested_lists(tokens) % tuple(formatted)
@@ -61,19 +61,53 @@ def generator(ir: IntegralIR, domain: basix.CellType, options):
 
     code["tabulate_tensor"] = body
 
-    code["tabulate_tensor_float32"] = ".tabulate_tensor_float32 = NULL,"
-    code["tabulate_tensor_float64"] = ".tabulate_tensor_float64 = NULL,"
-    if sys.platform.startswith("win32"):
-        code["tabulate_tensor_complex64"] = ""
-        code["tabulate_tensor_complex128"] = ""
-    else:
-        code["tabulate_tensor_complex64"] = ".tabulate_tensor_complex64 = NULL,"
-        code["tabulate_tensor_complex128"] = ".tabulate_tensor_complex128 = NULL,"
     np_scalar_type = np.dtype(options["scalar_type"]).name
+    scalar_type = dtype_to_c_type(options["scalar_type"])
+    geom_type = dtype_to_c_type(dtype_to_scalar_dtype(options["scalar_type"]))
+    for kernel in ("tabulate_tensor", "tabulate_tensor_batch", "tabulate_action"):
+        code[f"{kernel}_float32"] = f".{kernel}_float32 = NULL,"
+        code[f"{kernel}_float64"] = f".{kernel}_float64 = NULL,"
+        if sys.platform.startswith("win32"):
+            code[f"{kernel}_complex64"] = ""
+            code[f"{kernel}_complex128"] = ""
+        else:
+            code[f"{kernel}_complex64"] = f".{kernel}_complex64 = NULL,"
+            code[f"{kernel}_complex128"] = f".{kernel}_complex128 = NULL,"
     code[f"tabulate_tensor_{np_scalar_type}"] = (
         f".tabulate_tensor_{np_scalar_type} = tabulate_tensor_{factory_name},"
     )
 
+    # Kernel tabulating a batch of cells with interleaved arguments
+    batch_size = options["batch_size"]
+    if batch_size > 0:
+        logger.info(f"--- batch size: {batch_size}")
+        code["tabulate_tensor_batch_definition"] = ufcx_integrals.batch_definition.format(
+            factory_name=factory_name,
+            scalar_type=scalar_type,
+            geom_type=geom_type,
+            tabulate_tensor=CF.c_format(ig.generate_batch(parts, batch_size)),
+        )
+        code[f"tabulate_tensor_batch_{np_scalar_type}"] = (
+            f".tabulate_tensor_batch_{np_scalar_type} = tabulate_tensor_batch_{factory_name},"
+        )
+    else:
+        code["tabulate_tensor_batch_definition"] = ""
+
+    # Kernel applying the element matrix to a vector
+    if options["action_kernels"] and ir.rank == 2:
+        action_generator = IntegralGenerator(ir, FFCXBackend(ir, options), action=True)
+        code["tabulate_action_definition"] = ufcx_integrals.action_definition.format(
+            factory_name=factory_name,
+            scalar_type=scalar_type,
+            geom_type=geom_type,
+            tabulate_action=CF.c_format(action_generator.generate(domain)),
+        )
+        code[f"tabulate_action_{np_scalar_type}"] = (
+            f".tabulate_action_{np_scalar_type} = tabulate_action_{factory_name},"
+        )
+    else:
+        code["tabulate_action_definition"] = ""
+
     assert ir.expression.coordinate_element_hash is not None
     implementation = ufcx_integrals.factory.format(
         factory_name=factory_name,
@@ -81,14 +115,25 @@ def generator(ir: IntegralIR, domain: basix.CellType, options):
         enabled_coefficients_init=code["enabled_coefficients_init"],
         tabulate_tensor=code["tabulate_tensor"],
         needs_facet_permutations="true" if ir.expression.needs_facet_permutations else "false",
-        scalar_type=dtype_to_c_type(options["scalar_type"]),
-        geom_type=dtype_to_c_type(dtype_to_scalar_dtype(options["scalar_type"])),
+        scalar_type=scalar_type,
+        geom_type=geom_type,
         coordinate_element_hash=f"UINT64_C({ir.expression.coordinate_element_hash})",
         tabulate_tensor_float32=code["tabulate_tensor_float32"],
         tabulate_tensor_float64=code["tabulate_tensor_float64"],
         tabulate_tensor_complex64=code["tabulate_tensor_complex64"],
         tabulate_tensor_complex128=code["tabulate_tensor_complex128"],
         domain=int(domain),
+        batch_size=batch_size,
+        tabulate_tensor_batch_definition=code["tabulate_tensor_batch_definition"],
+        tabulate_tensor_batch_float32=code["tabulate_tensor_batch_float32"],
+        tabulate_tensor_batch_float64=code["tabulate_tensor_batch_float64"],
+        tabulate_tensor_batch_complex64=code["tabulate_tensor_batch_complex64"],
+        tabulate_tensor_batch_complex128=code["tabulate_tensor_batch_complex128"],
+        tabulate_action_definition=code["tabulate_action_definition"],
+        tabulate_action_float32=code["tabulate_action_float32"],
+        tabulate_action_float64=code["tabulate_action_float64"],
+        tabulate_action_complex64=code["tabulate_action_complex64"],
+        tabulate_action_complex128=code["tabulate_action_complex128"],
     )
 
     return declaration, implementation
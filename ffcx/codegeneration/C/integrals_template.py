@@ -20,7 +20,7 @@ void tabulate_tensor_{factory_name}({scalar_type}* restrict A,
 {{
 {tabulate_tensor}
 }}
-
+{tabulate_tensor_batch_definition}{tabulate_action_definition}
 {enabled_coefficients_init}
 
 ufcx_integral {factory_name} =
@@ -33,7 +33,41 @@ ufcx_integral {factory_name} =
   .needs_facet_permutations = {needs_facet_permutations},
   .coordinate_element_hash = {coordinate_element_hash},
   .domain = {domain},
+  .batch_size = {batch_size},
+  {tabulate_tensor_batch_float32}
+  {tabulate_tensor_batch_float64}
+  {tabulate_tensor_batch_complex64}
+  {tabulate_tensor_batch_complex128}
+  {tabulate_action_float32}
+  {tabulate_action_float64}
+  {tabulate_action_complex64}
+  {tabulate_action_complex128}
 }};
 
 // End of code for integral {factory_name}
 """
+
+batch_definition = """
+void tabulate_tensor_batch_{factory_name}({scalar_type}* restrict A,
+                                          const {scalar_type}* restrict w,
+                                          const {scalar_type}* restrict c,
+                                          const {geom_type}* restrict coordinate_dofs,
+                                          const int* restrict entity_local_index,
+                                          const uint8_t* restrict quadrature_permutation)
+{{
+{tabulate_tensor}
+}}
+"""
+
+action_definition = """
+void tabulate_action_{factory_name}({scalar_type}* restrict y,
+                                    const {scalar_type}* restrict x,
+                                    const {scalar_type}* restrict w,
+                                    const {scalar_type}* restrict c,
+                                    const {geom_type}* restrict coordinate_dofs,
+                                    const int* restrict entity_local_index,
+                                    const uint8_t* restrict quadrature_permutation)
+{{
+{tabulate_action}
+}}
+"""
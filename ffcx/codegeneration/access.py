@@ -13,6 +13,7 @@ import basix.ufl
 import ufl
 
 import ffcx.codegeneration.lnodes as L
+from ffcx.codegeneration.definitions import create_quadrature_index, is_sum_factorised
 from ffcx.ir.analysis.modified_terminals import ModifiedTerminal
 from ffcx.ir.elementtables import UniqueTableReferenceT
 from ffcx.ir.representationutils import QuadratureRule
@@ -97,7 +98,9 @@ class FFCXBackendAccess:
             return self.symbols.coefficient_dof_access(mt.terminal, begin)
         else:
             # Return symbol, see definitions for computation
-            return self.symbols.coefficient_value(mt)
+            return self.quadrature_values(
+                self.symbols.coefficient_value(mt), tabledata, quadrature_rule
+            )
 
     def constant(
         self,
@@ -138,7 +141,7 @@ class FFCXBackendAccess:
         else:
             # Physical coordinates are computed by code generated in
             # definitions
-            return self.symbols.x_component(mt)
+            return self.quadrature_values(self.symbols.x_component(mt), tabledata, num_points)
 
     def cell_coordinate(self, mt, tabledata, num_points):
         """Access a cell coordinate."""
@@ -206,7 +209,7 @@ class FFCXBackendAccess:
         """Access a jacobian."""
         if mt.averaged is not None:
             raise RuntimeError("Not expecting average of Jacobian.")
-        return self.symbols.J_component(mt)
+        return self.quadrature_values(self.symbols.J_component(mt), tabledata, num_points)
 
     def reference_cell_volume(self, mt, tabledata, access):
         """Access a reference cell volume."""
@@ -399,6 +402,22 @@ class FFCXBackendAccess:
 
         return expr
 
+    def quadrature_values(
+        self,
+        symbol: L.Symbol,
+        tabledata: UniqueTableReferenceT,
+        quadrature_rule: Optional[QuadratureRule],
+    ):
+        """Access the value of a terminal at the current quadrature point.
+
+        Terminals evaluated by sum factorisation are arrays of their
+        values at all quadrature points.
+        """
+        if is_sum_factorised(tabledata, quadrature_rule):
+            iq = create_quadrature_index(quadrature_rule, self.symbols.quadrature_loop_index)
+            return symbol[iq.global_index]
+        return symbol
+
     def _pass(self, *args, **kwargs):
         """Return one."""
         return 1
@@ -439,7 +458,7 @@ class FFCXBackendAccess:
             if restriction == "-":
                 qp = self.symbols.quadrature_permutation[1]
 
-        if dof_index.dim == 1 and quadrature_index.dim == 1:
+        if dof_index.dim == 1:
             symbols += [L.Symbol(tabledata.name, dtype=L.DataType.REAL)]
             return self.symbols.element_tables[tabledata.name][qp][entity][iq_global_index][
                 ic_global_index
@@ -0,0 +1,222 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Batching of kernels over cells.
+
+A batched kernel computes the element tensors of a batch of cells in one
+call. The per-cell kernel arguments hold the values of all cells of the
+batch interleaved, i.e. value ``i`` of cell ``b`` is at ``x[i * batch_size
++ b]``, and the local variables that differ between cells become arrays
+over the cells of the batch. Loops over quadrature points and dofs are
+shared by all cells, and each straight-line run of statements inside
+them is wrapped in a loop over the cells of the batch, which compilers
+can vectorise as the kernels have no data-dependent control flow.
+"""
+
+import numpy as np
+
+import ffcx.codegeneration.lnodes as L
+
+
+def batch_cells(
+    code: L.LNode, cell_arrays: list[L.Symbol], index: L.Symbol, batch_size: int
+) -> L.StatementList:
+    """Transform the body of a kernel to compute a batch of cells.
+
+    Args:
+        code: Body of the kernel for a single cell.
+        cell_arrays: Kernel arguments with values for each cell, which
+            are interleaved cell by cell in the batched kernel.
+        index: Symbol of the loops over the cells of the batch.
+        batch_size: Number of cells in a batch.
+
+    Returns:
+        Body of the kernel for a batch of cells.
+    """
+    batcher = _Batcher(code, cell_arrays, index, batch_size)
+    return L.StatementList(batcher.statements([code]))
+
+
+def _symbols(expr: L.LExpr) -> set[L.Symbol]:
+    """Return the symbols an expression depends on."""
+    if isinstance(expr, L.Symbol):
+        return {expr}
+    if isinstance(expr, L.ArrayAccess):
+        return set.union({expr.array}, *(_symbols(i) for i in expr.indices))
+    if isinstance(expr, L.MultiIndex):
+        return set.union(set(), *(_symbols(i) for i in expr.symbols))
+    return set.union(set(), *(_symbols(op) for op in _operands(expr)))
+
+
+def _operands(expr: L.LExpr) -> list[L.LExpr]:
+    """Return the operands of an expression."""
+    if isinstance(expr, L.BinOp):
+        return [expr.lhs, expr.rhs]
+    if isinstance(expr, (L.NaryOp, L.MathFunction)):
+        return expr.args
+    if isinstance(expr, L.PrefixUnaryOp):
+        return [expr.arg]
+    if isinstance(expr, L.Conditional):
+        return [expr.condition, expr.true, expr.false]
+    if isinstance(expr, (L.LiteralFloat, L.LiteralInt)):
+        return []
+    raise RuntimeError(f"Cannot batch expression of type {type(expr).__name__}.")
+
+
+def _is_assignment(s: L.LNode) -> bool:
+    """Check if a statement is an assignment."""
+    return isinstance(getattr(s, "expr", None), L.AssignOp)
+
+
+def _target(expr: L.AssignOp) -> L.Symbol:
+    """Return the symbol assigned to by an assignment."""
+    lhs = expr.lhs
+    return lhs.array if isinstance(lhs, L.ArrayAccess) else lhs
+
+
+def _flatten(statements):
+    """Iterate over statements, flattening nested statement lists."""
+    for s in statements:
+        if isinstance(s, L.StatementList):
+            yield from _flatten(s.statements)
+        else:
+            yield s
+
+
+def _is_zero(value) -> bool:
+    """Check if a declared initial value is zero."""
+    if isinstance(value, (L.LiteralFloat, L.LiteralInt)):
+        return value.value == 0
+    return isinstance(value, np.ndarray) and not value.any()
+
+
+class _Batcher:
+    """Transformation of a kernel body to a batch of cells."""
+
+    def __init__(self, code, cell_arrays, index, batch_size):
+        self.cell_arrays = set(cell_arrays)
+        self.index = index
+        self.batch_size = batch_size
+
+        # Values assigned to each local symbol
+        self.values: dict[L.Symbol, list[L.LExpr]] = {}
+        self.collect([code])
+
+        # The symbols with values that differ between cells, starting
+        # from the kernel arguments
+        self.varying = set(self.cell_arrays)
+        changed = True
+        while changed:
+            changed = False
+            for symbol, values in self.values.items():
+                if symbol not in self.varying and any(_symbols(v) & self.varying for v in values):
+                    self.varying.add(symbol)
+                    changed = True
+
+    def collect(self, statements):
+        """Collect the values assigned to local symbols."""
+        for s in statements:
+            if isinstance(s, L.StatementList):
+                self.collect(s.statements)
+            elif isinstance(s, L.Section):
+                self.collect(s.declarations)
+                self.collect(s.statements)
+            elif isinstance(s, L.ForRange):
+                self.collect(s.body.statements)
+            elif isinstance(s, L.VariableDecl):
+                values = [] if s.value is None else [s.value]
+                self.values.setdefault(s.symbol, []).extend(values)
+            elif isinstance(s, L.ArrayDecl):
+                self.values.setdefault(s.symbol, [])
+            elif _is_assignment(s):
+                # Writes to locations depending on the cell make the target vary
+                values = self.values.setdefault(_target(s.expr), [])
+                values += [s.expr.lhs, s.expr.rhs]
+
+    def statements(self, statements) -> list[L.LNode]:
+        """Transform a list of statements."""
+        code: list[L.LNode] = []
+        # Declarations and statements of the current run of statements
+        # computing cell values
+        declarations: list[L.LNode] = []
+        run: list[L.LNode] = []
+
+        def flush():
+            code.extend(declarations)
+            if run:
+                code.append(L.ForRange(self.index, 0, self.batch_size, list(run)))
+            declarations.clear()
+            run.clear()
+
+        for s in _flatten(statements):
+            if isinstance(s, L.VariableDecl) and s.symbol in self.varying:
+                if s.value is None or _is_zero(s.value):
+                    values = None if s.value is None else [0]
+                    declarations.append(L.ArrayDecl(s.symbol, [self.batch_size], values))
+                else:
+                    declarations.append(L.ArrayDecl(s.symbol, [self.batch_size]))
+                    run.append(L.Assign(self.expr(s.symbol), self.expr(s.value)))
+            elif isinstance(s, L.ArrayDecl) and s.symbol in self.varying:
+                if s.values is not None and not _is_zero(s.values):
+                    raise RuntimeError(f"Cannot batch initial values of {s.symbol}.")
+                values = None if s.values is None else [0]
+                sizes = [*s.sizes, self.batch_size]
+                declarations.append(L.ArrayDecl(s.symbol, sizes, values))
+            elif _is_assignment(s):
+                if _target(s.expr) in self.varying:
+                    run.append(self.expr(s.expr))
+                else:
+                    flush()
+                    code.append(s)
+            else:
+                flush()
+                code.append(self.statement(s))
+        flush()
+        return code
+
+    def statement(self, s) -> L.LNode:
+        """Transform a statement that is not part of a run."""
+        if isinstance(s, L.Section):
+            return L.Section(
+                s.name,
+                self.statements(s.statements),
+                self.statements(s.declarations),  # type: ignore
+                s.input,
+                s.output,
+                s.annotations,
+            )
+        if isinstance(s, L.ForRange):
+            return L.ForRange(s.index, s.begin, s.end, self.statements(s.body.statements))
+        # Comments and declarations of values shared by all cells
+        return s
+
+    def expr(self, expr: L.LExpr) -> L.LExpr:
+        """Transform an expression to the values of the current cell."""
+        if isinstance(expr, L.Symbol):
+            return expr[self.index] if expr in self.varying else expr
+        if isinstance(expr, L.ArrayAccess):
+            indices = [self.expr(i) for i in expr.indices]
+            if expr.array in self.cell_arrays:
+                (i,) = indices
+                return expr.array[i * self.batch_size + self.index]
+            if expr.array in self.varying:
+                indices.append(self.index)
+            return L.ArrayAccess(expr.array, indices)
+        if isinstance(expr, L.MultiIndex):
+            return self.expr(expr.global_index)
+        if isinstance(expr, L.BinOp):
+            return type(expr)(self.expr(expr.lhs), self.expr(expr.rhs))
+        if isinstance(expr, L.NaryOp):
+            return type(expr)([self.expr(arg) for arg in expr.args])
+        if isinstance(expr, L.PrefixUnaryOp):
+            return type(expr)(self.expr(expr.arg))
+        if isinstance(expr, L.MathFunction):
+            return L.MathFunction(expr.function, [self.expr(arg) for arg in expr.args])
+        if isinstance(expr, L.Conditional):
+            return L.Conditional(
+                self.expr(expr.condition), self.expr(expr.true), self.expr(expr.false)
+            )
+        _operands(expr)
+        return expr
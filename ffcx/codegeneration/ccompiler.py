@@ -0,0 +1,259 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Direct invocation of the system C compiler for JIT builds.
+
+The compiler and its flags are taken from the Python build
+configuration (``sysconfig``), overridden or extended by the CC, CFLAGS,
+LDSHARED and LDFLAGS environment variables like setuptools does, so
+that objects built here can be linked into CFFI extension modules.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import logging
+import os
+import shlex
+import subprocess
+import sysconfig
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import ffcx.codegeneration
+from ffcx.cacheutils import atomic_path, write_atomic
+
+logger = logging.getLogger("ffcx")
+
+# Environment variables changing the compiler, linker and their flags
+ENVIRONMENT_VARIABLES = ("CC", "CFLAGS", "LDSHARED", "LDFLAGS")
+
+
+def available_cores() -> int:
+    """Return the number of cores available to this process."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def compiler() -> list[str]:
+    """Return the C compiler command, honouring the CC environment variable."""
+    cc = os.environ.get("CC", sysconfig.get_config_var("CC") or "cc")
+    return shlex.split(cc)
+
+
+def compile_flags(extra_compile_args: list[str], debug: bool = False) -> list[str]:
+    """Return the flags used to compile a JIT translation unit.
+
+    Args:
+        extra_compile_args: Flags appended after the default flags.
+        debug: Add debugging information.
+    """
+    # The environment CFLAGS are added to the Python ones, as by setuptools
+    flags = shlex.split(sysconfig.get_config_var("CFLAGS") or "")
+    flags += shlex.split(os.environ.get("CFLAGS", ""))
+    flags += shlex.split(sysconfig.get_config_var("CCSHARED") or "")
+    if debug:
+        flags += ["-g"]
+    flags += ["-std=c17", f"-I{ffcx.codegeneration.get_include_path()}"]
+    return flags + list(extra_compile_args)
+
+
+def python_linker() -> list[str]:
+    """Return the command linking Python extensions.
+
+    Like setuptools, the LDSHARED environment variable replaces the
+    Python link command, and otherwise the CC environment variable
+    replaces its compiler. The LDFLAGS environment variable is appended.
+    """
+    if "LDSHARED" in os.environ:
+        linker = shlex.split(os.environ["LDSHARED"])
+    else:
+        linker = shlex.split(sysconfig.get_config_var("LDSHARED") or "cc -shared")
+        cc = shlex.split(sysconfig.get_config_var("CC") or "cc")
+        if linker[: len(cc)] == cc:
+            linker = compiler() + linker[len(cc) :]
+    return linker + shlex.split(os.environ.get("LDFLAGS", ""))
+
+
+@functools.cache
+def _compiler_version(command: tuple[str, ...]) -> str:
+    """Return the version string of a compiler command, or "" if unknown."""
+    try:
+        result = subprocess.run(
+            [*command, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+    except OSError:
+        return ""
+    return result.stdout.strip().split("\n")[0] if result.returncode == 0 else ""
+
+
+def compiler_signature(extra_compile_args: list[str], debug: bool = False) -> str:
+    """Return a string identifying the compiler, its flags and the platform.
+
+    Objects and libraries built with the same signature are
+    interchangeable. The signature includes the version of the compiler,
+    so that a compiler command resolving to another compiler gives
+    another signature. Unlike the flags, the signature does not depend
+    on the Python installation FFCx is run from.
+    """
+    include = f"-I{ffcx.codegeneration.get_include_path()}"
+    flags = [flag for flag in compile_flags(extra_compile_args, debug) if flag != include]
+    return " ".join(
+        [*compiler(), *flags, _compiler_version(tuple(compiler())), sysconfig.get_platform()]
+    )
+
+
+def compile_object(source: Path, obj: Path, flags: list[str]) -> str:
+    """Compile a C source file into an object file.
+
+    The compiler output is captured and returned. The object file is
+    written under a temporary name and moved into place once complete.
+
+    Raises:
+        RuntimeError: if the compiler fails; the message contains the
+            compiler output.
+    """
+    with atomic_path(obj) as tmp:
+        cmd = [*compiler(), *flags, "-c", str(source), "-o", str(tmp)]
+        logger.debug(" ".join(cmd))
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation of {source} failed:\n{' '.join(cmd)}\n{result.stdout}")
+    return result.stdout
+
+
+def shared_library_suffix() -> str:
+    """Return the file suffix of shared libraries on this platform."""
+    return sysconfig.get_config_var("SHLIB_SUFFIX") or ".so"
+
+
+def build_shared_library(
+    inputs: list[Path], output: Path, flags: list[str], libraries: list[str] = []
+) -> str:
+    """Compile and link C sources and object files into a shared library.
+
+    The compiler output is captured and returned. The library is
+    written under a temporary name and moved into place once complete.
+
+    Raises:
+        RuntimeError: if the compiler fails; the message contains the
+            compiler output.
+    """
+    return _link(inputs, output, [*flags, "-shared"], libraries)
+
+
+def build_python_extension(
+    inputs: list[Path], output: Path, flags: list[str], libraries: list[str] = []
+) -> str:
+    """Compile and link C sources and object files into a Python extension.
+
+    Like setuptools, C sources are compiled with the C compiler and the
+    include directories of the running Python, and the objects are
+    linked with its link command (see :func:`python_linker`).
+
+    Raises:
+        RuntimeError: if the compiler or linker fails; the message
+            contains their output.
+    """
+    paths = sysconfig.get_paths()
+    includes = [f"-I{paths['include']}", f"-I{paths['platinclude']}"]
+    output_text = ""
+    objects = []
+    for path in inputs:
+        if path.suffix == ".c":
+            obj = path.with_suffix(".o")
+            output_text += compile_object(path, obj, [*flags, *includes])
+            objects.append(obj)
+        else:
+            objects.append(path)
+    return output_text + _link(objects, output, [], libraries, python_linker())
+
+
+def _link(
+    inputs: list[Path],
+    output: Path,
+    flags: list[str],
+    libraries: list[str],
+    linker: list[str] | None = None,
+) -> str:
+    """Run the compiler (or linker) to link inputs into output, returning its output."""
+    with atomic_path(output) as tmp:
+        command = compiler() if linker is None else linker
+        cmd = [*command, *flags, *map(str, inputs), "-o", str(tmp)]
+        cmd += [f"-l{library}" for library in libraries]
+        logger.debug(" ".join(cmd))
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"Building {output} failed:\n{' '.join(cmd)}\n{result.stdout}")
+    return result.stdout
+
+
+def compile_objects(
+    jobs: list[tuple[Path, Path]], flags: list[str], max_workers: int | None = None
+) -> str:
+    """Compile (source, object) pairs concurrently.
+
+    Each job runs in its own compiler process; at most max_workers
+    (default: number of available cores) run at the same time.
+
+    Returns:
+        Concatenated compiler output, in the order of jobs.
+    """
+    if max_workers is None:
+        max_workers = available_cores()
+    max_workers = max(1, min(max_workers, len(jobs)))
+    if max_workers == 1:
+        return "".join(compile_object(src, obj, flags) for src, obj in jobs)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(compile_object, src, obj, flags) for src, obj in jobs]
+        return "".join(f.result() for f in futures)
+
+
+def compile_cached(
+    sources: list[str], object_dir: Path, flags: list[str], max_workers: int | None = None
+) -> tuple[list[Path], str]:
+    """Compile C sources through a content-addressed object cache.
+
+    An object file is named after a hash of its source, the compiler and
+    the flags, so a source that was compiled before, for this or any
+    other module, is not compiled again. Identical sources share one
+    object file.
+
+    Args:
+        sources: C source code of each translation unit.
+        object_dir: Directory holding the cached sources and objects.
+        flags: Compiler flags.
+        max_workers: Maximum number of concurrent compiler processes.
+
+    Returns:
+        Object file of each source, and the output of the compiler for
+        the sources that were compiled.
+    """
+    object_dir.mkdir(exist_ok=True, parents=True)
+    command = " ".join(compiler() + flags)
+    objects = []
+    jobs = {}
+    for source in sources:
+        key = hashlib.sha1((command + "\n" + source).encode("utf-8")).hexdigest()
+        obj = object_dir.joinpath(f"{key}.o")
+        objects.append(obj)
+        if obj in jobs:
+            continue
+        try:
+            # Record the access, for least recently used eviction
+            os.utime(obj)
+            continue
+        except FileNotFoundError:
+            pass
+        c_file = obj.with_suffix(".c")
+        write_atomic(c_file, source)
+        jobs[obj] = c_file
+
+    logger.info(f"Compiling {len(jobs)} of {len(set(objects))} objects, others cached")
+    output = compile_objects([(c_file, obj) for obj, c_file in jobs.items()], flags, max_workers)
+    return objects, output
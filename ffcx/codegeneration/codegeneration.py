@@ -17,6 +17,7 @@ import typing
 
 import numpy.typing as npt
 
+import ffcx.parallel
 from ffcx.codegeneration.C.expressions import generator as expression_generator
 from ffcx.codegeneration.C.file import generator as file_generator
 from ffcx.codegeneration.C.form import generator as form_generator
@@ -45,15 +46,24 @@ def generate_code(ir: DataIR, options: dict[str, int | float | npt.DTypeLike]) -
     logger.info("Compiler stage 3: Generating code")
     logger.info(79 * "*")
 
-    code_integrals = [
-        integral_generator(integral_ir, domain, options)
+    # Kernels are generated independently of each other, in parallel. The
+    # generators hold the GIL, so they run in processes.
+    integral_tasks = [
+        (integral_generator, integral_ir, domain, options)
         for integral_ir in ir.integrals
         for domain in set(i[0] for i in integral_ir.expression.integrand.keys())
     ]
-    code_forms = [form_generator(form_ir, options) for form_ir in ir.forms]
-    code_expressions = [
-        expression_generator(expression_ir, options) for expression_ir in ir.expressions
+    expression_tasks = [
+        (expression_generator, expression_ir, options) for expression_ir in ir.expressions
     ]
+    code = ffcx.parallel.run(
+        _generate,
+        integral_tasks + expression_tasks,  # type: ignore
+        int(options["codegen_workers"]),  # type: ignore
+    )
+    code_integrals = code[: len(integral_tasks)]
+    code_forms = [form_generator(form_ir, options) for form_ir in ir.forms]
+    code_expressions = code[len(integral_tasks) :]
     code_file_pre, code_file_post = file_generator(options)
     return CodeBlocks(
         file_pre=[code_file_pre],
@@ -62,3 +72,8 @@ def generate_code(ir: DataIR, options: dict[str, int | float | npt.DTypeLike]) -
         expressions=code_expressions,
         file_post=[code_file_post],
     )
+
+
+def _generate(generator, *args) -> tuple[str, str]:
+    """Run a code generator."""
+    return generator(*args)
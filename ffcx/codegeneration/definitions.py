@@ -6,11 +6,13 @@
 """FFCx/UFC specific variable definitions."""
 
 import logging
-from typing import Union
+from typing import Callable, Optional, Union
 
+import numpy as np
 import ufl
 
 import ffcx.codegeneration.lnodes as L
+from ffcx.element_interface import facet_tensor_directions
 from ffcx.ir.analysis.modified_terminals import ModifiedTerminal
 from ffcx.ir.elementtables import UniqueTableReferenceT
 from ffcx.ir.representationutils import QuadratureRule
@@ -47,6 +49,22 @@ def create_dof_index(tabledata, dof_index_symbol):
     return L.MultiIndex(indices, ranges)
 
 
+def is_sum_factorised(
+    tabledata: UniqueTableReferenceT, quadrature_rule: Optional[QuadratureRule]
+) -> bool:
+    """Check if a coefficient or geometric quantity is evaluated by sum factorisation.
+
+    These are evaluated at all quadrature points before the quadrature
+    loop, which reads the values from an array.
+    """
+    return (
+        tabledata.has_tensor_factorisation
+        and not tabledata.is_piecewise
+        and isinstance(quadrature_rule, QuadratureRule)
+        and quadrature_rule.has_tensor_factors
+    )
+
+
 class FFCXBackendDefinitions:
     """FFCx specific code definitions."""
 
@@ -142,6 +160,15 @@ class FFCXBackendDefinitions:
 
         assert begin < end
 
+        if is_sum_factorised(tabledata, quadrature_rule):
+            return self._define_sum_factorised(
+                mt,
+                tabledata,
+                quadrature_rule,
+                access,
+                lambda dof: self.symbols.coefficient_dof_access(mt.terminal, dof * bs + begin),
+            )
+
         # Get access to element table
         FE, tables = self.access.table_access(tabledata, self.entity_type, mt.restriction, iq, ic)
         dof_access: L.ArrayAccess = self.symbols.coefficient_dof_access(
@@ -187,13 +214,6 @@ class FFCXBackendDefinitions:
         assert ttype != "zeros"
         assert ttype != "ones"
 
-        # Get access to element table
-        ic_symbol = self.symbols.coefficient_dof_sum_index
-        iq_symbol = self.symbols.quadrature_loop_index
-        ic = create_dof_index(tabledata, ic_symbol)
-        iq = create_quadrature_index(quadrature_rule, iq_symbol)
-        FE, tables = self.access.table_access(tabledata, self.entity_type, mt.restriction, iq, ic)
-
         dof_access = L.Symbol("coordinate_dofs", dtype=L.DataType.REAL)
 
         # coordinate dofs is always 3d
@@ -202,6 +222,22 @@ class FFCXBackendDefinitions:
         if mt.restriction == "-":
             offset = num_scalar_dofs * dim
 
+        if is_sum_factorised(tabledata, quadrature_rule):
+            return self._define_sum_factorised(
+                mt,
+                tabledata,
+                quadrature_rule,
+                access,
+                lambda dof: dof_access[dof * dim + begin + offset],
+            )
+
+        # Get access to element table
+        ic_symbol = self.symbols.coefficient_dof_sum_index
+        iq_symbol = self.symbols.quadrature_loop_index
+        ic = create_dof_index(tabledata, ic_symbol)
+        iq = create_quadrature_index(quadrature_rule, iq_symbol)
+        FE, tables = self.access.table_access(tabledata, self.entity_type, mt.restriction, iq, ic)
+
         code = []
         declaration = [L.VariableDecl(access, 0.0)]
         body = [L.AssignAdd(access, dof_access[ic.global_index * dim + begin + offset] * FE)]
@@ -218,6 +254,98 @@ class FFCXBackendDefinitions:
 
         return L.Section(name, code, declaration, input, output, annotations)
 
+    def _define_sum_factorised(
+        self,
+        mt: ModifiedTerminal,
+        tabledata: UniqueTableReferenceT,
+        quadrature_rule: QuadratureRule,
+        access: L.LExpr,
+        dof_access: Callable[[L.LExpr], L.ArrayAccess],
+    ) -> L.Section:
+        """Define a linear combination of dofs at all quadrature points by sum factorisation.
+
+        The dofs are contracted with the tables of the element in one
+        reference direction at a time, which takes O(n^(d+1)) operations
+        for n dofs and points in each of the d directions instead of
+        O(n^(2d)). On exterior facets, the dofs are first contracted in
+        the direction normal to the facet.
+
+        Args:
+            mt: Modified terminal.
+            tabledata: Table data with the tensor factors of the element.
+            quadrature_rule: Tensor product quadrature rule.
+            access: Access to the value at a quadrature point.
+            dof_access: Access to a dof, given its index in the scalar element.
+        """
+        assert isinstance(access, L.ArrayAccess)
+        values = access.array
+        tables = [self.symbols.element_tables[f.name] for f in tabledata.tensor_factors]
+        iq = create_quadrature_index(quadrature_rule, self.symbols.quadrature_loop_index)
+        ic = create_dof_index(tabledata, self.symbols.coefficient_dof_sum_index)
+        num_points = iq.sizes
+        num_dofs = ic.sizes
+        dim = iq.dim
+
+        code: list[L.LNode] = []
+        previous = None
+        if self.integral_type == "cell":
+            entity: L.LExpr = L.LiteralInt(0)
+        else:
+            # The tables of each facet are in the directions of the facet
+            # coordinates and the normal direction, see
+            # ffcx.ir.elementtables.get_facet_tensor_factors
+            entity = self.symbols.entity(self.entity_type, mt.restriction)
+            tdim = len(num_dofs)
+            cellname = ufl.domain.extract_unique_domain(mt.terminal).ufl_cell().cellname()
+            strides = L.Symbol("dof_strides", dtype=L.DataType.INT)
+            stride_values = [
+                [num_dofs[0] ** (tdim - 1 - i) for i in [*tangents, normal]]
+                for tangents, normal, _ in facet_tensor_directions(cellname)
+            ]
+            code += [L.ArrayDecl(strides, values=np.array(stride_values), const=True)]
+
+            # Contract the dofs in the direction normal to the facet
+            previous = L.Symbol(f"{values.name}_n", dtype=values.dtype)
+            facet_dofs = L.MultiIndex(ic.symbols[:dim], num_dofs[:dim])
+            normal_dof = ic.symbols[dim]
+            dof = L.Sum([i * strides[entity][j] for j, i in enumerate(ic.symbols)])
+            fe = tables[dim][0][entity][0][normal_dof]
+            body = L.AssignAdd(previous[facet_dofs.global_index], fe * dof_access(dof))
+            code += [L.ArrayDecl(previous, [int(facet_dofs.size())], [0])]
+            code += [
+                L.create_nested_for_loops(
+                    [facet_dofs, L.MultiIndex([normal_dof], [num_dofs[dim]])], body
+                )
+            ]
+
+        # Contract the dofs in one facet or cell direction at a time,
+        # starting with the last direction
+        for j in reversed(range(dim)):
+            index = L.MultiIndex(
+                ic.symbols[: j + 1] + iq.symbols[j + 1 :], num_dofs[: j + 1] + num_points[j + 1 :]
+            )
+            result = L.MultiIndex(ic.symbols[:j] + iq.symbols[j:], num_dofs[:j] + num_points[j:])
+            if previous is None:
+                x = dof_access(index.global_index)
+            else:
+                x = previous[index.global_index]
+            target = values
+            if j > 0:
+                target = L.Symbol(f"{values.name}_t{j}", dtype=values.dtype)
+                code += [L.ArrayDecl(target, [int(result.size())], [0])]
+            fe = tables[j][0][entity][iq.symbols[j]][ic.symbols[j]]
+            body = L.AssignAdd(target[result.global_index], fe * x)
+            dof_index = L.MultiIndex([ic.symbols[j]], [num_dofs[j]])
+            code += [L.create_nested_for_loops([result, dof_index], body)]
+            previous = target
+
+        name = f"{type(mt.terminal).__name__} (sum factorisation)"
+        declaration = [L.ArrayDecl(values, [int(iq.size())], [0])]
+        input = [dof_access(L.LiteralInt(0)).array, *dict.fromkeys(tables)]
+        output = [values]
+        annotations = [L.Annotation.factorize]
+        return L.Section(name, code, declaration, input, output, annotations)
+
     def spatial_coordinate(
         self,
         mt: ModifiedTerminal,
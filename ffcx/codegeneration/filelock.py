@@ -0,0 +1,261 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Advisory inter-process file locks used by the JIT cache.
+
+A :class:`FileLock` is held by at most one process (or thread) at a
+time. Where the file system supports it, the lock is an operating
+system lock (``flock`` on POSIX, ``msvcrt.locking`` on Windows), which
+the kernel releases when the holder dies, so a crashed compilation never
+leaves a stale lock behind.
+
+On file systems without lock support (some network file systems return
+``ENOLCK``) the lock degrades to a lease: the lock file is created
+exclusively, the holder writes its host and PID into it and refreshes
+its modification time from a heartbeat thread. A waiter takes over a
+lease whose holder process is gone, or whose heartbeat is older than
+``stale_after`` seconds.
+"""
+
+from __future__ import annotations
+
+import errno
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None  # type: ignore
+
+# Name of the lease heartbeat threads, which only wait and touch the
+# lock file, so they do not prevent forking worker processes
+HEARTBEAT_THREAD_NAME = "ffcx-lock-heartbeat"
+
+logger = logging.getLogger("ffcx")
+
+# Errors raised by file systems that do not implement locking
+_unsupported_errnos = {errno.ENOLCK, errno.EOPNOTSUPP, errno.ENOSYS, errno.EINVAL}
+
+# Longest sleep between two attempts to take a busy lock
+_max_poll_interval = 0.05
+
+
+def _os_lock(fd: int):
+    """Take a non-blocking exclusive OS lock, raising BlockingIOError if busy."""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    elif msvcrt is not None:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except PermissionError as e:
+            raise BlockingIOError(*e.args) from e
+    else:  # pragma: no cover
+        raise OSError(errno.ENOSYS, "No file locking available")
+
+
+def _os_unlock(fd: int):
+    """Release an OS lock taken with _os_lock."""
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+def _pid_alive(pid: int) -> bool:
+    """Check if a process with the given PID exists on this host."""
+    if os.name == "nt":
+        # No cheap check, rely on the heartbeat
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class FileLock:
+    """Advisory exclusive lock on a file."""
+
+    def __init__(self, path: str | os.PathLike, heartbeat: float = 1.0, stale_after: float = 10.0):
+        """Initialise.
+
+        Args:
+            path: Lock file, created if it does not exist.
+            heartbeat: Interval (s) at which a lease holder refreshes the
+                lock file.
+            stale_after: Age (s) of the last heartbeat after which a lease
+                is considered abandoned.
+        """
+        self.path = Path(path)
+        self.heartbeat = heartbeat
+        self.stale_after = stale_after
+        self._fd: int | None = None
+        self._lease = False
+        self._stop: threading.Event | None = None
+
+    @property
+    def locked(self) -> bool:
+        """True if this object currently holds the lock."""
+        return self._fd is not None
+
+    def acquire(self, timeout: float | None = None) -> bool:
+        """Acquire the lock.
+
+        Args:
+            timeout: Maximum time (s) to wait. None waits forever, 0 makes
+                a single attempt.
+
+        Returns:
+            True if the lock was acquired.
+        """
+        if self.locked:
+            raise RuntimeError(f"Lock {self.path} is already held by this object.")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        delay = 0.001
+        while True:
+            if self._try_acquire():
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(2 * delay, _max_poll_interval)
+
+    def release(self):
+        """Release the lock."""
+        if self._fd is None:
+            return
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+        fd, self._fd = self._fd, None
+        if self._lease:
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
+        else:
+            _os_unlock(fd)
+        os.close(fd)
+
+    def holder(self) -> tuple[str, int] | None:
+        """Return (host, PID) recorded by the current holder, if any."""
+        try:
+            host, pid = self.path.read_text().split()
+            return host, int(pid)
+        except (OSError, ValueError):
+            return None
+
+    def __enter__(self):
+        """Acquire the lock, waiting as long as necessary."""
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        """Release the lock."""
+        self.release()
+
+    def _try_acquire(self) -> bool:
+        """Make one attempt to take the lock."""
+        if not self._lease:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                _os_lock(fd)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            except OSError as e:
+                os.close(fd)
+                if e.errno not in _unsupported_errnos:
+                    raise
+                logger.info(f"File locking not supported for {self.path}, using lease.")
+                self._lease = True
+                return self._try_acquire()
+
+            # The lock file may have been removed (e.g. by cache eviction)
+            # while we were waiting on it. Holding a lock on an unlinked
+            # file protects nothing, so try again.
+            try:
+                same_file = os.path.samestat(os.fstat(fd), os.stat(self.path))
+            except FileNotFoundError:
+                same_file = False
+            if not same_file:
+                _os_unlock(fd)
+                os.close(fd)
+                return False
+            self._fd = fd
+            self._write_holder()
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            self._break_stale_lease()
+            return False
+        self._fd = fd
+        self._write_holder()
+        self._stop = threading.Event()
+        threading.Thread(
+            target=self._beat, args=(self._stop,), name=HEARTBEAT_THREAD_NAME, daemon=True
+        ).start()
+        return True
+
+    def _write_holder(self):
+        """Record host and PID of the holder in the lock file."""
+        assert self._fd is not None
+        os.ftruncate(self._fd, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, f"{socket.gethostname()} {os.getpid()}".encode())
+        os.lseek(self._fd, 0, os.SEEK_SET)
+
+    def _beat(self, stop: threading.Event):
+        """Refresh the lease until stop is set."""
+        while not stop.wait(self.heartbeat):
+            try:
+                os.utime(self.path)
+            except OSError:
+                return
+
+    def _break_stale_lease(self):
+        """Remove the lease file if its holder is dead or silent."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        holder = self.holder()
+        stale = time.time() - stat.st_mtime > self.stale_after
+        if holder is not None and holder[0] == socket.gethostname():
+            stale = stale or not _pid_alive(holder[1])
+        if not stale:
+            return
+
+        logger.warning(f"Taking over stale JIT lock {self.path} (holder {holder}).")
+        # Move the file aside before removing it, and put it back if it
+        # turns out another waiter replaced the stale lease in between.
+        aside = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}")
+        try:
+            os.replace(self.path, aside)
+        except FileNotFoundError:
+            return
+        if os.path.samestat(stat, os.stat(aside)):
+            aside.unlink()
+        else:
+            try:
+                os.link(aside, self.path)
+            except FileExistsError:
+                pass
+            aside.unlink()
@@ -17,15 +17,30 @@ import ufl
 
 import ffcx.codegeneration.lnodes as L
 from ffcx.codegeneration import geometry
+from ffcx.codegeneration.batching import batch_cells
 from ffcx.codegeneration.definitions import create_dof_index, create_quadrature_index
 from ffcx.codegeneration.optimizer import optimize
 from ffcx.ir.elementtables import piecewise_ttypes
 from ffcx.ir.integral import BlockDataT
+from ffcx.ir.referencetensor import ReferenceTensorT
 from ffcx.ir.representationutils import QuadratureRule
 
 logger = logging.getLogger("ffcx")
 
 
+def block_modes(integrand: dict) -> set[str]:
+    """Return how the blocks of the integrand of a quadrature rule are integrated.
+
+    Returns:
+        The block modes of the blocks, "tensor" for the tensor
+        representation, or "partial" if there are no blocks.
+    """
+    if integrand.get("reference_tensors") is not None:
+        return {"tensor"}
+    contributions = integrand["block_contributions"].values()
+    return {b.block_mode for c in contributions for b in c} or {"partial"}
+
+
 def extract_dtype(v, vops: list[Any]):
     """Extract dtype from ufl expression v and its operands."""
     dtypes = []
@@ -45,10 +60,18 @@ def extract_dtype(v, vops: list[Any]):
 class IntegralGenerator:
     """Integral generator."""
 
-    def __init__(self, ir, backend):
-        """Initialise."""
+    def __init__(self, ir, backend, action: bool = False):
+        """Initialise.
+
+        Args:
+            ir: Integral IR.
+            backend: Backend specific plugin.
+            action: Generate code applying the element matrix of a
+                bilinear form to a vector instead of tabulating it.
+        """
         # Store ir
         self.ir = ir
+        self.action = action
 
         # Backend specific plugin with attributes
         # - symbols: for translating ufl operators to target language
@@ -58,17 +81,17 @@ class IntegralGenerator:
 
         # Set of operator names code has been generated for, used in the
         # end for selecting necessary includes
-        self._ufl_names = set()
+        self._ufl_names: set[str] = set()
 
         # Initialize lookup tables for variable scopes
         self.init_scopes()
 
         # Cache
-        self.temp_symbols = {}
+        self.temp_symbols: dict[tuple, L.Symbol] = {}
 
         # Set of counters used for assigning names to intermediate
         # variables
-        self.symbol_counters = collections.defaultdict(int)
+        self.symbol_counters: collections.defaultdict[str, int] = collections.defaultdict(int)
 
     def init_scopes(self):
         """Initialize variable scope dicts."""
@@ -168,7 +191,13 @@ class IntegralGenerator:
 
                 # Generate code to integrate reusable blocks of final
                 # element tensor
-                all_quadparts += self.generate_quadrature_loop(rule, cell)
+                integrand = self.ir.expression.integrand[(cell, rule)]
+                if integrand.get("reference_tensors") is not None:
+                    all_quadparts += self.generate_tensor_contraction(rule, cell)
+                else:
+                    all_quadparts += self.generate_preintegrated_blocks(rule, cell)
+                    if block_modes(integrand) - {"preintegrated"}:
+                        all_quadparts += self.generate_quadrature_loop(rule, cell)
 
         # Collect parts before, during, and after quadrature loops
         parts += all_preparts
@@ -176,6 +205,27 @@ class IntegralGenerator:
 
         return L.StatementList(parts)
 
+    def generate_batch(self, code: L.LNode, batch_size: int) -> L.StatementList:
+        """Generate tabulate_tensor body for a batch of cells.
+
+        Args:
+            code: The tabulate_tensor body returned by generate.
+            batch_size: Number of cells in a batch.
+
+        Returns:
+            The body of a kernel taking the per-cell arguments of
+            batch_size cells interleaved cell by cell.
+        """
+        symbols = self.backend.symbols
+        cell_arrays = [
+            symbols.element_tensor,
+            symbols.coefficients,
+            symbols.coordinate_dofs,
+            symbols.entity_local_index,
+            symbols.quadrature_permutation,
+        ]
+        return batch_cells(code, cell_arrays, symbols.batch_cell_index, batch_size)
+
     def generate_quadrature_tables(self, domain: basix.CellType):
         """Generate static tables of quadrature points and weights."""
         parts: list[L.LNode] = []
@@ -187,8 +237,9 @@ class IntegralGenerator:
             return parts
 
         # Loop over quadrature rules
-        for (cell, quadrature_rule), _ in self.ir.expression.integrand.items():
-            if domain == cell:
+        for (cell, quadrature_rule), integrand in self.ir.expression.integrand.items():
+            # Weights are folded into the tables of other block modes
+            if domain == cell and "partial" in block_modes(integrand):
                 # Generate quadrature weights array
                 wsym = self.backend.symbols.weights_table(quadrature_rule)
                 parts += [L.ArrayDecl(wsym, values=quadrature_rule.weights, const=True)]
@@ -296,10 +347,201 @@ class IntegralGenerator:
         iq_symbol = self.backend.symbols.quadrature_loop_index
         iq = create_quadrature_index(quadrature_rule, iq_symbol)
 
+        # Sum factorised definitions compute the values at all
+        # quadrature points, before the quadrature loop
+        factorised = [d for d in definitions if L.Annotation.factorize in d.annotations]
+        definitions = [d for d in definitions if L.Annotation.factorize not in d.annotations]
+
         code = definitions + intermediates + tensor_comp
         code = optimize(code, quadrature_rule)
 
-        return [L.create_nested_for_loops([iq], code)]
+        return [*factorised, L.create_nested_for_loops([iq], code)]
+
+    def generate_tensor_contraction(self, quadrature_rule: QuadratureRule, domain: basix.CellType):
+        """Generate the contraction of reference tensors with geometry tensors.
+
+        The geometry tensor of each reference tensor is the product of
+        its piecewise factor and the dofs of its coefficients.
+        """
+        integrand = self.ir.expression.integrand[(domain, quadrature_rule)]
+        symbols = self.backend.symbols
+
+        # Group reference tensors by block
+        blocks = collections.defaultdict(list)
+        for rt in integrand["reference_tensors"]:
+            blocks[rt.blockmap].append(rt)
+
+        parts: list[L.LNode] = []
+        for blockmap, reference_tensors in blocks.items():
+            blockdata = reference_tensors[0].blockdata
+            B_indices = [
+                L.MultiIndex([symbols.argument_loop_index(i)], [mad.tabledata.values.shape[3]])
+                for i, mad in enumerate(blockdata.ma_data)
+            ]
+            A_indices = self.element_tensor_indices(blockmap, blockdata, B_indices)
+
+            # Contractions of the reference tensors, inside the loops over
+            # the dofs of the arguments
+            inputs = []
+            values = []
+            body: list[L.LNode] = []
+            for rt in reference_tensors:
+                G, ic, geometry = self.generate_geometry_tensor(rt, quadrature_rule, domain)
+                parts += geometry
+                RT = symbols.element_tables[rt.name]
+                entity = L.LiteralInt(0)
+                if not rt.is_uniform:
+                    entity = symbols.entity(self.ir.expression.entity_type, None)
+                indices = [0, entity, *(index.global_index for index in B_indices)]
+                inputs.append(RT)
+                for section in geometry:
+                    inputs += section.output
+                if ic is None:
+                    values.append(L.ArrayAccess(RT, indices) * G)
+                else:
+                    indices.append(ic.global_index)
+                    value = L.ArrayAccess(RT, indices) * G[ic.global_index]
+                    body.append(L.create_nested_for_loops([ic], self.contract(A_indices, value)))
+            if values:
+                value = values[0] if len(values) == 1 else L.Sum(values)
+                body.insert(0, self.contract(A_indices, value))
+
+            code = [L.create_nested_for_loops(B_indices, body)]
+            output = symbols.action_output if self.action else symbols.element_tensor
+            parts += [L.Section("Tensor Contraction", code, [], inputs, [output])]
+
+        return parts
+
+    def generate_geometry_tensor(
+        self, rt: ReferenceTensorT, quadrature_rule: QuadratureRule, domain: basix.CellType
+    ) -> tuple[L.LExpr, L.MultiIndex | None, list[L.Section]]:
+        """Generate the geometry tensor of a reference tensor.
+
+        Returns:
+            The value of the geometry tensor, the index of its entries if
+            it has coefficients, and the code computing it.
+        """
+        F = self.ir.expression.integrand[(domain, quadrature_rule)]["factorization"]
+        symbols = self.backend.symbols
+
+        # Piecewise factor
+        ic = None
+        inputs = []
+        terms = []
+        for scale, numerator, denominator in rt.factors:
+            values = [self.get_var(None, None, F.nodes[i]["expression"]) for i in numerator]
+            term = L.float_product([L.LiteralFloat(scale), *values])
+            for i in denominator:
+                value = self.get_var(None, None, F.nodes[i]["expression"])
+                term = L.Div(term, value)
+                values.append(value)
+            terms.append(term)
+            inputs += [v.array if isinstance(v, L.ArrayAccess) else v for v in values]
+        factor = terms[0] if len(terms) == 1 else L.Sum(terms)
+
+        if not rt.coefficients:
+            if isinstance(factor, (L.Symbol, L.ArrayAccess, L.LiteralFloat)):
+                return factor, None, []
+            G = self.new_temp_symbol("G")
+            declarations: list[L.Declaration] = [L.VariableDecl(G, 0.0)]
+            statements: list[L.LNode] = [L.Assign(G, factor)]
+        else:
+            # Product with the dofs of the coefficients
+            ic = L.MultiIndex(
+                [
+                    L.Symbol(f"{symbols.coefficient_dof_sum_index.name}{m}", dtype=L.DataType.INT)
+                    for m in range(len(rt.coefficients))
+                ],
+                [F.nodes[i]["tr"].values.shape[3] for i in rt.coefficients],
+            )
+            dofs = []
+            for m, i in enumerate(rt.coefficients):
+                mt, tr = F.nodes[i]["mt"], F.nodes[i]["tr"]
+                dof = ic.local_index(m) * tr.block_size + tr.offset
+                dofs.append(symbols.coefficient_dof_access(mt.terminal, dof))
+            inputs.append(symbols.coefficients)
+            G = self.new_temp_symbol("G")
+            declarations = [L.ArrayDecl(G, [ic.size()])]
+            body = [L.Assign(G[ic.global_index], L.float_product([factor, *dofs]))]
+            statements = [L.create_nested_for_loops([ic], body)]
+
+        inputs = [i for i in dict.fromkeys(inputs) if isinstance(i, L.Symbol)]
+        section = L.Section("Geometry Tensor", statements, declarations, inputs, [G])
+        return G, ic, [section]
+
+    def contract(self, A_indices: list[L.LExpr], value: L.LExpr) -> L.LNode:
+        """Add a value to an entry of the element tensor, or apply it in action code."""
+        if self.action:
+            x, y = self.backend.symbols.action_input, self.backend.symbols.action_output
+            return L.AssignAdd(y[A_indices[0]], value * x[A_indices[1]])
+        A = self.backend.symbols.element_tensor
+        multi_index = L.MultiIndex(A_indices, self.ir.expression.tensor_shape)
+        return L.AssignAdd(A[multi_index], value)
+
+    def generate_preintegrated_blocks(
+        self, quadrature_rule: QuadratureRule, domain: basix.CellType
+    ) -> list[L.LNode]:
+        """Generate the blocks integrated at compile time.
+
+        The pre-integrated table of each block is scaled by its piecewise
+        factor, outside the quadrature loop.
+        """
+        integrand = self.ir.expression.integrand[(domain, quadrature_rule)]
+        F = integrand["factorization"]
+        tables = self.ir.expression.unique_tables[domain]
+        symbols = self.backend.symbols
+
+        parts: list[L.LNode] = []
+        for blockmap, contributions in sorted(integrand["block_contributions"].items()):
+            blocks = [b for b in contributions if b.block_mode == "preintegrated"]
+            if not blocks:
+                continue
+            B_indices = [
+                L.MultiIndex([symbols.argument_loop_index(i)], [len(dofmap)])
+                for i, dofmap in enumerate(blockmap)
+            ]
+            A_indices = self.element_tensor_indices(blockmap, blocks[0], B_indices)
+
+            # Sum the tables of the blocks with the same factor
+            inputs = []
+            factors: dict[int, list[L.LExpr]] = collections.defaultdict(list)
+            for blockdata in blocks:
+                PI = symbols.element_tables[blockdata.name]
+                entity = L.LiteralInt(0)
+                if tables[blockdata.name].shape[1] > 1:
+                    entity = symbols.entity(self.ir.expression.entity_type, None)
+                indices = [0, entity, *(index.global_index for index in B_indices)]
+                factor_index = blockdata.factor_indices_comp_indices[0][0]
+                factors[factor_index].append(L.ArrayAccess(PI, indices))
+                inputs.append(PI)
+
+            values = []
+            for factor_index, PIs in factors.items():
+                f = self.get_var(None, None, F.nodes[factor_index]["expression"])
+                values.append(L.float_product([f, PIs[0] if len(PIs) == 1 else L.Sum(PIs)]))
+                inputs.append(f.array if isinstance(f, L.ArrayAccess) else f)
+            value = values[0] if len(values) == 1 else L.Sum(values)
+
+            code = [L.create_nested_for_loops(B_indices, [self.contract(A_indices, value)])]
+            inputs = [i for i in dict.fromkeys(inputs) if isinstance(i, L.Symbol)]
+            output = symbols.action_output if self.action else symbols.element_tensor
+            parts += [L.Section("Preintegrated Blocks", code, [], inputs, [output])]
+
+        return parts
+
+    def element_tensor_indices(
+        self, blockmap: tuple, blockdata: BlockDataT, B_indices: list[L.MultiIndex]
+    ) -> list[L.LExpr]:
+        """Return the indices in the element tensor of the entries of a block."""
+        A_indices = []
+        for i, index in enumerate(B_indices):
+            tabledata = blockdata.ma_data[i].tabledata
+            offset = tabledata.offset
+            if len(blockmap[i]) == 1:
+                A_indices.append(index.global_index + offset)
+            else:
+                A_indices.append(tabledata.block_size * index.global_index + offset)
+        return A_indices
 
     def generate_piecewise_partition(self, quadrature_rule, domain: basix.CellType):
         """Generate a piecewise partition."""
@@ -372,6 +614,7 @@ class IntegralGenerator:
             (blockmap, blockdata)
             for blockmap, contributions in sorted(block_contributions.items())
             for blockdata in contributions
+            if blockdata.block_mode != "preintegrated"
         ]
 
         block_groups = collections.defaultdict(list)
@@ -455,6 +698,9 @@ class IntegralGenerator:
         # RHS expressions grouped by LHS "dofmap"
         rhs_expressions = collections.defaultdict(list)
 
+        # Factors of each block, for action code
+        terms = []
+
         block_rank = len(blockmap)
         iq_symbol = self.backend.symbols.quadrature_loop_index
         iq = create_quadrature_index(quadrature_rule, iq_symbol)
@@ -493,13 +739,20 @@ class IntegralGenerator:
                 weights = self.backend.symbols.weights_table(quadrature_rule)
                 weight = weights[iq.global_index]
 
-            # Define fw = f * weight
-            fw_rhs = L.float_product([f, weight])
-            if not isinstance(fw_rhs, L.Product):
+            # Define fw = f * weight, unless the weight is folded into
+            # the table of an argument
+            premultiplied = blockdata.block_mode == "premultiplied"
+            fw_rhs = f if premultiplied else L.float_product([f, weight])
+            if not isinstance(fw_rhs, L.Product) and not premultiplied:
                 fw = fw_rhs
             else:
                 # Define and cache scalar temp variable
-                key = (quadrature_rule, factor_index, blockdata.all_factors_piecewise)
+                key = (
+                    quadrature_rule,
+                    factor_index,
+                    blockdata.all_factors_piecewise,
+                    premultiplied,
+                )
                 fw, defined = self.get_temp_symbol("fw", key)
                 if not defined:
                     input = [f, weight]
@@ -526,17 +779,16 @@ class IntegralGenerator:
             # Define B_rhs = fw * arg_factors
             B_rhs = L.float_product([fw] + arg_factors)
 
-            A_indices = []
-            for i in range(block_rank):
-                index = B_indices[i]
-                tabledata = blockdata.ma_data[i].tabledata
-                offset = tabledata.offset
-                if len(blockmap[i]) == 1:
-                    A_indices.append(index.global_index + offset)
-                else:
-                    block_size = blockdata.ma_data[i].tabledata.block_size
-                    A_indices.append(block_size * index.global_index + offset)
+            A_indices = self.element_tensor_indices(blockmap, blockdata, B_indices)
             rhs_expressions[tuple(A_indices)].append(B_rhs)
+            terms.append((B_indices, fw, arg_factors, A_indices))
+
+        if self.action:
+            action_body = self.generate_action_body(terms)
+            input = list({*vars, *tables})
+            output = [self.backend.symbols.action_output]
+            quadparts += [L.Section("Action Computation", action_body, [], input, output)]
+            return quadparts, intermediates
 
         # List of statements to keep in the inner loop
         keep = collections.defaultdict(list)
@@ -573,3 +825,44 @@ class IntegralGenerator:
         quadparts += [L.Section("Tensor Computation", body, [], input, output, annotations)]
 
         return quadparts, intermediates
+
+    def generate_action_body(self, terms: list) -> list[L.LNode]:
+        """Generate code applying a block of the element matrix to a vector.
+
+        The trial functions are contracted with the input vector at the
+        quadrature point, and the result is integrated against the test
+        functions, without forming the block.
+
+        Args:
+            terms: Dof indices, weighted factor, argument factors and
+                element tensor indices of each contribution to the block.
+        """
+        x = self.backend.symbols.action_input
+        y = self.backend.symbols.action_output
+
+        # All terms of a block loop over the same dof indices
+        test_index, trial_index = terms[0][0]
+
+        # Values at the quadrature point of the trial functions weighted by x
+        values: dict[tuple, L.Symbol] = {}
+        sums = []
+        rhs_expressions = collections.defaultdict(list)
+        for _, fw, arg_factors, A_indices in terms:
+            key = (arg_factors[1], A_indices[1])
+            if key not in values:
+                values[key] = self.new_temp_symbol("u")
+                sums.append(
+                    L.AssignAdd(values[key], L.float_product([arg_factors[1], x[A_indices[1]]]))
+                )
+            rhs = L.float_product([fw, arg_factors[0], values[key]])
+            rhs_expressions[A_indices[0]].append(rhs)
+
+        body: list[L.LNode] = [L.VariableDecl(u, 0.0) for u in values.values()]
+        body.append(L.create_nested_for_loops([trial_index], sums))
+        test_body = [
+            L.AssignAdd(y[index], expression)
+            for index, expressions in rhs_expressions.items()
+            for expression in expressions
+        ]
+        body.append(L.create_nested_for_loops([test_index], test_body))
+        return body
@@ -7,14 +7,19 @@
 
 from __future__ import annotations
 
+import concurrent.futures
+import hashlib
 import importlib
 import io
+import json
 import logging
 import os
 import re
+import shutil
 import sys
 import sysconfig
 import tempfile
+import threading
 import time
 from contextlib import redirect_stdout
 from pathlib import Path
@@ -25,8 +30,15 @@ import numpy.typing as npt
 import ufl
 
 import ffcx
+import ffcx.cache
+import ffcx.codegeneration.ccompiler
+import ffcx.formatting
 import ffcx.naming
+import ffcx.options
+from ffcx.cacheutils import LRUMemo, MemoInfo, write_atomic
 from ffcx.codegeneration.C.file_template import libraries as _libraries
+from ffcx.codegeneration.codegeneration import CodeBlocks
+from ffcx.codegeneration.filelock import FileLock
 
 logger = logging.getLogger("ffcx")
 root_logger = logging.getLogger()
@@ -57,16 +69,7 @@ UFC_HEADER_DECL = header + "\n"
 UFC_FORM_DECL = "\n".join(re.findall("typedef struct ufcx_form.*?ufcx_form;", ufcx_h, re.DOTALL))
 
 UFC_INTEGRAL_DECL = "\n".join(
-    re.findall(r"typedef void ?\(ufcx_tabulate_tensor_float32\).*?\);", ufcx_h, re.DOTALL)
-)
-UFC_INTEGRAL_DECL += "\n".join(
-    re.findall(r"typedef void ?\(ufcx_tabulate_tensor_float64\).*?\);", ufcx_h, re.DOTALL)
-)
-UFC_INTEGRAL_DECL += "\n".join(
-    re.findall(r"typedef void ?\(ufcx_tabulate_tensor_complex64\).*?\);", ufcx_h, re.DOTALL)
-)
-UFC_INTEGRAL_DECL += "\n".join(
-    re.findall(r"typedef void ?\(ufcx_tabulate_tensor_complex128\).*?\);", ufcx_h, re.DOTALL)
+    re.findall(r"typedef void ?\(ufcx_tabulate_(?:tensor|action)_\w+\).*?\);", ufcx_h, re.DOTALL)
 )
 
 UFC_INTEGRAL_DECL += "\n".join(
@@ -78,60 +81,154 @@ UFC_EXPRESSION_DECL = "\n".join(
 )
 
 
+# JIT modules loaded in this process, keyed on the identity of the
+# compiled UFL objects. Each entry keeps the objects alive, so their ids
+# cannot be recycled while the entry is in the memo.
+_module_memo = LRUMemo(128)
+
+# Pool of asynchronous compilations, and lock serialising setuptools builds
+_executor: concurrent.futures.Executor | None = None
+_executor_lock = threading.Lock()
+_cffi_build_lock = threading.Lock()
+
+
+def module_memo_info() -> MemoInfo:
+    """Return hit/miss statistics of the in-process memo of JIT modules."""
+    return _module_memo.info()
+
+
+def clear_module_memo():
+    """Forget all JIT modules memoized in this process."""
+    _module_memo.clear()
+
+
+def set_module_memo_size(maxsize: int):
+    """Set the maximum number of memoized JIT modules (0 disables the memo)."""
+    _module_memo.resize(maxsize)
+
+
+def _memo_key(ufl_objects, options, cache_dir, *args):
+    """Compute a cheap memo key for a JIT request.
+
+    Forms are identified by object identity, expressions by the identity of
+    the UFL expression and a digest of the evaluation points (which may be
+    modified in place by the caller). Options are fingerprinted by their
+    repr instead of being merged through get_options.
+    """
+    objects = []
+    for ufl_object in ufl_objects:
+        if isinstance(ufl_object, tuple):
+            objects.append((id(ufl_object[0]), ffcx.naming.points_signature(ufl_object[1])))
+        else:
+            objects.append(id(ufl_object))
+    cache_dir = None if cache_dir is None else str(cache_dir)
+    options = repr(sorted((options or {}).items()))
+    return (tuple(objects), options, cache_dir, repr(args))
+
+
 def _compute_option_signature(options):
     """Return options signature (some options should not affect signature)."""
-    return str(sorted(options.items()))
+    return str(
+        sorted((k, v) for k, v in options.items() if k not in ffcx.options.FFCX_EXECUTION_OPTIONS)
+    )
+
 
+def get_cached_module(module_name, object_names, cache_dir, timeout, decl=None, retry_failed=False):
+    """Load a module from the cache, or take the lock to compile it.
 
-def get_cached_module(module_name, object_names, cache_dir, timeout):
-    """Look for an existing C file and wait for compilation, or if it does not exist, create it."""
+    If the module is being compiled by another process (or thread), wait
+    on its lock and load the module as soon as the compilation finishes.
+    A compilation that died leaves no lock behind, and its module is then
+    compiled by the next waiter instead.
+
+    Args:
+        module_name: Name of the module.
+        object_names: Names of the objects to load from the module.
+        cache_dir: Cache directory.
+        timeout: Time (s) to wait for a concurrent compilation.
+        decl: C declarations of a module built by the direct backend, or
+            None for a CFFI extension module.
+        retry_failed: Compile the module even if a previous compilation
+            failed.
+
+    Returns:
+        (objects, module, None) if the module is in the cache, otherwise
+        (None, None, lock) where the caller holds lock and must release
+        it after the module is compiled (or compilation failed).
+
+    Raises:
+        RuntimeError: if a previous compilation of the module failed,
+            with the recorded diagnostic, unless retry_failed is set.
+    """
     cache_dir = Path(cache_dir)
     c_filename = cache_dir.joinpath(module_name).with_suffix(".c")
     ready_name = c_filename.with_suffix(".c.cached")
+    failed_name = c_filename.with_suffix(".c.failed")
 
     # Ensure cache dir exists
     cache_dir.mkdir(exist_ok=True, parents=True)
 
+    if not ready_name.exists():
+        if not retry_failed:
+            _check_failed(failed_name)
+        lock = FileLock(cache_dir.joinpath(module_name).with_suffix(".lock"))
+        t0 = time.time()
+        if not lock.acquire(timeout):
+            raise TimeoutError(
+                f"JIT compilation timed out waiting for {lock.path} held by "
+                f"{lock.holder()}. Increase timeout option if the compilation is expected "
+                "to take longer."
+            )
+        if not ready_name.exists():
+            if not retry_failed and failed_name.exists():
+                # The compilation we waited for failed
+                lock.release()
+                _check_failed(failed_name)
+            return None, None, lock
+        lock.release()
+        logger.info(f"Waited {time.time() - t0:.4f} for {ready_name} to appear.")
+
+    logger.info("Cached C file already exists: " + str(c_filename))
     try:
-        # Create C file with exclusive access
-        with open(c_filename, "x"):
-            pass
-        return None, None
-    except FileExistsError:
-        logger.info("Cached C file already exists: " + str(c_filename))
-        finder = importlib.machinery.FileFinder(
-            str(cache_dir),
-            (importlib.machinery.ExtensionFileLoader, importlib.machinery.EXTENSION_SUFFIXES),
-        )
-        finder.invalidate_caches()
-
-        # Now, wait for ready
-        for i in range(timeout):
-            if os.path.exists(ready_name):
-                spec = finder.find_spec(module_name)
-                if spec is None:
-                    raise ModuleNotFoundError("Unable to find JIT module.")
-                compiled_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(compiled_module)
-
-                compiled_objects = [getattr(compiled_module.lib, name) for name in object_names]
-                return compiled_objects, compiled_module
-
-            logger.info(f"Waiting for {ready_name} to appear.")
-            time.sleep(1)
-        raise TimeoutError(
-            "JIT compilation timed out, probably due to a failed previous compile. "
-            f"Try cleaning cache (e.g. remove {c_filename}) or increase timeout option."
+        # Record the access, for least recently used eviction
+        os.utime(ready_name)
+        compiled_objects, compiled_module = _load_objects(
+            cache_dir, module_name, object_names, decl
         )
+    except (ImportError, OSError):
+        if ready_name.exists():
+            raise
+        # Evicted from the cache meanwhile, compile it again
+        return get_cached_module(module_name, object_names, cache_dir, timeout, decl, retry_failed)
+    return compiled_objects, compiled_module, None
+
+
+def _check_failed(failed_name: Path):
+    """Raise the recorded diagnostic of a failed compilation, if any."""
+    try:
+        diagnostic = failed_name.read_text()
+    except FileNotFoundError:
+        return
+    raise RuntimeError(
+        f"JIT compilation failed previously, see {failed_name}. Pass retry_failed=True "
+        f"or run 'python -m ffcx.cache {failed_name.parent} clear-failed' to compile it "
+        f"again.\n{diagnostic}"
+    )
 
 
-def _compilation_signature(cffi_extra_compile_args, cffi_debug):
+def _compilation_signature(cffi_extra_compile_args, cffi_debug, backend="cffi"):
     """Compute the compilation-inputs part of the signature.
 
-    Used to avoid cache conflicts across Python versions, architectures, installs.
+    Used to avoid cache conflicts across Python versions, architectures,
+    installs, compilers and compiler flags.
 
+    - the compiler signature includes the compiler, its version and the
+      effective flags (including the CC and CFLAGS environment variables)
     - SOABI includes platform, Python version, debug flags
-    - CFLAGS includes prefixes, arch targets
+
+    The direct backend builds plain C libraries, which do not depend on
+    the Python ABI, so these are shared across interpreters using the
+    same compiler and flags.
     """
     if sys.platform.startswith("win32"):
         # NOTE: SOABI not defined on win32, EXT_SUFFIX contains e.g. '.cp312-win_amd64.pyd'
@@ -140,25 +237,48 @@ def _compilation_signature(cffi_extra_compile_args, cffi_debug):
             + str(cffi_debug)
             + str(sysconfig.get_config_var("EXT_SUFFIX"))
         )
-    else:
-        return (
-            str(cffi_extra_compile_args)
-            + str(cffi_debug)
-            + str(sysconfig.get_config_var("CFLAGS"))
-            + str(sysconfig.get_config_var("SOABI"))
-        )
+    signature = ffcx.codegeneration.ccompiler.compiler_signature(
+        cffi_extra_compile_args, cffi_debug
+    )
+    if backend == "direct":
+        return signature + backend
+    # Extension modules also depend on the Python ABI and link command
+    return (
+        signature
+        + " ".join(ffcx.codegeneration.ccompiler.python_linker())
+        + str(sysconfig.get_config_var("SOABI"))
+        + backend
+    )
+
+
+def _select_backend(backend: str) -> str:
+    """Return the JIT backend to use, falling back to setuptools if needed."""
+    if backend not in ("cffi", "direct", "setuptools"):
+        raise ValueError(f"Unknown JIT backend '{backend}'.")
+    if backend != "setuptools":
+        if sys.platform.startswith("win32"):
+            logger.info(f"JIT backend '{backend}' is not supported on win32, using setuptools.")
+            return "setuptools"
+        if shutil.which(ffcx.codegeneration.ccompiler.compiler()[0]) is None:
+            logger.info(f"C compiler not found for JIT backend '{backend}', using setuptools.")
+            return "setuptools"
+    return backend
 
 
 def compile_forms(
     forms: list[ufl.Form],
     options: dict = {},
     cache_dir: Path | None = None,
-    timeout: int = 10,
+    timeout: float = 10,
     cffi_extra_compile_args: list[str] = [],
     cffi_verbose: bool = False,
     cffi_debug: bool = False,
     cffi_libraries: list[str] = [],
     visualise: bool = False,
+    split_translation_units: bool = False,
+    compile_workers: int | None = None,
+    backend: str = "cffi",
+    retry_failed: bool = False,
 ):
     """Compile a list of UFL forms into UFC Python objects.
 
@@ -166,78 +286,75 @@ def compile_forms(
         forms: List of ufl.form to compile.
         options: Options
         cache_dir: Cache directory
-        timeout: Timeout
+        timeout: Time (s) to wait for a concurrent compilation of the same module
         cffi_extra_compile_args: Extra compilation args for CFFI
         cffi_verbose: Use verbose compile
         cffi_debug: Use compiler debug mode
         cffi_libraries: libraries to use with compiler
         visualise: Toggle visualisation
+        split_translation_units: Compile each integral and expression in
+            its own translation unit, concurrently, and link them into one
+            module
+        compile_workers: Maximum number of concurrent compiler processes
+            for split_translation_units (default: available cores)
+        backend: "cffi" builds a CFFI extension module, running the C
+            compiler and linker of the running Python itself.
+            "setuptools" builds the extension module through setuptools
+            instead, which is slower but supports any setuptools
+            compiler. "direct" runs the C compiler to build a plain C
+            shared library and header, and loads the library in CFFI
+            ABI mode. The cached library does not depend on the Python
+            ABI, so it is shared between interpreters. "cffi" and
+            "direct" fall back to "setuptools" on win32 and if no C
+            compiler is found.
+        retry_failed: Compile the module even if a previous compilation
+            into cache_dir failed. Otherwise, a failure is reported
+            again straight away, with the recorded compiler diagnostic.
+
+    Note:
+        Modules are memoized in-process on the identity of the forms and
+        the given arguments. A memoized module is returned without
+        recomputing the signature or accessing the cache directory, and
+        the returned code is then (None, None). See
+        :func:`module_memo_info` and :func:`set_module_memo_size`.
+
+        The generated code is cached in cache_dir separately from the
+        compiled module, under a name that does not depend on the
+        compiler flags or backend. Compiling the same forms with other
+        flags only runs the C compiler. See :func:`generate_code`.
     """
-    p = ffcx.options.get_options(options)
-
-    # Get a signature for these forms
-    module_name = "libffcx_forms_" + ffcx.naming.compute_signature(
+    return _start_compile(
+        "forms",
         forms,
-        _compute_option_signature(p) + _compilation_signature(cffi_extra_compile_args, cffi_debug),
-    )
-
-    form_names = [ffcx.naming.form_name(form, i, module_name) for i, form in enumerate(forms)]
-
-    if cache_dir is not None:
-        cache_dir = Path(cache_dir)
-        obj, mod = get_cached_module(module_name, form_names, cache_dir, timeout)
-        if obj is not None:
-            return obj, mod, (None, None)
-    else:
-        cache_dir = Path(tempfile.mkdtemp())
-
-    try:
-        decl = (
-            UFC_HEADER_DECL.format(np.dtype(p["scalar_type"]).name)  # type: ignore
-            + UFC_INTEGRAL_DECL
-            + UFC_FORM_DECL
-        )
-
-        form_template = "extern ufcx_form {name};\n"
-        for name in form_names:
-            decl += form_template.format(name=name)
-
-        impl = _compile_objects(
-            decl,
-            forms,
-            form_names,
-            module_name,
-            p,
-            cache_dir,
-            cffi_extra_compile_args,
-            cffi_verbose,
-            cffi_debug,
-            cffi_libraries,
-            visualise=visualise,
-        )
-    except Exception as e:
-        try:
-            # remove c file so that it will not timeout next time
-            c_filename = cache_dir.joinpath(module_name + ".c")
-            os.replace(c_filename, c_filename.with_suffix(".c.failed"))
-        except Exception:
-            pass
-        raise e
-
-    obj, module = _load_objects(cache_dir, module_name, form_names)
-    return obj, module, (decl, impl)
+        options,
+        cache_dir,
+        timeout,
+        cffi_extra_compile_args,
+        cffi_verbose,
+        cffi_debug,
+        cffi_libraries,
+        visualise,
+        split_translation_units,
+        compile_workers,
+        backend,
+        retry_failed,
+    )()
 
 
 def compile_expressions(
     expressions: list[tuple[ufl.Expr, npt.NDArray[np.floating]]],
     options: dict = {},
     cache_dir: Path | None = None,
-    timeout: int = 10,
+    timeout: float = 10,
     cffi_extra_compile_args: list[str] = [],
     cffi_verbose: bool = False,
     cffi_debug: bool = False,
     cffi_libraries: list[str] = [],
     visualise: bool = False,
+    split_translation_units: bool = False,
+    compile_workers: int | None = None,
+    backend: str = "cffi",
+    retry_failed: bool = False,
 ):
     """Compile a list of UFL expressions into UFC Python objects.
 
@@ -245,73 +362,422 @@ def compile_expressions(
         expressions: List of (UFL expression, evaluation points).
         options: Options
         cache_dir: Cache directory
-        timeout: Timeout
+        timeout: Time (s) to wait for a concurrent compilation of the same module
         cffi_extra_compile_args: Extra compilation args for CFFI
         cffi_verbose: Use verbose compile
         cffi_debug: Use compiler debug mode
         cffi_libraries: libraries to use with compiler
         visualise: Toggle visualisation
+        split_translation_units: Compile each integral and expression in
+            its own translation unit, concurrently, and link them into one
+            module
+        compile_workers: Maximum number of concurrent compiler processes
+            for split_translation_units (default: available cores)
+        backend: "cffi" builds a CFFI extension module, running the C
+            compiler and linker of the running Python itself.
+            "setuptools" builds the extension module through setuptools
+            instead, which is slower but supports any setuptools
+            compiler. "direct" runs the C compiler to build a plain C
+            shared library and header, and loads the library in CFFI
+            ABI mode. The cached library does not depend on the Python
+            ABI, so it is shared between interpreters. "cffi" and
+            "direct" fall back to "setuptools" on win32 and if no C
+            compiler is found.
+        retry_failed: Compile the module even if a previous compilation
+            into cache_dir failed. Otherwise, a failure is reported
+            again straight away, with the recorded compiler diagnostic.
+
+    Note:
+        Modules are memoized in-process, see :func:`compile_forms`.
     """
+    return _start_compile(
+        "expressions",
+        expressions,
+        options,
+        cache_dir,
+        timeout,
+        cffi_extra_compile_args,
+        cffi_verbose,
+        cffi_debug,
+        cffi_libraries,
+        visualise,
+        split_translation_units,
+        compile_workers,
+        backend,
+        retry_failed,
+    )()
+
+
+def compile_forms_async(
+    forms: list[ufl.Form], executor: concurrent.futures.Executor | None = None, **kwargs
+) -> concurrent.futures.Future:
+    """Compile a list of UFL forms, returning a future of the result.
+
+    Code is generated on the calling thread, and the C compilation is
+    submitted to executor, so that the caller can go on generating the
+    code of the next module while this one compiles. A module that is
+    being compiled by another process is waited for on executor too.
+    All errors, including those of code generation and of previously
+    failed compilations, are raised by the result of the future.
+
+    Args:
+        forms: List of ufl.form to compile.
+        executor: Executor running the compilation (default: a shared
+            pool with one thread per available core).
+        kwargs: Arguments of :func:`compile_forms`.
+
+    Returns:
+        Future of the result of :func:`compile_forms`.
+    """
+    return _submit(compile_forms, "forms", forms, executor, kwargs)
+
+
+def compile_expressions_async(
+    expressions: list[tuple[ufl.Expr, npt.NDArray[np.floating]]],
+    executor: concurrent.futures.Executor | None = None,
+    **kwargs,
+) -> concurrent.futures.Future:
+    """Compile a list of UFL expressions, returning a future of the result.
+
+    See :func:`compile_forms_async`.
+    """
+    return _submit(compile_expressions, "expressions", expressions, executor, kwargs)
+
+
+def compile_many(
+    modules: list[list[ufl.Form] | list[tuple[ufl.Expr, npt.NDArray[np.floating]]]],
+    max_workers: int | None = None,
+    **kwargs,
+) -> list[concurrent.futures.Future]:
+    """Compile several modules, overlapping code generation and compilation.
+
+    Args:
+        modules: Each entry is a list of forms, or a list of (UFL
+            expression, evaluation points), compiled into one module.
+        max_workers: Maximum number of modules compiled at the same time
+            (default: available cores).
+        kwargs: Arguments of :func:`compile_forms`.
+
+    Returns:
+        Futures of the result of :func:`compile_forms` (or
+        :func:`compile_expressions`) for each module, in order.
+    """
+    if max_workers is None:
+        max_workers = ffcx.codegeneration.ccompiler.available_cores()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix="ffcx-jit")
+    try:
+        futures = []
+        for ufl_objects in modules:
+            if len(ufl_objects) > 0 and isinstance(ufl_objects[0], tuple):
+                futures.append(compile_expressions_async(ufl_objects, executor, **kwargs))
+            else:
+                futures.append(compile_forms_async(ufl_objects, executor, **kwargs))
+    finally:
+        executor.shutdown(wait=False)
+    return futures
+
+
+def _compile_executor() -> concurrent.futures.Executor:
+    """Return the pool shared by asynchronous compilations."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                ffcx.codegeneration.ccompiler.available_cores(), thread_name_prefix="ffcx-jit"
+            )
+        return _executor
+
+
+def _submit(compile_function, kind, ufl_objects, executor, kwargs):
+    """Start a compilation on the calling thread and submit the rest.
+
+    Errors of the part run on the calling thread are set on the
+    returned future, like those of the part run by the executor.
+    """
+    if executor is None:
+        executor = _compile_executor()
+    try:
+        finish = _start_compile(kind, ufl_objects, **{**kwargs, "timeout": 0})
+    except TimeoutError:
+        # Locked by another compilation, wait for it in the executor
+        return executor.submit(compile_function, ufl_objects, **kwargs)
+    except BaseException as e:
+        # As in executor threads, since some UFL errors are not Exceptions
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        future.set_exception(e)
+        return future
+    return executor.submit(finish)
+
+
+def _start_compile(
+    kind,
+    ufl_objects,
+    options: dict = {},
+    cache_dir: Path | None = None,
+    timeout: float = 10,
+    cffi_extra_compile_args: list[str] = [],
+    cffi_verbose: bool = False,
+    cffi_debug: bool = False,
+    cffi_libraries: list[str] = [],
+    visualise: bool = False,
+    split_translation_units: bool = False,
+    compile_workers: int | None = None,
+    backend: str = "cffi",
+    retry_failed: bool = False,
+):
+    """Look up a module, or generate its code.
+
+    Returns:
+        A function that compiles and loads the module if needed, and
+        returns (objects, module, (decl, impl)). It does not touch the
+        UFL objects, so it can be called on another thread.
+    """
+    memo_key = _memo_key(
+        ufl_objects,
+        options,
+        cache_dir,
+        cffi_extra_compile_args,
+        cffi_debug,
+        cffi_libraries,
+        visualise,
+        backend,
+        [os.environ.get(name) for name in ffcx.codegeneration.ccompiler.ENVIRONMENT_VARIABLES],
+    )
+    entry = _module_memo.get(memo_key)
+    if entry is not None:
+        memoized = entry[1]
+        return lambda: (memoized[0], memoized[1], (None, None))
+
     p = ffcx.options.get_options(options)
+    backend = _select_backend(backend)
 
-    module_name = "libffcx_expressions_" + ffcx.naming.compute_signature(
-        expressions,
-        _compute_option_signature(p) + _compilation_signature(cffi_extra_compile_args, cffi_debug),
+    # Get a signature for these objects
+    module_name = f"libffcx_{kind}_" + ffcx.naming.compute_signature(
+        ufl_objects,
+        _compute_option_signature(p)
+        + _compilation_signature(cffi_extra_compile_args, cffi_debug, backend),
     )
-    expr_names = [
-        ffcx.naming.expression_name(expression, module_name) for expression in expressions
-    ]
+    # The code does not depend on how it is compiled, so it is named
+    # (and cached) independently of the compiler flags and backend
+    code_name = _code_name(kind, ufl_objects, p)
+
+    decl = (
+        UFC_HEADER_DECL.format(np.dtype(p["scalar_type"]).name)  # type: ignore
+        + UFC_INTEGRAL_DECL
+        + UFC_FORM_DECL
+    )
+    if kind == "forms":
+        object_names = [
+            ffcx.naming.form_name(form, i, code_name) for i, form in enumerate(ufl_objects)
+        ]
+        template = "extern ufcx_form {name};\n"
+    else:
+        object_names = [
+            ffcx.naming.expression_name(expression, code_name) for expression in ufl_objects
+        ]
+        decl += UFC_EXPRESSION_DECL
+        template = "extern ufcx_expression {name};\n"
+    for name in object_names:
+        decl += template.format(name=name)
+    abi_decl = decl if backend == "direct" else None
 
+    # Raise error prior to compilation if no support for C99 _Complex.
+    # Doing this here allows FFCx to be used for complex codegen on
+    # Windows.
+    if sys.platform.startswith("win32"):
+        if np.issubdtype(p["scalar_type"], np.complexfloating):
+            raise NotImplementedError("win32 platform does not support C99 _Complex numbers")
+        elif isinstance(p["scalar_type"], str) and "complex" in p["scalar_type"]:
+            raise NotImplementedError("win32 platform does not support C99 _Complex numbers")
+
+    persistent = cache_dir is not None
     if cache_dir is not None:
         cache_dir = Path(cache_dir)
-        obj, mod = get_cached_module(module_name, expr_names, cache_dir, timeout)
+        if not p["ir_cache_dir"]:
+            # Reuse representations of integrals between modules
+            p["ir_cache_dir"] = str(cache_dir.joinpath("ir"))
+        obj, mod, lock = get_cached_module(
+            module_name, object_names, cache_dir, timeout, abi_decl, retry_failed
+        )
         if obj is not None:
-            return obj, mod, (None, None)
+            _module_memo.put(memo_key, (tuple(ufl_objects), (obj, mod)))
+            return lambda: (obj, mod, (None, None))
     else:
         cache_dir = Path(tempfile.mkdtemp())
+        lock = None
 
-    try:
-        decl = (
-            UFC_HEADER_DECL.format(np.dtype(p["scalar_type"]).name)  # type: ignore
-            + UFC_INTEGRAL_DECL
-            + UFC_FORM_DECL
-            + UFC_EXPRESSION_DECL
-        )
-
-        expression_template = "extern ufcx_expression {name};\n"
-        for name in expr_names:
-            decl += expression_template.format(name=name)
+    if split_translation_units and sys.platform.startswith("win32"):
+        logger.info("Separate translation units are not supported on win32.")
+        split_translation_units = False
 
-        impl = _compile_objects(
-            decl,
-            expressions,
-            expr_names,
-            module_name,
+    try:
+        code = _cached_code(
+            ufl_objects,
+            code_name,
             p,
-            cache_dir,
-            cffi_extra_compile_args,
-            cffi_verbose,
-            cffi_debug,
-            cffi_libraries,
-            visualise=visualise,
+            cache_dir if persistent else None,
+            visualise,
+            split_translation_units,
         )
-    except Exception as e:
+    except BaseException:
+        if lock is not None:
+            lock.release()
+        raise
+
+    def finish():
         try:
-            # remove c file so that it will not timeout next time
-            c_filename = cache_dir.joinpath(module_name + ".c")
-            os.replace(c_filename, c_filename.with_suffix(".c.failed"))
-        except Exception:
-            pass
-        raise e
+            impl = _compile_objects(
+                decl,
+                code,
+                module_name,
+                p,
+                cache_dir,
+                cffi_extra_compile_args,
+                cffi_verbose,
+                cffi_debug,
+                cffi_libraries,
+                compile_workers=compile_workers,
+                backend=backend,
+            )
+            cache_dir.joinpath(module_name + ".c.failed").unlink(missing_ok=True)
+        except Exception as e:
+            if persistent:
+                # Record the failure, so that waiters and later attempts
+                # fail straight away with its diagnostic
+                _record_failure(cache_dir.joinpath(module_name + ".c.failed"), e)
+            raise e
+        finally:
+            if lock is not None:
+                lock.release()
+
+        obj, module = _load_objects(cache_dir, module_name, object_names, abi_decl)
+        _module_memo.put(memo_key, (tuple(ufl_objects), (obj, module)))
+
+        max_size = ffcx.cache.max_size_from_environment()
+        if persistent and max_size is not None:
+            try:
+                ffcx.cache.prune(cache_dir, max_size)
+            except OSError as e:
+                logger.warning(f"Failed to prune JIT cache {cache_dir}: {e}")
+        return obj, module, (decl, impl)
+
+    return finish
+
+
+def _record_failure(failed_name: Path, error: Exception):
+    """Write the diagnostic of a failed compilation."""
+    diagnostic = str(error) if isinstance(error, RuntimeError) else repr(error)
+    try:
+        write_atomic(failed_name, diagnostic)
+    except OSError as e:
+        logger.warning(f"Failed to record JIT compilation failure in {failed_name}: {e}")
 
-    obj, module = _load_objects(cache_dir, module_name, expr_names)
-    return obj, module, (decl, impl)
+
+def generate_code(
+    ufl_objects: list[ufl.Form] | list[tuple[ufl.Expr, npt.NDArray[np.floating]]],
+    options: dict = {},
+    cache_dir: Path | None = None,
+    split_translation_units: bool = False,
+) -> tuple[str, str]:
+    """Return the C code of a JIT module, without compiling it.
+
+    The code is read from the cache directory if it was generated
+    before, whatever compiler flags it was compiled with, and is
+    otherwise generated and stored there.
+
+    Args:
+        ufl_objects: List of forms, or of (UFL expression, evaluation
+            points), as passed to :func:`compile_forms` or
+            :func:`compile_expressions`.
+        options: Options
+        cache_dir: Cache directory, or None to generate the code without
+            caching it.
+        split_translation_units: Return the code generated for separate
+            translation units, see :func:`compile_forms`.
+
+    Returns:
+        Header and source code.
+    """
+    kind = "expressions" if len(ufl_objects) > 0 and isinstance(ufl_objects[0], tuple) else "forms"
+    p = ffcx.options.get_options(options)
+    code_h, code_c, units = _cached_code(
+        ufl_objects,
+        _code_name(kind, ufl_objects, p),
+        p,
+        None if cache_dir is None else Path(cache_dir),
+        False,
+        split_translation_units,
+    )
+    return code_h, code_c if units is None else "".join(units)
+
+
+def _code_name(kind, ufl_objects, options) -> str:
+    """Return the name of the code of a module, used as prefix of its symbols."""
+    return f"libffcx_{kind}_" + ffcx.naming.compute_signature(
+        ufl_objects, "code" + _compute_option_signature(options)
+    )
+
+
+def _cached_code(ufl_objects, code_name, options, cache_dir, visualise, split_translation_units):
+    """Load the code of a module from the code cache, or generate and store it.
+
+    The code of a module is stored in ``code/<code_name>.json`` (or
+    ``code/<code_name>.split.json`` if split_translation_units) of the
+    cache directory. No cache is used if cache_dir is None or if
+    visualise.
+    """
+    if cache_dir is None or visualise:
+        return _generate_code(ufl_objects, code_name, options, visualise, split_translation_units)
+
+    suffix = ".split.json" if split_translation_units else ".json"
+    path = cache_dir.joinpath("code", code_name + suffix)
+    try:
+        data = json.loads(path.read_text())
+        os.utime(path)
+        logger.info(f"Loaded generated code from {path}")
+        return data["header"], data["source"], data["units"]
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Failed to load generated code from {path}: {e!r}")
+
+    code = _generate_code(ufl_objects, code_name, options, visualise, split_translation_units)
+    data = json.dumps({"header": code[0], "source": code[1], "units": code[2]})
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, data)
+    except OSError as e:
+        logger.warning(f"Failed to cache generated code in {path}: {e}")
+    return code
+
+
+def _generate_code(ufl_objects, code_name, options, visualise, split_translation_units):
+    """Generate the code of a module.
+
+    Returns:
+        Header, source and, if split_translation_units, the separate
+        translation units, the last of which is the source.
+    """
+    import ffcx.compiler
+
+    # JIT uses code_name as prefix, which is needed to make names of all struct/function
+    # unique across modules with different code
+    if split_translation_units:
+        code = ffcx.compiler.generate_code_blocks(
+            ufl_objects, prefix=code_name, options=options, visualise=visualise
+        )
+        code = _share_integrals(code)
+        units = ffcx.formatting.format_code_units(code)
+        return ffcx.formatting.format_code(code)[0], units[-1], units
+    code_h, code_c = ffcx.compiler.compile_ufl_objects(
+        ufl_objects, prefix=code_name, options=options, visualise=visualise
+    )
+    return code_h, code_c, None
 
 
 def _compile_objects(
     decl,
-    ufl_objects,
-    object_names,
+    code,
     module_name,
     options,
     cache_dir,
@@ -319,27 +785,12 @@ def _compile_objects(
     cffi_verbose,
     cffi_debug,
     cffi_libraries,
-    visualise: bool = False,
+    compile_workers: int | None = None,
+    backend: str = "cffi",
 ):
-    import ffcx.compiler
-
+    code_h, code_body, units = code
     libraries = _libraries + cffi_libraries if cffi_libraries is not None else _libraries
 
-    # JIT uses module_name as prefix, which is needed to make names of all struct/function
-    # unique across modules
-    _, code_body = ffcx.compiler.compile_ufl_objects(
-        ufl_objects, prefix=module_name, options=options, visualise=visualise
-    )
-
-    # Raise error immediately prior to compilation if no support for C99
-    # _Complex. Doing this here allows FFCx to be used for complex codegen on
-    # Windows.
-    if sys.platform.startswith("win32"):
-        if np.issubdtype(options["scalar_type"], np.complexfloating):
-            raise NotImplementedError("win32 platform does not support C99 _Complex numbers")
-        elif isinstance(options["scalar_type"], str) and "complex" in options["scalar_type"]:
-            raise NotImplementedError("win32 platform does not support C99 _Complex numbers")
-
     # Compile in C17 mode
     if sys.platform.startswith("win32"):
         cffi_base_compile_args = ["-std:c17"]
@@ -348,18 +799,6 @@ def _compile_objects(
 
     cffi_final_compile_args = cffi_base_compile_args + cffi_extra_compile_args
 
-    ffibuilder = cffi.FFI()
-
-    ffibuilder.set_source(
-        module_name,
-        code_body,
-        include_dirs=[ffcx.codegeneration.get_include_path()],
-        extra_compile_args=cffi_final_compile_args,
-        libraries=libraries,
-    )
-
-    ffibuilder.cdef(decl)
-
     c_filename = cache_dir.joinpath(module_name + ".c")
     ready_name = c_filename.with_suffix(".c.cached")
 
@@ -372,17 +811,80 @@ def _compile_objects(
 
     t0 = time.time()
     f = io.StringIO()
-    # Temporarily set root logger handlers to string buffer only
-    # since CFFI logs into root logger
-    old_handlers = root_logger.handlers.copy()
-    root_logger.handlers = [logging.StreamHandler(f)]
-    with redirect_stdout(f):
-        ffibuilder.compile(tmpdir=cache_dir, verbose=True, debug=cffi_debug)
+
+    # Compile the integrals and expressions concurrently, each in its
+    # own translation unit, and link them into the CFFI module
+    extra_objects = []
+    if units is not None:
+        objects, output = ffcx.codegeneration.ccompiler.compile_cached(
+            units[:-1],
+            cache_dir.joinpath("objects"),
+            ffcx.codegeneration.ccompiler.compile_flags(cffi_extra_compile_args, cffi_debug),
+            compile_workers,
+        )
+        f.write(output)
+        extra_objects = [str(obj) for obj in objects]
+        logger.info(f"Compiled translation units in {time.time() - t0:.4f}")
+
+    if backend == "direct":
+        # The header allows C and C++ code to use the library too
+        c_filename.with_suffix(".h").write_text(code_h)
+        c_filename.write_text(code_body)
+        f.write(
+            ffcx.codegeneration.ccompiler.build_shared_library(
+                [c_filename, *map(Path, extra_objects)],
+                _shared_library_path(cache_dir, module_name),
+                ffcx.codegeneration.ccompiler.compile_flags(cffi_extra_compile_args, cffi_debug),
+                libraries,
+            )
+        )
+    else:
+        ffibuilder = cffi.FFI()
+
+        ffibuilder.set_source(
+            module_name,
+            code_body,
+            include_dirs=[ffcx.codegeneration.get_include_path()],
+            extra_compile_args=cffi_final_compile_args,
+            extra_objects=extra_objects,
+            libraries=libraries,
+        )
+
+        ffibuilder.cdef(decl)
+
+        if backend == "setuptools":
+            # Build through setuptools, which logs into the root logger
+            # and prints to stdout, so serialise builds and temporarily
+            # set root logger handlers to string buffer only
+            with _cffi_build_lock:
+                old_handlers = root_logger.handlers.copy()
+                root_logger.handlers = [logging.StreamHandler(f)]
+                try:
+                    with redirect_stdout(f):
+                        ffibuilder.compile(tmpdir=cache_dir, verbose=True, debug=cffi_debug)
+                finally:
+                    # Copy back the original handlers (in case someone is
+                    # logging into root logger and has custom handlers)
+                    root_logger.handlers = old_handlers
+        else:
+            # Run the compiler on the CFFI module source, capturing the
+            # output of this build only
+            ffibuilder.emit_c_code(str(c_filename))
+            f.write(
+                ffcx.codegeneration.ccompiler.build_python_extension(
+                    [c_filename, *map(Path, extra_objects)],
+                    cache_dir.joinpath(module_name + sysconfig.get_config_var("EXT_SUFFIX")),
+                    ffcx.codegeneration.ccompiler.compile_flags(
+                        cffi_extra_compile_args, cffi_debug
+                    ),
+                    libraries,
+                )
+            )
     s = f.getvalue()
     if cffi_verbose:
         print(s)
 
-    logger.info(f"JIT C compiler finished in {time.time() - t0:.4f}")
+    logger.info(f"JIT C compiler ({backend}) finished in {time.time() - t0:.4f}")
 
     # Create a "status ready" file. If this fails, it is an error,
     # because it should not exist yet.
@@ -391,14 +893,75 @@ def _compile_objects(
     fd.write(s)
     fd.close()
 
-    # Copy back the original handlers (in case someone is logging into
-    # root logger and has custom handlers)
-    root_logger.handlers = old_handlers
-
+    if units is not None:
+        return "".join(units)
     return code_body
 
 
-def _load_objects(cache_dir, module_name, object_names):
+def _share_integrals(code: CodeBlocks) -> CodeBlocks:
+    """Rename integrals after a hash of their generated code.
+
+    Integral names depend on the module they are compiled in. Once
+    renamed, identical integrals have identical code, in this and in
+    other modules, and their object files can be shared. Duplicates
+    within the module are dropped.
+    """
+    pre = "".join(c[1] for c in code.file_pre)
+    post = "".join(c[1] for c in code.file_post)
+    names: dict[str, str] = {}
+    integrals = {}
+    for declaration, implementation in code.integrals:
+        match = re.search(r"extern ufcx_integral (\w+);", declaration)
+        assert match is not None
+        name = match.group(1)
+        # The name contains a hash, so also replaces derived symbol names
+        generic = implementation.replace(name, "ffcx_integral_")
+        sig = hashlib.sha1((pre + generic + post).encode("utf-8")).hexdigest()
+        names[name] = f"integral_{sig}"
+        integrals[sig] = (
+            declaration.replace(name, names[name]),
+            generic.replace("ffcx_integral_", names[name]),
+        )
+
+    if not names:
+        return code
+    pattern = re.compile("|".join(names))
+
+    def rename(c: str) -> str:
+        return pattern.sub(lambda m: names[m.group(0)], c)
+
+    forms = [
+        (rename(declaration), rename(implementation)) for declaration, implementation in code.forms
+    ]
+    return code._replace(integrals=list(integrals.values()), forms=forms)
+
+
+class _SharedLibraryModule:
+    """Shared library loaded in CFFI ABI mode, in place of a CFFI module."""
+
+    def __init__(self, name: str, path: Path, decl: str):
+        """Initialise."""
+        self.__name__ = name
+        self.__file__ = str(path)
+        self.ffi = cffi.FFI()
+        self.ffi.cdef(decl)
+        self.lib = self.ffi.dlopen(str(path))
+
+
+def _shared_library_path(cache_dir, module_name):
+    """Return the path of the shared library built by the direct backend."""
+    return Path(cache_dir).joinpath(
+        module_name + ffcx.codegeneration.ccompiler.shared_library_suffix()
+    )
+
+
+def _load_objects(cache_dir, module_name, object_names, decl=None):
+    if decl is not None:
+        compiled_module = _SharedLibraryModule(
+            module_name, _shared_library_path(cache_dir, module_name), decl
+        )
+        return [getattr(compiled_module.lib, name) for name in object_names], compiled_module
+
     # Create module finder that searches the compile path
     finder = importlib.machinery.FileFinder(
         str(cache_dir),
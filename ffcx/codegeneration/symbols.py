@@ -86,9 +86,16 @@ class FFCXBackendSymbols:
         self.entity_local_index = L.Symbol("entity_local_index", dtype=L.DataType.INT)
         self.quadrature_permutation = L.Symbol("quadrature_permutation", dtype=L.DataType.INT)
 
+        # Symbols for the tabulate_action function arguments
+        self.action_output = L.Symbol("y", dtype=L.DataType.SCALAR)
+        self.action_input = L.Symbol("x", dtype=L.DataType.SCALAR)
+
         # Index for loops over coefficient dofs, assumed to never be used in two nested loops.
         self.coefficient_dof_sum_index = L.Symbol("ic", dtype=L.DataType.INT)
 
+        # Index for loops over the cells of a batch in batched kernels.
+        self.batch_cell_index = L.Symbol("ib", dtype=L.DataType.INT)
+
         # Table for chunk of custom quadrature weights (including cell measure scaling).
         self.custom_weights_table = L.Symbol("weights_chunk", dtype=L.DataType.REAL)
 
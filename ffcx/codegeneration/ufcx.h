@@ -11,7 +11,7 @@
 #pragma once
 
 #define UFCX_VERSION_MAJOR 0
-#define UFCX_VERSION_MINOR 10
+#define UFCX_VERSION_MINOR 11
 #define UFCX_VERSION_MAINTENANCE 0
 #define UFCX_VERSION_RELEASE 0
 
@@ -126,6 +126,59 @@ extern "C"
       const uint8_t* restrict quadrature_permutation);
 #endif // __STDC_NO_COMPLEX__
 
+  /// Apply the element matrix of a bilinear form integral to a vector
+  /// with compiled quadrature rule and single precision, without
+  /// tabulating the matrix
+  ///
+  /// Computes y += A x, where A is the tensor tabulated by
+  /// ufcx_tabulate_tensor_float32 for the same arguments.
+  ///
+  /// @param[in,out] y Output vector, indexed by the test function dofs.
+  /// @param[in] x Input vector, indexed by the trial function dofs.
+  ///
+  /// @see ufcx_tabulate_tensor_float32 for the other arguments
+  typedef void(ufcx_tabulate_action_float32)(
+      float* restrict y, const float* restrict x, const float* restrict w,
+      const float* restrict c, const float* restrict coordinate_dofs,
+      const int* restrict entity_local_index,
+      const uint8_t* restrict quadrature_permutation);
+
+  /// Apply the element matrix of a bilinear form integral to a vector
+  /// with compiled quadrature rule and double precision
+  ///
+  /// @see ufcx_tabulate_action_float32
+  typedef void(ufcx_tabulate_action_float64)(
+      double* restrict y, const double* restrict x, const double* restrict w,
+      const double* restrict c, const double* restrict coordinate_dofs,
+      const int* restrict entity_local_index,
+      const uint8_t* restrict quadrature_permutation);
+
+#ifndef __STDC_NO_COMPLEX__
+  /// Apply the element matrix of a bilinear form integral to a vector
+  /// with compiled quadrature rule and complex single precision
+  ///
+  /// @see ufcx_tabulate_action_float32
+  typedef void(ufcx_tabulate_action_complex64)(
+      float _Complex* restrict y, const float _Complex* restrict x,
+      const float _Complex* restrict w, const float _Complex* restrict c,
+      const float* restrict coordinate_dofs,
+      const int* restrict entity_local_index,
+      const uint8_t* restrict quadrature_permutation);
+#endif // __STDC_NO_COMPLEX__
+
+#ifndef __STDC_NO_COMPLEX__
+  /// Apply the element matrix of a bilinear form integral to a vector
+  /// with compiled quadrature rule and complex double precision
+  ///
+  /// @see ufcx_tabulate_action_float32
+  typedef void(ufcx_tabulate_action_complex128)(
+      double _Complex* restrict y, const double _Complex* restrict x,
+      const double _Complex* restrict w, const double _Complex* restrict c,
+      const double* restrict coordinate_dofs,
+      const int* restrict entity_local_index,
+      const uint8_t* restrict quadrature_permutation);
+#endif // __STDC_NO_COMPLEX__
+
   typedef struct ufcx_integral
   {
     const bool* enabled_coefficients;
@@ -141,6 +194,37 @@ extern "C"
     uint64_t coordinate_element_hash;
 
     uint8_t domain;
+
+    // The members below were added in UFCx 0.11. Code using them must
+    // check UFCX_VERSION_MAJOR and UFCX_VERSION_MINOR.
+
+    /// Number of cells tabulated by each call of the batched kernels,
+    /// or 0 if they are not generated.
+    int batch_size;
+
+    /// Tabulate integral into the tensors A of batch_size cells.
+    ///
+    /// The arguments are those of the single cell kernels, with the
+    /// values of the cells of the batch interleaved in A, w,
+    /// coordinate_dofs, entity_local_index and quadrature_permutation:
+    /// value i of cell b is at index i * batch_size + b. The constants c
+    /// are shared by all cells. Incomplete batches must be padded, e.g.
+    /// by repeating a cell.
+    ufcx_tabulate_tensor_float32* tabulate_tensor_batch_float32;
+    ufcx_tabulate_tensor_float64* tabulate_tensor_batch_float64;
+#ifndef __STDC_NO_COMPLEX__
+    ufcx_tabulate_tensor_complex64* tabulate_tensor_batch_complex64;
+    ufcx_tabulate_tensor_complex128* tabulate_tensor_batch_complex128;
+#endif // __STDC_NO_COMPLEX__
+
+    /// Apply the element matrix of a bilinear form integral to a vector,
+    /// or NULL if not generated.
+    ufcx_tabulate_action_float32* tabulate_action_float32;
+    ufcx_tabulate_action_float64* tabulate_action_float64;
+#ifndef __STDC_NO_COMPLEX__
+    ufcx_tabulate_action_complex64* tabulate_action_complex64;
+    ufcx_tabulate_action_complex128* tabulate_action_complex128;
+#endif // __STDC_NO_COMPLEX__
   } ufcx_integral;
 
   typedef struct ufcx_expression
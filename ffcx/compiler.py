@@ -72,8 +72,9 @@ from time import time
 import numpy.typing as npt
 
 from ffcx.analysis import analyze_ufl_objects
-from ffcx.codegeneration.codegeneration import generate_code
+from ffcx.codegeneration.codegeneration import CodeBlocks, generate_code
 from ffcx.formatting import format_code
+from ffcx.ir.elementtables import table_memo_info
 from ffcx.ir.representation import compute_ir
 
 logger = logging.getLogger("ffcx")
@@ -83,6 +84,18 @@ def _print_timing(stage: int, timing: float):
     logger.info(f"Compiler stage {stage} finished in {timing:.4f} seconds.")
 
 
+def _print_table_reuse(before, after):
+    hits = after.hits - before.hits
+    misses = after.misses - before.misses
+    loads = after.loads - before.loads
+    total = hits + misses + loads
+    if total > 0:
+        logger.info(
+            f"Basis function tables: {hits} of {total} reused ({100 * hits / total:.0f}%), "
+            f"{loads} loaded, {misses} tabulated."
+        )
+
+
 def compile_ufl_objects(
     ufl_objects: list[typing.Any],
     options: dict[str, int | float | npt.DTypeLike],
@@ -100,6 +113,27 @@ def compile_ufl_objects(
         options: Options
         visualise: Toggle visualisation
     """
+    code = generate_code_blocks(ufl_objects, options, object_names, prefix, visualise)
+
+    # Stage 4: format code
+    cpu_time = time()
+    code_h, code_c = format_code(code)
+    _print_timing(4, time() - cpu_time)
+
+    return code_h, code_c
+
+
+def generate_code_blocks(
+    ufl_objects: list[typing.Any],
+    options: dict[str, int | float | npt.DTypeLike],
+    object_names: dict[int, str] | None = None,
+    prefix: str | None = None,
+    visualise: bool = False,
+) -> CodeBlocks:
+    """Run compiler stages 1-3, returning the unformatted code blocks.
+
+    See :func:`compile_ufl_objects` for the arguments.
+    """
     _object_names = object_names if object_names is not None else {}
     _prefix = prefix if prefix is not None else ""
 
@@ -110,17 +144,14 @@ def compile_ufl_objects(
 
     # Stage 2: intermediate representation
     cpu_time = time()
+    tables = table_memo_info()
     ir = compute_ir(analysis, _object_names, _prefix, options, visualise)
     _print_timing(2, time() - cpu_time)
+    _print_table_reuse(tables, table_memo_info())
 
     # Stage 3: code generation
     cpu_time = time()
     code = generate_code(ir, options)
     _print_timing(3, time() - cpu_time)
 
-    # Stage 4: format code
-    cpu_time = time()
-    code_h, code_c = format_code(code)
-    _print_timing(4, time() - cpu_time)
-
-    return code_h, code_c
+    return code
@@ -43,12 +43,34 @@ def map_facet_points(
 ) -> npt.NDArray[np.float64]:
     """Map points from a reference facet to a physical facet."""
     geom = np.asarray(basix.geometry(_CellType[cellname]))
-    facet_vertices = [geom[i] for i in basix.topology(_CellType[cellname])[-2][facet]]
-    return np.asarray(
-        [
-            facet_vertices[0]
-            + sum((i - facet_vertices[0]) * j for i, j in zip(facet_vertices[1:], p))
-            for p in points
-        ],
-        dtype=np.float64,
-    )
+    facet_vertices = geom[basix.topology(_CellType[cellname])[-2][facet]]
+    points = np.asarray(points)
+    # Accumulate one reference direction at a time, in the same order
+    # of operations as summing over the coordinates of each point
+    mapped = np.zeros((points.shape[0], geom.shape[1]), dtype=np.float64)
+    for i, j in zip(facet_vertices[1:], points.T):
+        mapped = mapped + (i - facet_vertices[0]) * j[:, np.newaxis]
+    return np.asarray(facet_vertices[0] + mapped, dtype=np.float64)
+
+
+def facet_tensor_directions(cellname: str) -> list[tuple[list[int], int, float]]:
+    """Get the reference directions of the facets of a quadrilateral or hexahedron.
+
+    Returns:
+        For each facet, the reference directions along the coordinates
+        of the reference facet, the direction normal to the facet and
+        the coordinate of the facet in the normal direction.
+    """
+    geom = np.asarray(basix.geometry(_CellType[cellname]))
+    tdim = geom.shape[1]
+    directions = []
+    for facet in basix.topology(_CellType[cellname])[-2]:
+        facet_vertices = geom[facet]
+        tangents = []
+        for v in facet_vertices[1:tdim]:
+            (i,) = np.flatnonzero(v - facet_vertices[0])
+            assert np.isclose(v[i] - facet_vertices[0][i], 1.0)
+            tangents.append(int(i))
+        (normal,) = set(range(tdim)) - set(tangents)
+        directions.append((tangents, normal, float(facet_vertices[0][normal])))
+    return directions
@@ -38,6 +38,25 @@ def format_code(code: CodeBlocks) -> tuple[str, str]:
     return code_h, code_c
 
 
+def format_code_units(code: CodeBlocks) -> list[str]:
+    """Format given code as separate C translation units.
+
+    Each integral and each expression is put in its own unit, which can
+    be compiled independently. The last unit holds the forms, which refer
+    to the integrals through their declarations.
+    """
+    logger.info(79 * "*")
+    logger.info("Compiler stage 5: Formatting code as separate translation units")
+    logger.info(79 * "*")
+
+    pre = "".join(c[1] for c in code.file_pre)
+    post = "".join(c[1] for c in code.file_post)
+    units = [pre + c[1] + post for c in code.integrals + code.expressions]
+    integral_declarations = "".join(c[0] for c in code.integrals)
+    units.append(pre + integral_declarations + "".join(c[1] for c in code.forms) + post)
+    return units
+
+
 def write_code(code_h, code_c, prefix, output_dir):
     """Write code to files."""
     _write_file(code_h, prefix, ".h", output_dir)
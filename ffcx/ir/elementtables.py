@@ -5,15 +5,23 @@
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 """Tools for precomputed tables of terminal values."""
 
+import bisect
+import functools
+import hashlib
 import logging
+import os
+import threading
 import typing
+from pathlib import Path
 
 import basix.ufl
 import numpy as np
 import numpy.typing as npt
 import ufl
 
-from ffcx.element_interface import basix_index
+import ffcx.naming
+from ffcx.cacheutils import LRUMemo, atomic_path
+from ffcx.element_interface import basix_index, facet_tensor_directions
 from ffcx.ir.representationutils import (
     create_quadrature_points_and_weights,
     integral_type_to_entity_dim,
@@ -29,6 +37,10 @@ default_atol = 1e-9
 piecewise_ttypes = ("piecewise", "fixed", "ones", "zeros")
 uniform_ttypes = ("fixed", "ones", "zeros", "uniform")
 
+# Environment variable with a directory in which tabulated basis
+# functions are stored between processes
+TABLE_CACHE_VARIABLE = "FFCX_TABLE_CACHE_DIR"
+
 
 class ModifiedTerminalElement(typing.NamedTuple):
     """Modified terminal element."""
@@ -65,6 +77,89 @@ def equal_tables(a, b, rtol=default_rtol, atol=default_atol):
         return np.allclose(a, b, rtol=rtol, atol=atol)
 
 
+class TableIndex:
+    """Index of tables, for finding tables equal to a given table.
+
+    Tables are grouped by shape and sorted by a weighted sum of their
+    values, with fixed weights in [0.5, 1]. Two tables that are equal
+    within rtol and atol (in the sense of np.allclose) have weighted sums
+    differing by at most atol * size + rtol * sum(abs(table)), so only
+    the tables in that window of the sorted sums are candidates.
+    This keeps deduplication of many tables near-linear instead of
+    comparing each new table with every existing one.
+    """
+
+    def __init__(self, rtol=default_rtol, atol=default_atol):
+        """Initialise."""
+        self.rtol = rtol
+        self.atol = atol
+        self._groups: dict[tuple[int, ...], tuple[list, list]] = {}
+        self._max_abs_sum: dict[tuple[int, ...], float] = {}
+        self._entries: dict[typing.Any, tuple[float, int, typing.Any]] = {}
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Return the number of tables."""
+        return len(self._entries)
+
+    def add(self, key, table):
+        """Add a table, or replace the table stored under key."""
+        table = np.asarray(table)
+        if key in self._entries:
+            order = self.remove(key)
+        else:
+            order = self._count
+            self._count += 1
+        projection = self._project(table)
+        sums, entries = self._groups.setdefault(table.shape, ([], []))
+        i = bisect.bisect(sums, projection)
+        sums.insert(i, projection)
+        entries.insert(i, (order, key, table))
+        self._entries[key] = (projection, order, table.shape)
+        abs_sum = float(np.abs(table).sum())
+        self._max_abs_sum[table.shape] = max(self._max_abs_sum.get(table.shape, 0.0), abs_sum)
+
+    def remove(self, key) -> int:
+        """Remove the table stored under key, returning its insertion order."""
+        projection, order, shape = self._entries.pop(key)
+        sums, entries = self._groups[shape]
+        i = bisect.bisect_left(sums, projection)
+        while entries[i][1] != key:
+            i += 1
+        del sums[i], entries[i]
+        return order
+
+    def candidates(self, table) -> list[tuple[typing.Any, npt.NDArray]]:
+        """Return (key, table) of the tables that may equal table, oldest first."""
+        table = np.asarray(table)
+        group = self._groups.get(table.shape)
+        if group is None:
+            return []
+        sums, entries = group
+        projection = self._project(table)
+        abs_sum = max(float(np.abs(table).sum()), self._max_abs_sum[table.shape])
+        # Bound on the difference of the sums of equal tables, and on the
+        # rounding error of computing them
+        window = self.atol * table.size + self.rtol * abs_sum
+        window += 4 * table.size * np.finfo(np.float64).eps * (abs(projection) + abs_sum)
+        lo = bisect.bisect_left(sums, projection - window)
+        hi = bisect.bisect_right(sums, projection + window)
+        return [(key, values) for _, key, values in sorted(entries[lo:hi], key=lambda e: e[0])]
+
+    @staticmethod
+    def _project(table) -> float:
+        """Return the weighted sum of the values of a table."""
+        return float(np.dot(_projection_weights(table.size), table.ravel()))
+
+
+@functools.cache
+def _projection_weights(size: int) -> npt.NDArray[np.float64]:
+    """Return the weights used by TableIndex for tables of a given size."""
+    weights = np.random.default_rng(size).uniform(0.5, 1.0, size)
+    weights.flags.writeable = False
+    return weights
+
+
 def clamp_table_small_numbers(
     table, rtol=default_rtol, atol=default_atol, numbers=(-1.0, 0.0, 1.0)
 ):
@@ -76,6 +171,131 @@ def clamp_table_small_numbers(
     return table
 
 
+class TableMemoInfo(typing.NamedTuple):
+    """Statistics of the memo of tabulated basis functions."""
+
+    hits: int
+    misses: int
+    loads: int
+    maxsize: int
+    currsize: int
+
+
+class _TableMemo:
+    """Size-bounded LRU of basis functions tabulated by Basix.
+
+    Entries are keyed on the element, the number of derivatives and a
+    digest of the points, so tables are shared between entities, integrals,
+    forms and compilations that evaluate an element at the same points.
+    Stored arrays are read-only. Tables are also stored in a directory,
+    if set, to be loaded by other processes.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        """Initialise."""
+        self.memo = LRUMemo(maxsize)
+        self.directory: Path | None = None
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def tabulate(self, element, nderivs: int, points: npt.NDArray[np.float64]):
+        """Tabulate an element and its derivatives, reusing earlier results."""
+        element_key = _element_key(element)
+        if element_key is None or self.memo.maxsize <= 0:
+            return element.tabulate(nderivs, points)
+        key = (element_key, nderivs, ffcx.naming.points_signature(points))
+        table = self.memo.get(key)
+        if table is not None:
+            return table
+
+        path = self._path(key)
+        if path is not None:
+            try:
+                table = np.load(path)
+            except (OSError, ValueError):
+                pass
+        if table is None:
+            table = np.asarray(element.tabulate(nderivs, points))
+            if path is not None:
+                path.parent.mkdir(exist_ok=True, parents=True)
+                with atomic_path(path) as tmp, open(tmp, "wb") as f:
+                    np.save(f, table)
+        else:
+            with self._lock:
+                self.loads += 1
+        table.flags.writeable = False
+        self.memo.put(key, table)
+        return table
+
+    def _path(self, key) -> Path | None:
+        """Return the file holding the table stored under key, if persistent."""
+        directory = self.directory
+        if directory is None and os.environ.get(TABLE_CACHE_VARIABLE):
+            directory = Path(os.environ[TABLE_CACHE_VARIABLE])
+        if directory is None:
+            return None
+        # Tables may change between Basix versions
+        digest = hashlib.sha1(f"{basix.__version__} {key!r}".encode()).hexdigest()
+        return directory.joinpath(f"{digest}.npy")
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self.memo.clear()
+            self.loads = 0
+
+    def info(self) -> TableMemoInfo:
+        """Return memo statistics.
+
+        Tables loaded from the directory are counted as loads, not misses.
+        """
+        with self._lock:
+            info = self.memo.info()
+            return TableMemoInfo(
+                info.hits, info.misses - self.loads, self.loads, info.maxsize, info.currsize
+            )
+
+
+def _element_key(element) -> tuple | None:
+    """Return a key identifying the tabulation of an element, if it has one."""
+    if isinstance(element, basix.ufl._ComponentElement):
+        key = _element_key(element._element)
+        return None if key is None else (key, element._component)
+    basix_hash = element.basix_hash()
+    return None if basix_hash is None else (type(element).__name__, basix_hash)
+
+
+_table_memo = _TableMemo()
+
+
+def table_memo_info() -> TableMemoInfo:
+    """Return hit/miss statistics of the memo of tabulated basis functions.
+
+    Misses count tabulations by Basix, loads count tables read from the
+    directory set with :func:`set_table_memo_dir`.
+    """
+    return _table_memo.info()
+
+
+def clear_table_memo():
+    """Forget all tabulated basis functions held in memory."""
+    _table_memo.clear()
+
+
+def set_table_memo_size(maxsize: int):
+    """Set the maximum number of tables held in memory (0 disables the memo)."""
+    _table_memo.memo.resize(maxsize)
+
+
+def set_table_memo_dir(directory: str | os.PathLike | None):
+    """Store tabulated basis functions in a directory, shared between processes.
+
+    None (the default) falls back to the directory in the
+    ``FFCX_TABLE_CACHE_DIR`` environment variable, if set.
+    """
+    _table_memo.directory = None if directory is None else Path(directory)
+
+
 def get_ffcx_table_values(
     points,
     cell,
@@ -89,9 +309,14 @@ def get_ffcx_table_values(
 ):
     """Extract values from FFCx element table.
 
-    Returns a 3D numpy array with axes
-    (entity number, quadrature point number, dof number)
+    points is an array of points, or a list of arrays holding the points
+    of each permutation of the quadrature rule.
+
+    Returns a 4D numpy array with axes
+    (permutation number, entity number, quadrature point number, dof number)
     """
+    point_sets = points if isinstance(points, list) else [points]
+    num_perms = len(point_sets)
     deriv_order = sum(derivative_counts)
 
     if integral_type in ufl.custom_integral_types:
@@ -132,26 +357,31 @@ def get_ffcx_table_values(
             points, weights = create_quadrature_points_and_weights(
                 integral_type, cell, element.embedded_superdegree(), "default", [element]
             )
+        point_sets = [points] * num_perms
 
-    # Tabulate table of basis functions and derivatives in points for each entity
+    # Tabulate table of basis functions and derivatives in points for each
+    # permutation and entity
     tdim = cell.topological_dimension()
     entity_dim = integral_type_to_entity_dim(integral_type, tdim)
     num_entities = cell.num_sub_entities(entity_dim)
 
+    all_points = []
+    for perm_points in point_sets:
+        for entity in range(num_entities):
+            if codim == 0:
+                all_points.append(map_integral_points(perm_points, integral_type, cell, entity))
+            elif codim == 1:
+                all_points.append(np.asarray(perm_points))
+            else:
+                raise RuntimeError("Codimension > 1 isn't supported.")
+
     # Extract arrays for the right scalar component
-    component_tables = []
     component_element, offset, stride = element.get_component_element(flat_component)
-
-    for entity in range(num_entities):
-        if codim == 0:
-            entity_points = map_integral_points(points, integral_type, cell, entity)
-        elif codim == 1:
-            entity_points = points
-        else:
-            raise RuntimeError("Codimension > 1 isn't supported.")
-        tbl = component_element.tabulate(deriv_order, entity_points)
-        tbl = tbl[basix_index(derivative_counts)]
-        component_tables.append(tbl)
+    derivative_index = basix_index(derivative_counts)
+    component_tables = [
+        _table_memo.tabulate(component_element, deriv_order, entity_points)[derivative_index]
+        for entity_points in all_points
+    ]
 
     if avg in ("cell", "facet"):
         # Compute numeric integral of the each component table
@@ -162,14 +392,15 @@ def get_ffcx_table_values(
             tbl = np.reshape(tbl, (1, num_dofs))
             component_tables[entity] = tbl
 
-    # Loop over entities and fill table blockwise (each block = points x dofs)
-    # Reorder axes as (points, dofs) instead of (dofs, points)
-    assert len(component_tables) == num_entities
+    # Loop over permutations and entities and fill table blockwise (each
+    # block = points x dofs)
+    assert len(component_tables) == num_perms * num_entities
     num_points, num_dofs = component_tables[0].shape
-    shape = (1, num_entities, num_points, num_dofs)
+    shape = (num_perms, num_entities, num_points, num_dofs)
     res = np.zeros(shape)
-    for entity in range(num_entities):
-        res[:, entity, :, :] = component_tables[entity]
+    for perm in range(num_perms):
+        for entity in range(num_entities):
+            res[perm, entity, :, :] = component_tables[perm * num_entities + entity]
 
     return {"array": res, "offset": offset, "stride": stride}
 
@@ -255,43 +486,71 @@ def get_modified_terminal_element(mt) -> typing.Optional[ModifiedTerminalElement
 def permute_quadrature_interval(points, reflections=0):
     """Permute quadrature points for an interval."""
     output = points.copy()
-    for p in output:
-        assert len(p) < 2 or np.isclose(p[1], 0)
-        assert len(p) < 3 or np.isclose(p[2], 0)
+    assert output.shape[1] < 2 or np.isclose(output[:, 1], 0).all()
+    assert output.shape[1] < 3 or np.isclose(output[:, 2], 0).all()
     for _ in range(reflections):
-        for n, p in enumerate(output):
-            output[n] = [1 - p[0]]
+        output[:] = 1 - output[:, :1]
     return output
 
 
 def permute_quadrature_triangle(points, reflections=0, rotations=0):
     """Permute quadrature points for a triangle."""
     output = points.copy()
-    for p in output:
-        assert len(p) < 3 or np.isclose(p[2], 0)
+    assert output.shape[1] < 3 or np.isclose(output[:, 2], 0).all()
     for _ in range(rotations):
-        for n, p in enumerate(output):
-            output[n] = [p[1], 1 - p[0] - p[1]]
+        output[:] = np.stack([output[:, 1], 1 - output[:, 0] - output[:, 1]], axis=1)
     for _ in range(reflections):
-        for n, p in enumerate(output):
-            output[n] = [p[1], p[0]]
+        output[:] = output[:, [1, 0]]
     return output
 
 
 def permute_quadrature_quadrilateral(points, reflections=0, rotations=0):
     """Permute quadrature points for a quadrilateral."""
     output = points.copy()
-    for p in output:
-        assert len(p) < 3 or np.isclose(p[2], 0)
+    assert output.shape[1] < 3 or np.isclose(output[:, 2], 0).all()
     for _ in range(rotations):
-        for n, p in enumerate(output):
-            output[n] = [p[1], 1 - p[0]]
+        output[:] = np.stack([output[:, 1], 1 - output[:, 0]], axis=1)
     for _ in range(reflections):
-        for n, p in enumerate(output):
-            output[n] = [p[1], p[0]]
+        output[:] = output[:, [1, 0]]
     return output
 
 
+def get_facet_tensor_factors(
+    cellname: str,
+    factors: list[basix.finite_element.FiniteElement],
+    quadrature_rule,
+    local_derivatives: tuple[int, ...],
+) -> list[npt.NDArray[np.float64]]:
+    """Tabulate the factors of a tensor product element on the facets of a cell.
+
+    The factors are tabulated in the reference directions of each facet:
+    one table for each coordinate of the reference facet, at the points
+    of the quadrature rule in that coordinate, and a last table in the
+    direction normal to the facet, at the facet.
+
+    Args:
+        cellname: Name of the cell (quadrilateral or hexahedron).
+        factors: The element in each reference direction of the cell.
+        quadrature_rule: Tensor product quadrature rule on the facets.
+        local_derivatives: Number of derivatives in each reference direction.
+
+    Returns:
+        Tables with shape (1, num_facets, num_points, num_dofs).
+    """
+    directions = facet_tensor_directions(cellname)
+
+    def tabulate(i, points):
+        d = local_derivatives[i]
+        return factors[i].tabulate(d, np.asarray(points, dtype=np.float64))[d, :, :, 0]
+
+    tables = [
+        [tabulate(tangents[j], points) for tangents, _, _ in directions]
+        for j, (points, _) in enumerate(quadrature_rule.tensor_factors)
+    ]
+    tables.append([tabulate(normal, [[x]]) for _, normal, x in directions])
+    return [np.array(t)[np.newaxis] for t in tables]
+
+
 def build_optimized_tables(
     quadrature_rule,
     cell,
@@ -331,8 +590,11 @@ def build_optimized_tables(
     mt_tables = {}
 
     _existing_tables = existing_tables.copy()
+    table_index = TableIndex()
+    for table_name, existing_table in _existing_tables.items():
+        table_index.add(table_name, existing_table)
 
-    all_tensor_factors = []
+    all_tensor_factors = TableIndex(rtol=1e-5, atol=1e-8)
     tensor_n = 0
 
     for mt in modified_terminals:
@@ -364,94 +626,39 @@ def build_optimized_tables(
         # the codim zero element in mixed-dimensional integrals. The latter is
         # needed because a cell may see its sub-entities as being oriented
         # differently to their global orientation
+        points = quadrature_rule.points
         if integral_type == "interior_facet" or (is_mixed_dim and codim == 0):
             if tdim == 1 or codim == 1:
                 # Do not add permutations if codim-1 as facets have already gotten a global
                 # orientation in DOLFINx
-                t = get_ffcx_table_values(
-                    quadrature_rule.points,
-                    cell,
-                    integral_type,
-                    element,
-                    avg,
-                    entity_type,
-                    local_derivatives,
-                    flat_component,
-                    codim,
-                )
+                pass
             elif tdim == 2:
-                new_table = []
-                for ref in range(2):
-                    new_table.append(
-                        get_ffcx_table_values(
-                            permute_quadrature_interval(quadrature_rule.points, ref),
-                            cell,
-                            integral_type,
-                            element,
-                            avg,
-                            entity_type,
-                            local_derivatives,
-                            flat_component,
-                            codim,
-                        )
-                    )
-
-                t = new_table[0]
-                t["array"] = np.vstack([td["array"] for td in new_table])
+                points = [permute_quadrature_interval(points, ref) for ref in range(2)]
             elif tdim == 3:
                 cell_type = cell.cellname()
                 if cell_type == "tetrahedron":
-                    new_table = []
-                    for rot in range(3):
-                        for ref in range(2):
-                            new_table.append(
-                                get_ffcx_table_values(
-                                    permute_quadrature_triangle(quadrature_rule.points, ref, rot),
-                                    cell,
-                                    integral_type,
-                                    element,
-                                    avg,
-                                    entity_type,
-                                    local_derivatives,
-                                    flat_component,
-                                    codim,
-                                )
-                            )
-                    t = new_table[0]
-                    t["array"] = np.vstack([td["array"] for td in new_table])
+                    points = [
+                        permute_quadrature_triangle(points, ref, rot)
+                        for rot in range(3)
+                        for ref in range(2)
+                    ]
                 elif cell_type == "hexahedron":
-                    new_table = []
-                    for rot in range(4):
-                        for ref in range(2):
-                            new_table.append(
-                                get_ffcx_table_values(
-                                    permute_quadrature_quadrilateral(
-                                        quadrature_rule.points, ref, rot
-                                    ),
-                                    cell,
-                                    integral_type,
-                                    element,
-                                    avg,
-                                    entity_type,
-                                    local_derivatives,
-                                    flat_component,
-                                    codim,
-                                )
-                            )
-                    t = new_table[0]
-                    t["array"] = np.vstack([td["array"] for td in new_table])
-        else:
-            t = get_ffcx_table_values(
-                quadrature_rule.points,
-                cell,
-                integral_type,
-                element,
-                avg,
-                entity_type,
-                local_derivatives,
-                flat_component,
-                codim,
-            )
+                    points = [
+                        permute_quadrature_quadrilateral(points, ref, rot)
+                        for rot in range(4)
+                        for ref in range(2)
+                    ]
+        t = get_ffcx_table_values(
+            points,
+            cell,
+            integral_type,
+            element,
+            avg,
+            entity_type,
+            local_derivatives,
+            flat_component,
+            codim,
+        )
         # Clean up table
         tbl = clamp_table_small_numbers(t["array"], rtol=rtol, atol=atol)
         tabletype = analyse_table_type(tbl)
@@ -469,15 +676,16 @@ def build_optimized_tables(
 
         # Check for existing identical table
         new_table = True
-        for table_name in _existing_tables:
-            if equal_tables(tbl, _existing_tables[table_name]):
+        for table_name, existing_table in table_index.candidates(tbl):
+            if equal_tables(tbl, existing_table):
                 name = table_name
-                tbl = _existing_tables[name]
+                tbl = existing_table
                 new_table = False
                 break
 
         if new_table:
             _existing_tables[name] = tbl
+            table_index.add(name, tbl)
 
         cell_offset = 0
 
@@ -486,6 +694,7 @@ def build_optimized_tables(
 
         tensor_factors = None
         tensor_perm = None
+        sub_tables = None
         if (
             use_sum_factorization
             and element.has_tensor_product_factorisation
@@ -493,16 +702,32 @@ def build_optimized_tables(
             and quadrature_rule.has_tensor_factors
         ):
             factors = element.get_tensor_product_representation()
+            if integral_type == "cell":
+                sub_tables = []
+                for i, j in enumerate(factors[0]):
+                    pts = quadrature_rule.tensor_factors[i][0]
+                    d = local_derivatives[i]
+                    sub_tbl = j.tabulate(d, pts)[d]
+                    sub_tables.append(sub_tbl.reshape(1, 1, sub_tbl.shape[0], sub_tbl.shape[1]))
+            elif (
+                integral_type == "exterior_facet"
+                and not isinstance(mt.terminal, ufl.classes.Argument)
+                and tabletype not in piecewise_ttypes
+                and len({j.dim for j in factors[0]}) == 1
+            ):
+                # Arguments keep the full tables, only coefficients and
+                # the geometry are evaluated by sum factorisation on
+                # facets
+                sub_tables = get_facet_tensor_factors(
+                    cell.cellname(), factors[0], quadrature_rule, local_derivatives
+                )
 
+        if sub_tables is not None:
             tensor_factors = []
-            for i, j in enumerate(factors[0]):
-                pts = quadrature_rule.tensor_factors[i][0]
-                d = local_derivatives[i]
-                sub_tbl = j.tabulate(d, pts)[d]
-                sub_tbl = sub_tbl.reshape(1, 1, sub_tbl.shape[0], sub_tbl.shape[1])
-                for i in all_tensor_factors:
-                    if i.values.shape == sub_tbl.shape and np.allclose(i.values, sub_tbl):
-                        tensor_factors.append(i)
+            for sub_tbl in sub_tables:
+                for factor_name, values in all_tensor_factors.candidates(sub_tbl):
+                    if np.allclose(values, sub_tbl):
+                        tensor_factors.append(mt_tables[factor_name])
                         break
                 else:
                     ut = UniqueTableReferenceT(
@@ -518,7 +743,7 @@ def build_optimized_tables(
                         None,
                         None,
                     )
-                    all_tensor_factors.append(ut)
+                    all_tensor_factors.add(ut.name, sub_tbl)
                     tensor_factors.append(ut)
                     mt_tables[ut.name] = ut
                     tensor_n += 1
@@ -20,7 +20,9 @@ from ffcx.ir.analysis.factorization import compute_argument_factorization
 from ffcx.ir.analysis.graph import build_scalar_graph
 from ffcx.ir.analysis.modified_terminals import analyse_modified_terminal, is_modified_terminal
 from ffcx.ir.analysis.visualise import visualise_graph
-from ffcx.ir.elementtables import UniqueTableReferenceT, build_optimized_tables
+from ffcx.ir.elementtables import TableIndex, UniqueTableReferenceT, build_optimized_tables
+from ffcx.ir.referencetensor import compute_reference_tensors, integrate_tables
+from ffcx.ir.representationutils import QuadratureRule
 
 logger = logging.getLogger("ffcx")
 
@@ -42,8 +44,10 @@ class BlockDataT(typing.NamedTuple):
     restrictions: tuple[str, ...]  # restriction "+" | "-" | None for each block rank
     transposed: bool  # block is the transpose of another
     is_uniform: bool
-    ma_data: tuple[ModifiedArgumentDataT, ...]  # used in "full", "safe" and "partial"
+    ma_data: tuple[ModifiedArgumentDataT, ...]  # used in "premultiplied" and "partial"
     is_permuted: bool  # Do quad points on facets need to be permuted?
+    block_mode: str  # "preintegrated" | "premultiplied" | "partial"
+    name: str | None  # name of the table of a "preintegrated" block
 
 
 def compute_integral_ir(cell, integral_type, entity_type, integrands, argument_shape, p, visualise):
@@ -246,16 +250,62 @@ def compute_integral_ir(cell, integral_type, entity_type, integrands, argument_s
                     block_is_uniform,
                     tuple(ma_data),
                     block_is_permuted,
+                    "partial",
+                    None,
                 )
 
                 # Insert in expr_ir for this quadrature loop
                 block_contributions[blockmap].append(blockdata)
 
-            # Figure out which table names are referenced
+            # Precompute the reference tensors of the tensor representation
+            reference_tensors = None
+            if p["representation"] == "tensor":
+                reference = compute_reference_tensors(
+                    F,
+                    block_contributions,
+                    quadrature_rule,
+                    integral_type,
+                    max_size=p["reference_tensor_max_size"],
+                    rtol=p["table_rtol"],
+                    atol=p["table_atol"],
+                )
+                if reference is None:
+                    logger.info("Integrand has no tensor representation, using quadrature.")
+                else:
+                    reference_tensors, reference_tables = reference
+                    tables.update(reference_tables)
+                    table_types.update({name: "reference" for name in reference_tables})
+
+            # Choose how to integrate the blocks in the quadrature representation
+            if reference_tensors is None:
+                # Tables of pre-integrated blocks and premultiplied arguments
+                block_tables = {
+                    prefix: TableIndex(p["table_rtol"], p["table_atol"]) for prefix in ("PI", "PM")
+                }
+                for contributions in block_contributions.values():
+                    contributions[:] = [
+                        set_block_mode(
+                            blockdata,
+                            integral_type,
+                            quadrature_rule,
+                            tables,
+                            table_types,
+                            block_tables,
+                            p["preintegration_max_size"],
+                            p["premultiplication_max_size"],
+                        )
+                        for blockdata in contributions
+                    ]
+
+            # Figure out which table names are referenced. With reference
+            # tensors, only piecewise values are computed from tables.
+            active_status = (
+                ("piecewise",) if reference_tensors is not None else ("piecewise", "varying")
+            )
             active_table_names = set()
             for i, v in F.nodes.items():
                 tr = v.get("tr")
-                if tr is not None and F.nodes[i]["status"] != "inactive":
+                if tr is not None and F.nodes[i]["status"] in active_status:
                     if tr.has_tensor_factorisation:
                         for t in tr.tensor_factors:
                             active_table_names.add(t.name)
@@ -263,14 +313,20 @@ def compute_integral_ir(cell, integral_type, entity_type, integrands, argument_s
                         active_table_names.add(tr.name)
 
             # Figure out which table names are referenced in blocks
-            for blockmap, contributions in itertools.chain(block_contributions.items()):
-                for blockdata in contributions:
-                    for mad in blockdata.ma_data:
-                        if mad.tabledata.has_tensor_factorisation:
-                            for t in mad.tabledata.tensor_factors:
-                                active_table_names.add(t.name)
-                        else:
-                            active_table_names.add(mad.tabledata.name)
+            if reference_tensors is not None:
+                active_table_names.update(rt.name for rt in reference_tensors)
+            else:
+                for blockmap, contributions in itertools.chain(block_contributions.items()):
+                    for blockdata in contributions:
+                        if blockdata.block_mode == "preintegrated":
+                            active_table_names.add(blockdata.name)
+                            continue
+                        for mad in blockdata.ma_data:
+                            if mad.tabledata.has_tensor_factorisation:
+                                for t in mad.tabledata.tensor_factors:
+                                    active_table_names.add(t.name)
+                            else:
+                                active_table_names.add(mad.tabledata.name)
 
             active_tables = {}
             active_table_types = {}
@@ -290,6 +346,7 @@ def compute_integral_ir(cell, integral_type, entity_type, integrands, argument_s
                 "factorization": F,
                 "modified_arguments": [F.nodes[i]["mt"] for i in argkeys],
                 "block_contributions": block_contributions,
+                "reference_tensors": reference_tensors,
             }
 
             restrictions = [i.restriction for i in initial_terminals.values()]
@@ -301,6 +358,138 @@ def compute_integral_ir(cell, integral_type, entity_type, integrands, argument_s
     return ir
 
 
+def set_block_mode(
+    blockdata: BlockDataT,
+    integral_type: str,
+    quadrature_rule: QuadratureRule,
+    tables: dict[str, np.ndarray],
+    table_types: dict[str, str],
+    block_tables: dict[str, TableIndex],
+    preintegration_max_size: int,
+    premultiplication_max_size: int,
+) -> BlockDataT:
+    """Set how a block of the element tensor is integrated.
+
+    Tables of pre-integrated blocks and premultiplied arguments are
+    inserted in tables and table_types, reusing equal tables found in
+    block_tables, which index them by name prefix ("PI" or "PM"). See
+    :func:`choose_block_mode` for the maximum sizes.
+
+    Returns:
+        The block data with its block mode.
+    """
+    trs = [mad.tabledata for mad in blockdata.ma_data]
+    block_mode = choose_block_mode(
+        integral_type,
+        trs,
+        blockdata.all_factors_piecewise,
+        blockdata.is_permuted,
+        preintegration_max_size,
+        premultiplication_max_size,
+    )
+    if block_mode == "preintegrated":
+        # Integrate the product of the argument tables
+        values = integrate_tables(
+            [tr.values for tr in trs], [], quadrature_rule.weights, preintegration_max_size
+        )
+        assert values is not None
+        name = _insert_table(
+            tables, table_types, block_tables, "PI", quadrature_rule, values, block_mode
+        )
+        return blockdata._replace(block_mode=block_mode, name=name)
+    elif block_mode == "premultiplied":
+        # Fold the weights into the table of the first argument that allows it
+        i = next(i for i, tr in enumerate(trs) if _can_premultiply(tr, premultiplication_max_size))
+        values = trs[i].values * quadrature_rule.weights[:, np.newaxis]
+        name = _insert_table(
+            tables, table_types, block_tables, "PM", quadrature_rule, values, block_mode
+        )
+        mad = blockdata.ma_data[i]
+        ma_data = list(blockdata.ma_data)
+        ma_data[i] = mad._replace(tabledata=mad.tabledata._replace(name=name, values=values))
+        unames = list(blockdata.unames)
+        unames[i] = name
+        return blockdata._replace(
+            block_mode=block_mode, unames=tuple(unames), ma_data=tuple(ma_data)
+        )
+    return blockdata
+
+
+def choose_block_mode(
+    integral_type: str,
+    tables: list[UniqueTableReferenceT],
+    all_factors_piecewise: bool,
+    is_permuted: bool,
+    preintegration_max_size: int,
+    premultiplication_max_size: int,
+) -> str:
+    """Choose how a block of the element tensor is integrated.
+
+    A block with piecewise factors is "preintegrated": the product of its
+    argument tables is integrated at compile time, so the block costs one
+    multiplication per entry instead of one per entry and quadrature
+    point. This needs a table with one value per entry and entity, and
+    is used unless that table has more than preintegration_max_size
+    values.
+
+    In a block with varying factors, the quadrature weights can be folded
+    into the table of an argument ("premultiplied"), saving the
+    multiplication of the factor by the weight at each quadrature point,
+    at the cost of a copy of the table. It is used if the copy has at
+    most premultiplication_max_size values, so that it stays in cache
+    with the other tables.
+
+    Other blocks are integrated in the quadrature loop ("partial").
+
+    Args:
+        integral_type: Type of the integral.
+        tables: Table of each argument of the block.
+        all_factors_piecewise: True if the factors of the block are piecewise.
+        is_permuted: True if the tables are permuted.
+        preintegration_max_size: Maximum size of the table of a
+            pre-integrated block (0: no pre-integration).
+        premultiplication_max_size: Maximum size of a premultiplied
+            argument table (0: no premultiplication).
+    """
+    if not tables or any(tr.ttype == "quadrature" for tr in tables):
+        return "partial"
+    if all_factors_piecewise:
+        num_entities = max(tr.values.shape[1] for tr in tables)
+        size = num_entities * np.prod([tr.values.shape[3] for tr in tables], dtype=int)
+        if (
+            integral_type in ("cell", "exterior_facet")
+            and not is_permuted
+            and size <= preintegration_max_size
+        ):
+            return "preintegrated"
+    elif integral_type in ("cell", "exterior_facet", "interior_facet"):
+        if any(_can_premultiply(tr, premultiplication_max_size) for tr in tables):
+            return "premultiplied"
+    return "partial"
+
+
+def _can_premultiply(tr: UniqueTableReferenceT, max_size: int) -> bool:
+    """Check if the quadrature weights can be folded into a table."""
+    return (
+        tr.ttype in ("varying", "uniform")
+        and not tr.has_tensor_factorisation
+        and tr.values.size <= max_size
+    )
+
+
+def _insert_table(tables, table_types, block_tables, prefix, quadrature_rule, values, ttype) -> str:
+    """Insert a table, returning its name or the name of an equal table."""
+    index = block_tables[prefix]
+    for name, table in index.candidates(values):
+        if np.allclose(table, values, index.rtol, index.atol):
+            return name
+    name = f"{prefix}{len(index)}_Q{quadrature_rule.id()}"
+    index.add(name, values)
+    tables[name] = values
+    table_types[name] = ttype
+    return name
+
+
 def analyse_dependencies(F, mt_unique_table_reference):
     """Analyse dependencies.
 
@@ -0,0 +1,247 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Reference tensors of integrals with piecewise geometry.
+
+In the tensor representation, each block of the element tensor is a
+contraction of reference tensors, integrated once at compile time on
+the reference cell, with geometry tensors computed in each cell:
+
+    A[i, j] = sum_t G_t[k] * A0_t[i, j, k]
+
+The factor of a block is expanded as a polynomial in the varying
+coefficients, whose coefficients are products of piecewise values. Each
+monomial gives a reference tensor, integrating the argument and
+coefficient basis functions over the quadrature rule, and a geometry
+tensor, the product of its piecewise coefficient and the dofs of its
+coefficients. This needs all varying values to be coefficients of the
+block factors, e.g. forms on affine simplex cells with polynomial
+coefficients.
+"""
+
+from __future__ import annotations
+
+import itertools
+import typing
+
+import numpy as np
+import ufl
+
+from ffcx.ir.elementtables import TableIndex
+from ffcx.ir.representationutils import QuadratureRule
+
+if typing.TYPE_CHECKING:
+    from ffcx.ir.integral import BlockDataT
+
+# Polynomial in the varying coefficients, mapping (coefficient node
+# indices, piecewise numerator node indices, piecewise denominator node
+# indices) of each monomial to its scale
+_Polynomial = dict[tuple[tuple[int, ...], tuple[int, ...], tuple[int, ...]], float]
+
+
+class ReferenceTensorT(typing.NamedTuple):
+    """Reference tensor of a block of the element tensor."""
+
+    name: str  # name of the table of reference tensor values
+    blockmap: tuple[tuple[int, ...], ...]  # dofmap of each argument
+    blockdata: BlockDataT
+    is_uniform: bool  # True if the values are the same for all entities
+    coefficients: tuple[int, ...]  # factorisation nodes of the coefficients
+    # scale, numerator and denominator factorisation nodes of each term
+    # of the geometry tensor
+    factors: tuple[tuple[float, tuple[int, ...], tuple[int, ...]], ...]
+
+
+def compute_reference_tensors(
+    F,
+    block_contributions: dict[tuple, list[BlockDataT]],
+    quadrature_rule: QuadratureRule,
+    integral_type: str,
+    max_size: int,
+    rtol: float,
+    atol: float,
+) -> tuple[list[ReferenceTensorT], dict[str, np.ndarray]] | None:
+    """Compute the reference tensors of the blocks of a quadrature rule.
+
+    Args:
+        F: Factorisation graph, with the status and tables of its nodes.
+        block_contributions: Blocks of the element tensor.
+        quadrature_rule: Quadrature rule of the integrand.
+        integral_type: Type of the integral.
+        max_size: Maximum number of values of a reference tensor.
+        rtol: Relative tolerance for reusing reference tensors.
+        atol: Absolute tolerance for reusing reference tensors.
+
+    Returns:
+        The reference tensors of the blocks and their values by name, or
+        None if the integrand has no tensor representation or a
+        reference tensor has more than max_size values.
+    """
+    if integral_type not in ("cell", "exterior_facet"):
+        return None
+
+    expansions: dict[int, _Polynomial | None] = {}
+    # Values of the reference tensors of each block, summing the blocks
+    # with the same geometry tensor
+    block_tensors: dict[tuple, tuple[BlockDataT, np.ndarray]] = {}
+    for blockmap, contributions in sorted(block_contributions.items()):
+        for blockdata in contributions:
+            if (
+                len(blockdata.factor_indices_comp_indices) != 1
+                or blockdata.transposed
+                or blockdata.is_permuted
+            ):
+                return None
+            arguments = [mad.tabledata for mad in blockdata.ma_data]
+            if any(tr.ttype == "quadrature" for tr in arguments):
+                return None
+
+            factor_index = blockdata.factor_indices_comp_indices[0][0]
+            polynomial = _expand(F, factor_index, expansions)
+            if polynomial is None:
+                return None
+
+            # Group the monomials by coefficients
+            monomials: dict[tuple[int, ...], list] = {}
+            for (coefficients, numerator, denominator), scale in sorted(polynomial.items()):
+                monomials.setdefault(coefficients, []).append((scale, numerator, denominator))
+
+            for coefficients, factors in monomials.items():
+                values = integrate_tables(
+                    [tr.values for tr in arguments],
+                    [F.nodes[i]["tr"].values for i in coefficients],
+                    quadrature_rule.weights,
+                    max_size,
+                )
+                if values is None:
+                    return None
+                key = (blockmap, coefficients, tuple(factors))
+                if key in block_tensors:
+                    data, total = block_tensors[key]
+                    block_tensors[key] = (data, total + values)
+                else:
+                    block_tensors[key] = (blockdata, values)
+
+    reference_tensors = []
+    tables: dict[str, np.ndarray] = {}
+    table_index = TableIndex(rtol, atol)
+    for (blockmap, coefficients, factors), (blockdata, values) in block_tensors.items():
+        # Reuse the name of equal reference tensors
+        name = next(
+            (n for n, t in table_index.candidates(values) if np.allclose(t, values, rtol, atol)),
+            None,
+        )
+        if name is None:
+            name = f"RT{len(tables)}_Q{quadrature_rule.id()}"
+            tables[name] = values
+            table_index.add(name, values)
+
+        reference_tensors.append(
+            ReferenceTensorT(name, blockmap, blockdata, values.shape[1] == 1, coefficients, factors)
+        )
+
+    return reference_tensors, tables
+
+
+def _expand(F, i: int, expansions: dict[int, _Polynomial | None]) -> _Polynomial | None:
+    """Expand a factorisation node as a polynomial in varying coefficients.
+
+    Returns None if the node is not such a polynomial.
+    """
+    if i in expansions:
+        return expansions[i]
+
+    attr = F.nodes[i]
+    v = attr["expression"]
+    polynomial: _Polynomial | None = None
+    if isinstance(v, ufl.constantvalue.Zero):
+        polynomial = {}
+    elif isinstance(v, ufl.constantvalue.RealValue):
+        polynomial = {((), (), ()): float(v)}
+    elif attr["status"] == "piecewise":
+        polynomial = {((), (i,), ()): 1.0}
+    elif "mt" in attr:
+        tr = attr.get("tr")
+        if (
+            isinstance(attr["mt"].terminal, ufl.classes.Coefficient)
+            and tr is not None
+            and tr.ttype in ("varying", "uniform")
+            and not tr.is_permuted
+        ):
+            polynomial = {((i,), (), ()): 1.0}
+    else:
+        operands = [_expand(F, j, expansions) for j in F.out_edges[i]]
+        if any(p is None for p in operands):
+            pass
+        elif isinstance(v, ufl.classes.Sum):
+            polynomial = {}
+            for p in operands:
+                for key, scale in p.items():  # type: ignore
+                    polynomial[key] = polynomial.get(key, 0.0) + scale
+        elif isinstance(v, ufl.classes.Product):
+            polynomial = {((), (), ()): 1.0}
+            for p in operands:
+                polynomial = _multiply(polynomial, p)  # type: ignore
+        elif isinstance(v, ufl.classes.Division):
+            # Only divisions by piecewise values are polynomials
+            _, denominator = F.out_edges[i]
+            if F.nodes[denominator]["status"] == "piecewise":
+                polynomial = {
+                    (c, n, tuple(sorted((*d, denominator)))): scale
+                    for (c, n, d), scale in operands[0].items()  # type: ignore
+                }
+
+    expansions[i] = polynomial
+    return polynomial
+
+
+def _multiply(p: _Polynomial, q: _Polynomial) -> _Polynomial:
+    """Multiply two polynomials."""
+    product: _Polynomial = {}
+    for (a, b), (c, d) in itertools.product(p.items(), q.items()):
+        key = tuple(tuple(sorted((*x, *y))) for x, y in zip(a, c))
+        product[key] = product.get(key, 0.0) + b * d  # type: ignore
+    return product
+
+
+def integrate_tables(
+    arguments: list[np.ndarray],
+    coefficients: list[np.ndarray],
+    weights: np.ndarray,
+    max_size: int,
+) -> np.ndarray | None:
+    """Integrate the product of argument and coefficient basis functions.
+
+    Args:
+        arguments: Tables of the arguments.
+        coefficients: Tables of the coefficients.
+        weights: Quadrature weights.
+        max_size: Maximum number of values of the reference tensor.
+
+    Returns:
+        The reference tensor, with shape (1, entities, argument dofs...,
+        coefficient dofs), where the dofs of all coefficients are
+        flattened in one dimension (omitted if there are no
+        coefficients), or None if it has more than max_size values.
+    """
+    tables = [*arguments, *coefficients]
+    num_entities = max(t.shape[1] for t in tables)
+    num_points = weights.shape[0]
+    shape = [t.shape[3] for t in tables]
+    if num_entities * np.prod(shape, dtype=int) > max_size:
+        return None
+
+    # Sum over the points of the products of the tables, broadcast over
+    # entities and points for uniform and piecewise tables
+    operands: list[typing.Any] = [weights, [0]]
+    for k, t in enumerate(tables):
+        values = np.broadcast_to(t[0], (num_entities, num_points, t.shape[3]))
+        operands += [values, [1, 0, k + 2]]
+    values = np.einsum(*operands, [1, *range(2, len(tables) + 2)])
+
+    shape = [num_entities, *shape[: len(arguments)]]
+    if coefficients:
+        shape.append(-1)
+    return values.reshape(1, *shape)
@@ -18,10 +18,13 @@ representation under the key "foo".
 
 from __future__ import annotations
 
+import hashlib
 import itertools
 import logging
+import os
 import typing
 import warnings
+from pathlib import Path
 
 import basix
 import numpy as np
@@ -30,13 +33,30 @@ import ufl
 from ufl.classes import Integral
 from ufl.sorting import sorted_expr_sum
 
+import ffcx
+import ffcx.parallel
 from ffcx import naming
 from ffcx.analysis import UFLData
+from ffcx.cacheutils import write_atomic
 from ffcx.ir.integral import compute_integral_ir
 from ffcx.ir.representationutils import QuadratureRule, create_quadrature_points_and_weights
 
 logger = logging.getLogger("ffcx")
 
+# Version of the format of cached integral representations
+_IR_CACHE_FORMAT = 3
+
+# Options used by compute_integral_ir
+_IR_OPTIONS = (
+    "sum_factorization",
+    "representation",
+    "reference_tensor_max_size",
+    "preintegration_max_size",
+    "premultiplication_max_size",
+    "table_rtol",
+    "table_atol",
+)
+
 
 def basix_cell_from_string(string: str) -> basix.CellType:
     """Convert a string to a Basix CellType."""
@@ -141,7 +161,7 @@ def compute_ir(
                 fd.original_form, itg_data.integral_type, fd_index, itg_data.subdomain_id, prefix
             )
 
-    irs = [
+    pending = [
         _compute_integral_ir(
             fd,
             i,
@@ -152,6 +172,41 @@ def compute_ir(
         )
         for (i, fd) in enumerate(analysis.form_data)
     ]
+
+    # Reuse the representations of integrands cached by earlier
+    # compilations
+    tasks = [args for form_irs in pending for _, _, args in form_irs]
+    results: list[typing.Any] = [None] * len(tasks)
+    cache = None
+    if options["ir_cache_dir"] and not visualise:
+        cache = _IntegralIRCache(Path(str(options["ir_cache_dir"])))
+        entries = [cache.entry(args) for args in tasks]
+        results = [cache.load(*entry) for entry in entries]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if cache is not None:
+        logger.info(f"Reused {len(tasks) - len(missing)} of {len(tasks)} cached integral IRs.")
+
+    # Compute the other representations of the integrands, which are
+    # independent of each other, in parallel
+    computed = ffcx.parallel.run(
+        compute_integral_ir,
+        [tasks[i] for i in missing],
+        int(options["ir_workers"]),  # type: ignore
+        lambda: _shared_objects(i for j in missing for i in _integrands(tasks[j])),
+    )
+    for i, result in zip(missing, computed):
+        results[i] = result
+        if cache is not None:
+            cache.store(*entries[i], result)
+
+    results_iter = iter(results)
+    irs: list[list[IntegralIR]] = []
+    for form_irs in pending:
+        irs.append([])
+        for ir, expression_ir, _ in form_irs:
+            expression_ir.update(next(results_iter))
+            ir["expression"] = CommonExpressionIR(**expression_ir)
+            irs[-1].append(IntegralIR(**ir))
     ir_integrals = list(itertools.chain(*irs))
 
     integral_domains = {
@@ -191,6 +246,114 @@ def compute_ir(
     )
 
 
+def _integrands(args) -> list[ufl.core.expr.Expr]:
+    """Return the integrands in the arguments of compute_integral_ir."""
+    integrand_map = args[3]
+    return [
+        integrand
+        for integrands_by_cell in integrand_map.values()
+        for integrand in integrands_by_cell.values()
+    ]
+
+
+def _shared_objects(integrands: typing.Iterable[ufl.core.expr.Expr]) -> list[typing.Any]:
+    """Return the terminals, domains, spaces and elements of integrands.
+
+    These objects are passed by reference between processes.
+    """
+    shared: dict[int, typing.Any] = {}
+    elements = []
+    for integrand in integrands:
+        for terminal in ufl.corealg.traversal.traverse_unique_terminals(integrand):
+            shared[id(terminal)] = terminal
+            domain = ufl.domain.extract_unique_domain(terminal)
+            if domain is not None:
+                shared[id(domain)] = domain
+                elements.append(domain.ufl_coordinate_element())
+            if isinstance(terminal, ufl.classes.FormArgument):
+                space = terminal.ufl_function_space()
+                shared[id(space)] = space
+                elements.append(space.ufl_element())
+    for element in [*ufl.algorithms.analysis.extract_sub_elements(elements), *elements]:
+        shared[id(element)] = element
+    return list(shared.values())
+
+
+class _IntegralIRCache:
+    """On-disk cache of the representations computed by compute_integral_ir.
+
+    A representation is stored in ``<key>.pkl``, where the key is a hash
+    of the signatures of the integrands, the quadrature rules and the
+    options used. The terminals, domains, spaces and elements of the
+    integrands are pickled by reference, as their index in the list
+    returned by _shared_objects, and resolved to the equivalent objects
+    of the compilation loading the representation.
+    """
+
+    def __init__(self, cache_dir: Path):
+        """Initialise."""
+        self.cache_dir = cache_dir
+
+    def entry(self, args) -> tuple[Path, list[typing.Any]]:
+        """Return the file and the shared objects of a representation."""
+        cell, integral_type, entity_type, integrand_map, tensor_shape, options, _ = args
+        shared = _shared_objects(_integrands(args))
+        data = [
+            _IR_CACHE_FORMAT,
+            ffcx.__version__,
+            ufl.__version__,
+            basix.__version__,
+            cell.cellname(),
+            integral_type,
+            entity_type,
+            [int(dim) for dim in tensor_shape],
+            [options[name] for name in _IR_OPTIONS],
+            [type(obj).__name__ for obj in shared],
+        ]
+        for cell_type, integrands_by_cell in integrand_map.items():
+            for rule, integrand in integrands_by_cell.items():
+                factors = [
+                    (naming.points_signature(p), naming.points_signature(w))
+                    for p, w in (rule.tensor_factors or [])
+                ]
+                data.append(
+                    (
+                        cell_type.name,
+                        naming.points_signature(rule.points),
+                        naming.points_signature(rule.weights),
+                        factors,
+                        naming._expression_signature(integrand),
+                    )
+                )
+        key = hashlib.sha1(repr(data).encode()).hexdigest()
+        return self.cache_dir.joinpath(f"{key}.pkl"), shared
+
+    def load(self, path: Path, shared: list[typing.Any]) -> dict | None:
+        """Load a representation, if it is cached."""
+        try:
+            ir = ffcx.parallel.loads(path.read_bytes(), shared)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to load cached integral IR {path}: {e!r}")
+            return None
+        return ir
+
+    def store(self, path: Path, shared: list[typing.Any], ir: dict):
+        """Store a representation."""
+        try:
+            data = ffcx.parallel.dumps(ir, {id(obj): i for i, obj in enumerate(shared)})
+        except Exception as e:
+            logger.debug(f"Integral IR cannot be cached: {e!r}")
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomic(path, data)
+        except OSError as e:
+            logger.warning(f"Failed to cache integral IR in {path}: {e}")
+
+
 def _compute_integral_ir(
     form_data,
     form_index,
@@ -198,8 +361,14 @@ def _compute_integral_ir(
     integral_names,
     options,
     visualise,
-) -> list[IntegralIR]:
-    """Compute intermediate representation for form integrals."""
+) -> list[tuple[dict, dict, tuple]]:
+    """Prepare the intermediate representation for form integrals.
+
+    Returns:
+        For each integral, the partial IR and expression IR, and the
+        arguments of compute_integral_ir, which computes the rest of the
+        expression IR.
+    """
     _entity_types = {
         "cell": "cell",
         "exterior_facet": "facet",
@@ -256,9 +425,17 @@ def _compute_integral_ir(
         grouped_integrands: dict[
             basix.CellType, dict[QuadratureRule, list[ufl.core.expr.Expr]]
         ] = {}
-        use_sum_factorization = options["sum_factorization"] and itg_data.integral_type == "cell"
+        use_sum_factorization = options["sum_factorization"] and itg_data.integral_type in (
+            "cell",
+            "exterior_facet",
+        )
+        representations = set()
         for integral in itg_data.integrals:
             md = integral.metadata() or {}
+            representation = md.get("representation", options["representation"])
+            if representation not in ("quadrature", "tensor"):
+                raise RuntimeError(f"Unknown representation: {representation}.")
+            representations.add(representation)
             scheme = md["quadrature_rule"]
             tensor_factors = None
             rules = {}
@@ -373,23 +550,23 @@ def _compute_integral_ir(
             for cell_type, cell_integrals in sorted_integrals.items()
         }
 
-        # Build more specific intermediate representation
-        integral_ir = compute_integral_ir(
+        # Fetch name
+        expression_ir["name"] = integral_names[(form_index, itg_data_index)]
+
+        # The tensor representation is used if all integrals request it
+        representation = "tensor" if representations == {"tensor"} else "quadrature"
+
+        # Arguments for building the more specific intermediate representation
+        args = (
             itg_data.domain.ufl_cell(),
             itg_data.integral_type,
             expression_ir["entity_type"],
             integrand_map,
             expression_ir["tensor_shape"],
-            options,
+            {**options, "representation": representation},
             visualise,
         )
-
-        expression_ir.update(integral_ir)
-
-        # Fetch name
-        expression_ir["name"] = integral_names[(form_index, itg_data_index)]
-        ir["expression"] = CommonExpressionIR(**expression_ir)
-        irs.append(IntegralIR(**ir))
+        irs.append((ir, expression_ir, args))
 
     return irs
 
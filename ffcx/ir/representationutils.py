@@ -27,14 +27,20 @@ class QuadratureRule:
         self.tensor_factors = tensor_factors
         self.has_tensor_factors = tensor_factors is not None
         self._hash = None
+        self._digest = None
 
     def __hash__(self):
         """Hash."""
         if self._hash is None:
-            self.hash_obj = hashlib.sha1(self.points)
-            self._hash = int(self.hash_obj.hexdigest(), 32)
+            self._hash = int(self.digest(), 32)
         return self._hash
 
+    def digest(self) -> str:
+        """Return the SHA-1 hex digest of the points."""
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.points).hexdigest()
+        return self._digest
+
     def __eq__(self, other):
         """Check equality."""
         return np.allclose(self.points, other.points) and np.allclose(self.weights, other.weights)
@@ -46,7 +52,23 @@ class QuadratureRule:
             This identifier is used to provide unique names to tables and symbols
             in generated code.
         """
-        return self.hash_obj.hexdigest()[-3:]
+        return self.digest()[-3:]
+
+
+def create_tensor_product_quadrature(cellname, degree, rule, elements):
+    """Create a quadrature rule on a quadrilateral or hexahedron as a tensor product.
+
+    Returns:
+        The points and weights of the rule, and the points and weights
+        of the interval rule in each reference direction.
+    """
+    tdim = {"interval": 1, "quadrilateral": 2, "hexahedron": 3}[cellname]
+    tensor_factors = [create_quadrature("interval", degree, rule, elements) for _ in range(tdim)]
+    pts = np.array(
+        [tuple(i[0] for i in p) for p in itertools.product(*[f[0] for f in tensor_factors])]
+    )
+    wts = np.array([np.prod(p) for p in itertools.product(*[f[1] for f in tensor_factors])])
+    return pts, wts, tensor_factors
 
 
 def create_quadrature_points_and_weights(
@@ -56,36 +78,28 @@ def create_quadrature_points_and_weights(
     pts = {}
     wts = {}
     tensor_factors = {}
+    tensor_product_cells = ["quadrilateral", "hexahedron"]
     if integral_type == "cell":
         cell_name = cell.cellname()
-        if cell_name in ["quadrilateral", "hexahedron"] and use_tensor_product:
-            if cell_name == "quadrilateral":
-                tensor_factors[cell_name] = [
-                    create_quadrature("interval", degree, rule, elements) for _ in range(2)
-                ]
-            elif cell_name == "hexahedron":
-                tensor_factors[cell_name] = [
-                    create_quadrature("interval", degree, rule, elements) for _ in range(3)
-                ]
-            pts[cell_name] = np.array(
-                [
-                    tuple(i[0] for i in p)
-                    for p in itertools.product(*[f[0] for f in tensor_factors[cell_name]])
-                ]
-            )
-            wts[cell_name] = np.array(
-                [np.prod(p) for p in itertools.product(*[f[1] for f in tensor_factors[cell_name]])]
+        if cell_name in tensor_product_cells and use_tensor_product:
+            pts[cell_name], wts[cell_name], tensor_factors[cell_name] = (
+                create_tensor_product_quadrature(cell_name, degree, rule, elements)
             )
         else:
             pts[cell_name], wts[cell_name] = create_quadrature(cell_name, degree, rule, elements)
     elif integral_type in ufl.measure.facet_integral_types:
         for ft in cell.facet_types():
-            pts[ft.cellname()], wts[ft.cellname()] = create_quadrature(
-                ft.cellname(),
-                degree,
-                rule,
-                elements,
-            )
+            if cell.cellname() in tensor_product_cells and use_tensor_product:
+                pts[ft.cellname()], wts[ft.cellname()], tensor_factors[ft.cellname()] = (
+                    create_tensor_product_quadrature(ft.cellname(), degree, rule, elements)
+                )
+            else:
+                pts[ft.cellname()], wts[ft.cellname()] = create_quadrature(
+                    ft.cellname(),
+                    degree,
+                    rule,
+                    elements,
+                )
     elif integral_type in ufl.measure.point_integral_types:
         pts["vertex"], wts["vertex"] = create_quadrature("vertex", degree, rule, elements)
     elif integral_type == "expression":
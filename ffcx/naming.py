@@ -8,6 +8,7 @@
 from __future__ import annotations
 
 import hashlib
+import weakref
 
 import numpy as np
 import numpy.typing as npt
@@ -16,6 +17,56 @@ import ufl
 import ffcx
 import ffcx.codegeneration
 
+# Signatures of UFL expressions by identity, with a weak reference to
+# the expression. Entries are dropped when the expression is collected.
+_expression_signatures: dict[int, tuple[weakref.ref, str]] = {}
+
+
+def _expression_signature(expr: ufl.core.expr.Expr) -> str:
+    """Return the signature of an expression, computed once per expression."""
+    entry = _expression_signatures.get(id(expr))
+    if entry is not None and entry[0]() is expr:
+        return entry[1]
+
+    # FIXME Move this to UFL
+    coeffs = ufl.algorithms.extract_coefficients(expr)
+    consts = ufl.algorithms.analysis.extract_constants(expr)
+    args = ufl.algorithms.analysis.extract_arguments(expr)
+
+    rn = dict()
+    rn.update(dict((c, i) for i, c in enumerate(coeffs)))
+    rn.update(dict((c, i) for i, c in enumerate(consts)))
+    rn.update(dict((c, i) for i, c in enumerate(args)))
+
+    domains: list[ufl.Mesh] = []
+    for coeff in coeffs:
+        domains.append(*ufl.domain.extract_domains(coeff))
+    for arg in args:
+        domains.append(*ufl.domain.extract_domains(arg))
+    for gc in ufl.algorithms.analysis.extract_type(expr, ufl.classes.GeometricQuantity):
+        domains.append(*ufl.domain.extract_domains(gc))
+    for const in consts:
+        domains.append(*ufl.domain.extract_domains(const))
+    domains = ufl.algorithms.analysis.unique_tuple(domains)
+    rn.update(dict((d, i) for i, d in enumerate(domains)))
+
+    signature = ufl.algorithms.signature.compute_expression_signature(expr, rn)
+
+    key = id(expr)
+    _expression_signatures[key] = (
+        weakref.ref(expr, lambda _: _expression_signatures.pop(key, None)),
+        signature,
+    )
+    return signature
+
+
+def points_signature(points: npt.ArrayLike) -> str:
+    """Return a hash of an array of points, from its dtype, shape and data."""
+    points = np.ascontiguousarray(points)
+    h = hashlib.sha1(f"{points.dtype.str}{points.shape}".encode())
+    h.update(points.tobytes())
+    return h.hexdigest()
+
 
 def compute_signature(
     ufl_objects: list[ufl.Form | tuple[ufl.core.expr.Expr, npt.NDArray[np.float64]]],
@@ -24,6 +75,9 @@ def compute_signature(
     """Compute the signature hash.
 
     Based on the UFL type of the objects and an additional optional 'tag'.
+    The UFL signature of each object is computed once per process (UFL
+    caches form signatures, expression signatures are cached here), so
+    names derived from the same objects are cheap.
     """
     object_signature = ""
     for ufl_object in ufl_objects:
@@ -32,36 +86,9 @@ def compute_signature(
             kind = "form"
             object_signature += ufl_object.signature()
         elif isinstance(ufl_object, tuple) and isinstance(ufl_object[0], ufl.core.expr.Expr):
-            expr = ufl_object[0]
-            points = ufl_object[1]
-
-            # FIXME Move this to UFL, cache the computation
-            coeffs = ufl.algorithms.extract_coefficients(expr)
-            consts = ufl.algorithms.analysis.extract_constants(expr)
-            args = ufl.algorithms.analysis.extract_arguments(expr)
-
-            rn = dict()
-            rn.update(dict((c, i) for i, c in enumerate(coeffs)))
-            rn.update(dict((c, i) for i, c in enumerate(consts)))
-            rn.update(dict((c, i) for i, c in enumerate(args)))
-
-            domains: list[ufl.Mesh] = []
-            for coeff in coeffs:
-                domains.append(*ufl.domain.extract_domains(coeff))
-            for arg in args:
-                domains.append(*ufl.domain.extract_domains(arg))
-            for gc in ufl.algorithms.analysis.extract_type(expr, ufl.classes.GeometricQuantity):
-                domains.append(*ufl.domain.extract_domains(gc))
-            for const in consts:
-                domains.append(*ufl.domain.extract_domains(const))
-            domains = ufl.algorithms.analysis.unique_tuple(domains)
-            rn.update(dict((d, i) for i, d in enumerate(domains)))
-
             # Hash on UFL signature and points
-            signature = ufl.algorithms.signature.compute_expression_signature(expr, rn)
-            object_signature += signature
-            object_signature += repr(points)
-
+            object_signature += _expression_signature(ufl_object[0])
+            object_signature += points_signature(ufl_object[1])
             kind = "expression"
         else:
             raise RuntimeError(f"Unknown ufl object type {ufl_object.__class__.__name__}")
@@ -28,6 +28,31 @@ FFCX_DEFAULT_OPTIONS = {
         ("float32", "float64", "complex64", "complex128"),
     ),
     "sum_factorization": (bool, False, "use sum factorization.", None),
+    "representation": (
+        str,
+        "quadrature",
+        "representation of integrals, unless set by their metadata.",
+        ("quadrature", "tensor"),
+    ),
+    "reference_tensor_max_size": (
+        int,
+        2**16,
+        "maximum number of values of a reference tensor of the tensor representation.",
+        None,
+    ),
+    "preintegration_max_size": (
+        int,
+        2**16,
+        "maximum number of values of the table of a pre-integrated block (0: no pre-integration).",
+        None,
+    ),
+    "premultiplication_max_size": (
+        int,
+        2**12,
+        "maximum number of values of an argument table premultiplied by the quadrature weights "
+        "(0: no premultiplication).",
+        None,
+    ),
     "table_rtol": (
         float,
         1e-6,
@@ -40,14 +65,47 @@ FFCX_DEFAULT_OPTIONS = {
         "absolute precision to use when comparing finite element table values reuse.",
         None,
     ),
+    "batch_size": (
+        int,
+        0,
+        "number of cells tabulated by each call of the batched integral kernels (0: none).",
+        None,
+    ),
+    "action_kernels": (
+        bool,
+        False,
+        "also generate kernels applying the element matrices of bilinear forms to vectors.",
+        None,
+    ),
     "verbosity": (
         int,
         30,
         "logger verbosity, follows standard library levels, i.e. INFO=20, DEBUG=10, etc.",
         None,
     ),
+    "ir_workers": (
+        int,
+        1,
+        "number of processes computing integral representations in parallel (0: one per core).",
+        None,
+    ),
+    "codegen_workers": (
+        int,
+        1,
+        "number of processes generating code for kernels in parallel (0: one per core).",
+        None,
+    ),
+    "ir_cache_dir": (
+        str,
+        "",
+        "directory caching integral representations between compilations (empty: no cache).",
+        None,
+    ),
 }
 
+# Options that change how FFCx runs, but not the generated code
+FFCX_EXECUTION_OPTIONS = ("ir_workers", "codegen_workers", "ir_cache_dir")
+
 
 @functools.cache
 def _load_options() -> tuple[dict, dict]:
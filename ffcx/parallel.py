@@ -0,0 +1,173 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Parallel execution of independent compiler tasks.
+
+Tasks run in worker processes forked from the compiling process, so the
+workers inherit the task arguments (UFL objects, Basix elements, ...)
+without pickling them. Results are pickled back to the parent. Objects
+passed as ``shared`` are pickled by reference, as their index in
+``shared``, so results refer to the original objects of the parent.
+This is needed for objects that cannot be pickled, such as Basix
+elements, and for objects that are compared by identity.
+
+Results are returned in the order of the tasks, whatever the number of
+workers. A task whose result cannot be computed or pickled by a worker
+is run again in the parent, so errors are raised there as usual.
+
+Forking a process while other threads run can deadlock the workers on
+locks held by those threads (in the allocator, logging, ...), and the
+tasks cannot be pickled for a spawned process. So tasks are run in this
+process if other threads are alive, e.g. those of an asynchronous JIT
+compilation pool.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import multiprocessing
+import pickle
+import sys
+import threading
+import typing
+from concurrent.futures import ProcessPoolExecutor
+
+from ffcx.codegeneration.ccompiler import available_cores
+from ffcx.codegeneration.filelock import HEARTBEAT_THREAD_NAME
+
+logger = logging.getLogger("ffcx")
+
+# Job inherited by forked workers: function, tasks and shared objects
+_job: tuple[typing.Callable, list[tuple], list] | None = None
+_job_lock = threading.Lock()
+_shared_ids: dict[int, int] | None = None
+
+
+class _Pickler(pickle.Pickler):
+    """Pickler storing shared objects by reference."""
+
+    def __init__(self, file, shared_ids: dict[int, int]):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.shared_ids = shared_ids
+
+    def persistent_id(self, obj):
+        return self.shared_ids.get(id(obj))
+
+
+class _Unpickler(pickle.Unpickler):
+    """Unpickler resolving references to shared objects."""
+
+    def __init__(self, file, shared: typing.Sequence):
+        super().__init__(file)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+
+def dumps(obj: typing.Any, shared_ids: dict[int, int]) -> bytes:
+    """Pickle an object, storing objects by reference.
+
+    Args:
+        obj: Object to pickle.
+        shared_ids: Index of each object stored by reference, by its id.
+    """
+    data = io.BytesIO()
+    _Pickler(data, shared_ids).dump(obj)
+    return data.getvalue()
+
+
+def loads(data: bytes, shared: typing.Sequence) -> typing.Any:
+    """Unpickle an object pickled by dumps, resolving its references in shared."""
+    return _Unpickler(io.BytesIO(data), shared).load()
+
+
+def worker_count(workers: int) -> int:
+    """Return the number of workers for a worker option (0 or less: one per core)."""
+    return available_cores() if workers <= 0 else workers
+
+
+def can_fork() -> bool:
+    """Check if worker processes can be forked on this platform."""
+    # Forking is unsafe with the system libraries of macOS
+    return sys.platform != "darwin" and "fork" in multiprocessing.get_all_start_methods()
+
+
+def other_threads() -> list[str]:
+    """Return the names of the other threads that make forking unsafe."""
+    current = threading.current_thread()
+    return [
+        thread.name
+        for thread in threading.enumerate()
+        if thread is not current and thread.name != HEARTBEAT_THREAD_NAME
+    ]
+
+
+def run(
+    function: typing.Callable,
+    tasks: list[tuple],
+    workers: int,
+    shared: typing.Callable[[], typing.Iterable] | None = None,
+) -> list:
+    """Call function with the arguments of each task, in worker processes.
+
+    Args:
+        function: Function to call.
+        tasks: Arguments of each call.
+        workers: Number of worker processes (0: one per core). With one
+            worker, where processes cannot be forked, or if other threads
+            are alive, the tasks are run in this process.
+        shared: Function returning the objects referred to by the results
+            that are returned as references to the objects of this process.
+            It is only called if worker processes are used.
+
+    Returns:
+        The result of each call, in the order of tasks.
+    """
+    global _job
+    workers = min(worker_count(workers), len(tasks))
+    if workers <= 1 or not can_fork():
+        return [function(*args) for args in tasks]
+    threads = other_threads()
+    if threads:
+        logger.info(
+            f"Running {function.__name__} in this process, as it cannot be forked safely "
+            f"with other threads alive: {', '.join(threads)}."
+        )
+        return [function(*args) for args in tasks]
+
+    shared_objects = [] if shared is None else list(shared())
+    with _job_lock:
+        _job = (function, tasks, shared_objects)
+        try:
+            context = multiprocessing.get_context("fork")
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                pickled = list(pool.map(_run_task, range(len(tasks))))
+        finally:
+            _job = None
+
+    results = []
+    for args, data in zip(tasks, pickled):
+        if data is None:
+            logger.debug(f"Running task of {function.__name__} again in parent process.")
+            results.append(function(*args))
+        else:
+            results.append(loads(data, shared_objects))
+    return results
+
+
+def _run_task(index: int) -> bytes | None:
+    """Run a task of the inherited job in a worker, returning its pickled result."""
+    global _shared_ids
+    assert _job is not None
+    function, tasks, shared = _job
+    if _shared_ids is None:
+        _shared_ids = {id(obj): i for i, obj in enumerate(shared)}
+    try:
+        return dumps(function(*tasks[index]), _shared_ids)
+    except Exception as e:
+        logger.debug(f"Task {index} of {function.__name__} failed in worker: {e!r}")
+        return None
@@ -4,12 +4,28 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import concurrent.futures
+import io
+import logging
+import os
+import subprocess
 import sys
+import sysconfig
+import threading
+import time
 
 import basix.ufl
+import numpy as np
+import pytest
 import ufl
 
+import ffcx.cache
+import ffcx.cacheutils
+import ffcx.codegeneration.ccompiler
 import ffcx.codegeneration.jit
+import ffcx.compiler
+import ffcx.options
+from ffcx.codegeneration.filelock import FileLock
 
 
 def test_cache_modes(compile_args):
@@ -39,3 +55,520 @@ def test_cache_modes(compile_args):
 
     assert newname == tmpname
     assert newfile != tmpfile
+
+
+def test_module_memo(compile_args):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+    ffcx.codegeneration.jit.clear_module_memo()
+    _, module, code = ffcx.codegeneration.jit.compile_forms(
+        [a], cffi_extra_compile_args=compile_args
+    )
+    assert code[1] is not None
+    info = ffcx.codegeneration.jit.module_memo_info()
+    assert info.hits == 0 and info.misses == 1 and info.currsize == 1
+
+    # Same forms and arguments: served from the memo
+    _, module2, code2 = ffcx.codegeneration.jit.compile_forms(
+        [a], cffi_extra_compile_args=compile_args
+    )
+    assert module2 is module
+    assert code2 == (None, None)
+    assert ffcx.codegeneration.jit.module_memo_info().hits == 1
+
+    # Different options must not hit
+    _, module3, _ = ffcx.codegeneration.jit.compile_forms(
+        [a], options={"scalar_type": "float32"}, cffi_extra_compile_args=compile_args
+    )
+    assert module3 is not module
+    info = ffcx.codegeneration.jit.module_memo_info()
+    assert info.hits == 1 and info.misses == 2
+
+    ffcx.codegeneration.jit.set_module_memo_size(1)
+    assert ffcx.codegeneration.jit.module_memo_info().currsize == 1
+    ffcx.codegeneration.jit.set_module_memo_size(128)
+    ffcx.codegeneration.jit.clear_module_memo()
+
+
+def test_lru_memo():
+    memo = ffcx.cacheutils.LRUMemo(2)
+    memo.put("a", 1)
+    memo.put("b", 2)
+    assert memo.get("a") == 1
+    memo.put("c", 3)
+    # "b" was the least recently used
+    assert memo.get("b") is None
+    assert memo.info() == ffcx.cacheutils.MemoInfo(1, 1, 2, 2)
+    memo.resize(1)
+    assert memo.get("c") == 3
+    assert memo.get("a") is None
+    memo.clear()
+    assert memo.info() == ffcx.cacheutils.MemoInfo(0, 0, 1, 0)
+
+
+def test_atomic_path(tmp_path):
+    path = tmp_path.joinpath("data.txt")
+    ffcx.cacheutils.write_atomic(path, "complete")
+    with pytest.raises(RuntimeError):
+        with ffcx.cacheutils.atomic_path(path) as tmp:
+            tmp.write_text("partial")
+            raise RuntimeError
+    assert path.read_text() == "complete"
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_cache_lock_wakeup(compile_args, tmp_path):
+    """Waiters load the module as soon as the lock holder has finished."""
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = u * v * ufl.dx
+    forms = [a]
+
+    # Compile once to find the module name
+    _, module, _ = ffcx.codegeneration.jit.compile_forms(
+        forms, cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+    )
+    module_name = module.__name__
+    ready = tmp_path.joinpath(module_name).with_suffix(".c.cached")
+    ready.rename(tmp_path / "ready")
+
+    # Hold the lock as if another process were compiling, and finish
+    # "compiling" after a short time
+    lock = FileLock(tmp_path.joinpath(module_name).with_suffix(".lock"))
+    assert lock.acquire(timeout=0)
+
+    def finish():
+        time.sleep(0.2)
+        (tmp_path / "ready").rename(ready)
+        lock.release()
+
+    thread = threading.Thread(target=finish)
+    thread.start()
+    t0 = time.time()
+    _, mod, held = ffcx.codegeneration.jit.get_cached_module(module_name, [], tmp_path, 10)
+    elapsed = time.time() - t0
+    thread.join()
+    assert held is None
+    assert mod is not None
+    assert elapsed < 0.9
+
+
+def test_cache_lock_dead_holder(tmp_path):
+    """A compilation that died does not block later compilations."""
+    # Simulate a killed compiler: a process took the lock and died
+    script = (
+        "import sys; from ffcx.codegeneration.filelock import FileLock;"
+        "FileLock(sys.argv[1]).acquire(timeout=0); import os; os._exit(1)"
+    )
+    subprocess.run([sys.executable, "-c", script, str(tmp_path / "libffcx_forms_x.lock")])
+
+    obj, _, lock = ffcx.codegeneration.jit.get_cached_module(
+        "libffcx_forms_x", [], tmp_path, timeout=1
+    )
+    assert obj is None and lock is not None and lock.locked
+    lock.release()
+
+
+def test_object_cache(compile_args, tmp_path):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a0 = u * v * ufl.dx
+    a1 = u * v * ufl.dx + u * v * ufl.ds
+
+    # Identical integrals in one module are compiled once
+    ffcx.codegeneration.jit.compile_forms(
+        [a0, u * v * ufl.dx],
+        cache_dir=tmp_path,
+        cffi_extra_compile_args=compile_args,
+        split_translation_units=True,
+    )
+    objects = set(tmp_path.joinpath("objects").glob("*.o"))
+    assert len(objects) == 1
+
+    # Only the new integral of another module is compiled
+    compiled_forms, _, _ = ffcx.codegeneration.jit.compile_forms(
+        [a1],
+        cache_dir=tmp_path,
+        cffi_extra_compile_args=compile_args,
+        split_translation_units=True,
+    )
+    assert objects < set(tmp_path.joinpath("objects").glob("*.o"))
+    assert len(list(tmp_path.joinpath("objects").glob("*.o"))) == 2
+    assert compiled_forms[0].form_integral_offsets[3] == 2
+
+
+def _mass_and_stiffness():
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    return f * u * v * ufl.dx, ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + u * v * ufl.ds
+
+
+def test_ir_cache(compile_args, tmp_path, caplog):
+    mass, _ = _mass_and_stiffness()
+    ffcx.codegeneration.jit.compile_forms(
+        [mass], cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+    )
+    assert len(list(tmp_path.joinpath("ir").glob("*.pkl"))) == 1
+
+    # Equivalent forms of another module, built with other compiler
+    # flags, reuse the representation of the mass integral
+    mass, stiffness = _mass_and_stiffness()
+    with caplog.at_level(logging.INFO, logger="ffcx"):
+        ffcx.codegeneration.jit.compile_forms(
+            [mass, stiffness],
+            options={"verbosity": 20},
+            cache_dir=tmp_path,
+            cffi_extra_compile_args=[*compile_args, "-DFFCX_TEST"],
+        )
+    assert "Reused 1 of 3 cached integral IRs." in caplog.text
+    assert ffcx.cache.stats(tmp_path).representations == 3
+    assert ffcx.cache.verify(tmp_path) == []
+
+    # Cached representations give the same code
+    options = ffcx.options.get_options()
+    code = ffcx.compiler.compile_ufl_objects([mass, stiffness], options)
+    options["ir_cache_dir"] = str(tmp_path.joinpath("ir"))
+    assert ffcx.compiler.compile_ufl_objects([mass, stiffness], options) == code
+
+
+def test_code_cache(compile_args, tmp_path, monkeypatch):
+    mass, _ = _mass_and_stiffness()
+    header, source = ffcx.codegeneration.jit.generate_code([mass], cache_dir=tmp_path)
+    assert "ufcx_form" in header and "tabulate_tensor" in source
+    assert len(list(tmp_path.joinpath("code").glob("*.json"))) == 1
+
+    # Other compiler flags and backends only run the C compiler
+    def generate(*args, **kwargs):
+        raise AssertionError("Code generated again")
+
+    monkeypatch.setattr(ffcx.compiler, "compile_ufl_objects", generate)
+    modules = set()
+    for args, backend in (
+        (compile_args, "cffi"),
+        (["-O1"], "cffi"),
+        (["-O1"], "direct"),
+        (["-O1"], "setuptools"),
+    ):
+        compiled_forms, module, code = ffcx.codegeneration.jit.compile_forms(
+            [mass], cache_dir=tmp_path, cffi_extra_compile_args=args, backend=backend
+        )
+        assert code[1] == source
+        assert compiled_forms[0].rank == 2
+        modules.add(module.__name__)
+    assert len(modules) == 4
+    assert ffcx.codegeneration.jit.generate_code([mass], cache_dir=tmp_path) == (header, source)
+
+
+def test_direct_backend(compile_args, tmp_path):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = u * v * ufl.dx
+
+    def mass_matrix(form, module):
+        A = np.zeros((3, 3), dtype=np.float64)
+        w = np.array([], dtype=np.float64)
+        coords = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        form.form_integrals[0].tabulate_tensor_float64(
+            module.ffi.cast("double *", A.ctypes.data),
+            module.ffi.cast("double *", w.ctypes.data),
+            module.ffi.cast("double *", w.ctypes.data),
+            module.ffi.cast("double *", coords.ctypes.data),
+            module.ffi.NULL,
+            module.ffi.NULL,
+        )
+        return A
+
+    compiled_forms, module, code = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args, backend="direct"
+    )
+    assert not module.__file__.endswith(sysconfig.get_config_var("EXT_SUFFIX"))
+    expected = np.array([[2.0, 1.0, 1.0], [1.0, 2.0, 1.0], [1.0, 1.0, 2.0]]) / 24
+    assert np.allclose(mass_matrix(compiled_forms[0], module), expected)
+
+    # Load from the cache directory
+    ffcx.codegeneration.jit.clear_module_memo()
+    compiled_forms, module, code = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args, backend="direct"
+    )
+    assert code == (None, None)
+    assert np.allclose(mass_matrix(compiled_forms[0], module), expected)
+
+
+def test_direct_backend_abi_independent(compile_args, tmp_path, monkeypatch):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+    _, module, code = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args, backend="direct"
+    )
+    header = tmp_path.joinpath(module.__name__ + ".h").read_text()
+    assert "extern ufcx_form form_" in header
+
+    # Another Python ABI loads the same library
+    ffcx.codegeneration.jit.clear_module_memo()
+    monkeypatch.setitem(sysconfig.get_config_vars(), "SOABI", "other-abi")
+    monkeypatch.setitem(sysconfig.get_config_vars(), "EXT_SUFFIX", ".other-abi.so")
+    _, module2, code = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args, backend="direct"
+    )
+    assert code == (None, None)
+    assert module2.__file__ == module.__file__
+
+
+@pytest.mark.skipif(sys.platform.startswith("win32"), reason="Needs a POSIX shell")
+def test_compiler_environment(compile_args, tmp_path, monkeypatch):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+
+    compiled_forms, module, _ = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+    )
+
+    # Compiler and linker wrappers logging their arguments
+    cc = " ".join(ffcx.codegeneration.ccompiler.compiler())
+    log = tmp_path.joinpath("commands.log")
+    for name in ("cc", "ld"):
+        wrapper = tmp_path.joinpath(f"{name}.sh")
+        wrapper.write_text(f'#!/bin/sh\necho "{name} $*" >> {log}\nexec {cc} "$@"\n')
+        wrapper.chmod(0o755)
+    ldshared = sysconfig.get_config_var("LDSHARED").split()[1:]
+    monkeypatch.setenv("CC", str(tmp_path.joinpath("cc.sh")))
+    monkeypatch.setenv("LDSHARED", " ".join([str(tmp_path.joinpath("ld.sh")), *ldshared]))
+    monkeypatch.setenv("CFLAGS", "-DFFCX_TEST")
+    compiled_forms, module2, _ = ffcx.codegeneration.jit.compile_forms(
+        [a], cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+    )
+    assert module2.__name__ != module.__name__
+    assert compiled_forms[0].rank == 2
+
+    # The compiler identifies itself for the signature, compiles the
+    # module and the linker links it
+    commands = log.read_text().splitlines()
+    assert commands[0] == "cc --version"
+    assert commands[-1].startswith("ld ")
+    (compile_command,) = [command for command in commands if " -c " in command]
+    # The environment CFLAGS are added to the Python CFLAGS
+    flags = compile_command.split()
+    assert "-DFFCX_TEST" in flags
+    assert all(flag in flags for flag in sysconfig.get_config_var("CFLAGS").split())
+
+
+@pytest.mark.parametrize("backend", ["cffi", "direct"])
+def test_compile_many(compile_args, tmp_path, backend):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+    L = f * v * ufl.dx
+    points = np.array([[0.0, 0.0], [1.0, 0.0]])
+
+    # The same module twice: the second waits for the first
+    modules = [[a], [L], [a, L], [(ufl.grad(f), points)], [a]]
+    futures = ffcx.codegeneration.jit.compile_many(
+        modules,
+        max_workers=2,
+        cache_dir=tmp_path,
+        cffi_extra_compile_args=compile_args,
+        backend=backend,
+    )
+    results = [future.result() for future in futures]
+    assert [len(r[0]) for r in results] == [1, 1, 2, 1, 1]
+    assert results[0][1].__name__ == results[4][1].__name__
+    assert results[0][1].__name__ != results[2][1].__name__
+    assert results[3][1].__name__.startswith("libffcx_expressions_")
+
+    future = ffcx.codegeneration.jit.compile_forms_async(
+        [a, L], cache_dir=tmp_path, cffi_extra_compile_args=compile_args, backend=backend
+    )
+    assert future.result()[1] is results[2][1]
+
+
+def test_compile_async_errors(tmp_path):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+
+    # Code generation fails, and the module is not left locked
+    for _ in range(2):
+        future = ffcx.codegeneration.jit.compile_forms_async(
+            [u * u * v * ufl.dx], cache_dir=tmp_path
+        )
+        with pytest.raises(ufl.algorithms.check_arities.ArityMismatch):
+            future.result()
+
+    # Compilation fails, then fails fast with the recorded diagnostic
+    args = ["-fno-such-compiler-flag"]
+    for message in ("no-such-compiler-flag", "failed previously"):
+        future = ffcx.codegeneration.jit.compile_forms_async(
+            [u * v * ufl.dx], cache_dir=tmp_path, cffi_extra_compile_args=args
+        )
+        with pytest.raises(RuntimeError, match=message):
+            future.result()
+
+
+def test_concurrent_compilation(compile_args):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    forms = [
+        ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + float(k + 1) * u * v * ufl.dx
+        for k in range(8)
+    ]
+
+    handler = logging.StreamHandler(io.StringIO())
+    logging.getLogger().addHandler(handler)
+    stdout = sys.stdout
+    try:
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            results = list(
+                pool.map(
+                    lambda form: ffcx.codegeneration.jit.compile_forms(
+                        [form], cffi_extra_compile_args=compile_args
+                    ),
+                    forms,
+                )
+            )
+        assert handler in logging.getLogger().handlers
+        assert sys.stdout is stdout
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    K = np.array([[1.0, -0.5, -0.5], [-0.5, 0.5, 0.0], [-0.5, 0.0, 0.5]])
+    M = np.array([[2.0, 1.0, 1.0], [1.0, 2.0, 1.0], [1.0, 1.0, 2.0]]) / 24
+    coords = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    w = np.array([], dtype=np.float64)
+    for k, (compiled_forms, module, code) in enumerate(results):
+        A = np.zeros((3, 3), dtype=np.float64)
+        compiled_forms[0].form_integrals[0].tabulate_tensor_float64(
+            module.ffi.cast("double *", A.ctypes.data),
+            module.ffi.cast("double *", w.ctypes.data),
+            module.ffi.cast("double *", w.ctypes.data),
+            module.ffi.cast("double *", coords.ctypes.data),
+            module.ffi.NULL,
+            module.ffi.NULL,
+        )
+        assert np.allclose(A, K + (k + 1) * M)
+
+
+def test_cache_prune(compile_args, tmp_path, capsys):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    forms = [float(k + 1) * u * v * ufl.dx for k in range(3)]
+
+    names = []
+    for k, form in enumerate(forms):
+        _, module, code = ffcx.codegeneration.jit.compile_forms(
+            [form], cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+        )
+        names.append(module.__name__)
+        # Pretend the module was last used k hours ago
+        marker = tmp_path.joinpath(f"{module.__name__}.c.cached")
+        os.utime(marker, (time.time() - 3600 * k, time.time() - 3600 * k))
+
+    def modules():
+        return [entry for entry in ffcx.cache.entries(tmp_path) if entry.kind == "module"]
+
+    entries = modules()
+    assert [entry.name for entry in entries] == names[::-1]
+    assert all(entry.status == "ready" for entry in ffcx.cache.entries(tmp_path))
+    assert ffcx.cache.stats(tmp_path).ready == 3
+    assert ffcx.cache.stats(tmp_path).code == 3
+    assert ffcx.cache.verify(tmp_path) == []
+
+    # A locked module is never evicted
+    with FileLock(tmp_path.joinpath(f"{names[2]}.lock")):
+        evicted = ffcx.cache.prune(tmp_path, max_size=entries[-1].size)
+    assert [entry.name for entry in evicted] == [names[1]]
+    evicted = ffcx.cache.prune(tmp_path, max_size=entries[-1].size)
+    assert [entry.name for entry in evicted] == [names[2]]
+    assert [entry.name for entry in modules()] == [names[0]]
+
+    # Recently used entries are kept
+    assert ffcx.cache.prune(tmp_path, max_size=0) == []
+    assert ffcx.cache.main([str(tmp_path), "--min-age", "0", "prune", "--max-size", "0"]) == 0
+    # The module, and the code and representations of the three forms
+    assert "Evicted 7 entries" in capsys.readouterr().out
+    assert ffcx.cache.entries(tmp_path) == []
+
+    # An evicted module is compiled again
+    ffcx.codegeneration.jit.clear_module_memo()
+    _, module, code = ffcx.codegeneration.jit.compile_forms(
+        [forms[0]], cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+    )
+    assert code[1] is not None
+    assert ffcx.cache.main([str(tmp_path), "stats"]) == 0
+    assert "ready:      1" in capsys.readouterr().out
+
+
+def test_failed_compilation(tmp_path):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = u * v * ufl.dx
+    args = ["-fno-such-compiler-flag"]
+
+    with pytest.raises(RuntimeError, match="no-such-compiler-flag") as e:
+        ffcx.codegeneration.jit.compile_forms([a], cache_dir=tmp_path, cffi_extra_compile_args=args)
+    assert "failed previously" not in str(e.value)
+    modules = [entry for entry in ffcx.cache.entries(tmp_path) if entry.kind == "module"]
+    assert [entry.status for entry in modules] == ["failed"]
+
+    # Fails fast, with the recorded diagnostic
+    with pytest.raises(RuntimeError, match=r"failed previously(.|\n)*no-such-compiler-flag"):
+        ffcx.codegeneration.jit.compile_forms([a], cache_dir=tmp_path, cffi_extra_compile_args=args)
+
+    # Unless asked to retry, or the failure is cleared
+    with pytest.raises(RuntimeError) as e:
+        ffcx.codegeneration.jit.compile_forms(
+            [a], cache_dir=tmp_path, cffi_extra_compile_args=args, retry_failed=True
+        )
+    assert "failed previously" not in str(e.value)
+    assert ffcx.cache.clear_failed(tmp_path) != []
+    with pytest.raises(RuntimeError) as e:
+        ffcx.codegeneration.jit.compile_forms([a], cache_dir=tmp_path, cffi_extra_compile_args=args)
+    assert "failed previously" not in str(e.value)
+
+
+def test_failed_compilation_wakeup(tmp_path):
+    """Waiters fail as soon as the compilation they wait for fails."""
+    lock = FileLock(tmp_path.joinpath("libffcx_forms_test.lock"))
+    assert lock.acquire(timeout=0)
+
+    def fail():
+        time.sleep(0.2)
+        tmp_path.joinpath("libffcx_forms_test.c.failed").write_text("error: broken")
+        lock.release()
+
+    thread = threading.Thread(target=fail)
+    thread.start()
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match="error: broken"):
+        ffcx.codegeneration.jit.get_cached_module("libffcx_forms_test", [], tmp_path, 10)
+    assert time.monotonic() - t0 < 0.9
+    thread.join()
@@ -0,0 +1,133 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import basix.ufl
+import numpy as np
+import pytest
+import ufl
+
+import ffcx.compiler
+import ffcx.element_interface
+import ffcx.ir.elementtables
+import ffcx.options
+
+
+@pytest.fixture
+def table_memo():
+    ffcx.ir.elementtables.clear_table_memo()
+    yield ffcx.ir.elementtables
+    ffcx.ir.elementtables.set_table_memo_dir(None)
+    ffcx.ir.elementtables.set_table_memo_size(1024)
+    ffcx.ir.elementtables.clear_table_memo()
+
+
+def _forms():
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    return [
+        ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + u * v * ufl.ds,
+        ufl.avg(u) * ufl.avg(v) * ufl.dS,
+    ]
+
+
+def test_table_memo(table_memo):
+    options = ffcx.options.get_options()
+    forms = _forms()
+    reference = ffcx.compiler.compile_ufl_objects(forms, options)
+    info = table_memo.table_memo_info()
+    assert info.misses > 0
+    # Facet tables of different facets and permutations are shared
+    # between integrals and forms
+    assert info.hits > 0
+
+    # Compiling again reuses all tables
+    assert ffcx.compiler.compile_ufl_objects(forms, options) == reference
+    info2 = table_memo.table_memo_info()
+    assert info2.misses == info.misses
+    assert info2.hits > info.hits
+
+    table_memo.set_table_memo_size(0)
+    assert table_memo.table_memo_info().currsize == 0
+    assert ffcx.compiler.compile_ufl_objects(forms, options) == reference
+    assert table_memo.table_memo_info().misses == info.misses
+
+
+def test_table_memo_dir(table_memo, tmp_path):
+    options = ffcx.options.get_options()
+    table_memo.set_table_memo_dir(tmp_path)
+    forms = _forms()
+    reference = ffcx.compiler.compile_ufl_objects(forms, options)
+    misses = table_memo.table_memo_info().misses
+    assert len(list(tmp_path.glob("*.npy"))) == misses
+
+    # A new process starts with an empty memo, and loads the tables
+    table_memo.clear_table_memo()
+    assert ffcx.compiler.compile_ufl_objects(forms, options) == reference
+    info = table_memo.table_memo_info()
+    assert info.misses == 0
+    assert info.loads == misses
+
+
+def test_table_memo_read_only(table_memo):
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    points = np.array([[0.25, 0.25], [0.5, 0.0]])
+    table = table_memo._table_memo.tabulate(element, 1, points)
+    assert not table.flags.writeable
+    assert np.array_equal(table, element.tabulate(1, points))
+    assert table_memo._table_memo.tabulate(element, 1, points.copy()) is table
+
+
+def test_table_index():
+    rng = np.random.default_rng(0)
+    tables = [rng.uniform(-1, 1, (1, 3, 4, 5)) for _ in range(50)]
+    index = ffcx.ir.elementtables.TableIndex()
+    for i, table in enumerate(tables):
+        index.add(f"t{i}", table)
+    index.add("t50", tables[7] + 1e-10)
+    index.add("other_shape", tables[7].reshape(1, 3, 5, 4))
+    assert len(index) == 52
+
+    perturbed = tables[7] * (1 + 5e-7)
+    matches = [
+        name
+        for name, table in index.candidates(perturbed)
+        if ffcx.ir.elementtables.equal_tables(perturbed, table)
+    ]
+    # The same tables, in the same order, as a scan over all tables
+    assert matches == ["t7", "t50"]
+    assert len(index.candidates(tables[3])) < 10
+    assert index.candidates(np.zeros((2, 2))) == []
+
+    index.add("t7", tables[8])
+    assert len(index) == 52
+    assert [name for name, _ in index.candidates(tables[8])][:2] == ["t7", "t8"]
+
+
+def test_permute_quadrature_points():
+    points = np.array([[0.1, 0.2], [0.6, 0.3]])
+    permute = ffcx.ir.elementtables.permute_quadrature_triangle
+    assert np.array_equal(permute(points, 0, 1), [[0.2, 1 - 0.1 - 0.2], [0.3, 1 - 0.6 - 0.3]])
+    assert np.array_equal(permute(points, 1, 1), [[1 - 0.1 - 0.2, 0.2], [1 - 0.6 - 0.3, 0.3]])
+    assert np.allclose(permute(points, 0, 3), points)
+    permute = ffcx.ir.elementtables.permute_quadrature_quadrilateral
+    assert np.array_equal(permute(points, 1, 1), [[0.9, 0.2], [0.4, 0.3]])
+    assert np.allclose(permute(points, 0, 4), points)
+    permute = ffcx.ir.elementtables.permute_quadrature_interval
+    assert np.array_equal(permute(points[:, :1], 1), [[0.9], [0.4]])
+
+
+@pytest.mark.parametrize("cell", ["triangle", "quadrilateral", "tetrahedron", "hexahedron"])
+def test_map_facet_points(cell):
+    geometry = basix.geometry(getattr(basix.CellType, cell))
+    facets = basix.topology(getattr(basix.CellType, cell))[-2]
+    points = np.random.default_rng(0).uniform(0, 0.5, (7, len(geometry[0]) - 1))
+    for facet, vertices in enumerate(facets):
+        mapped = ffcx.element_interface.map_facet_points(points, facet, cell)
+        v = geometry[vertices]
+        expected = [v[0] + sum((v[i + 1] - v[0]) * x for i, x in enumerate(p)) for p in points]
+        assert np.array_equal(mapped, expected)
@@ -14,7 +14,8 @@ import ufl
 import ffcx.codegeneration.jit
 
 
-def test_matvec(compile_args):
+@pytest.mark.parametrize("backend", ["cffi", "direct"])
+def test_matvec(compile_args, backend):
     """Test evaluation of linear rank-0 form.
 
     Evaluates expression c * A_ij * f_j where c is a Constant,
@@ -33,7 +34,7 @@ def test_matvec(compile_args):
 
     points = np.array([[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
     obj, module, code = ffcx.codegeneration.jit.compile_expressions(
-        [(expr, points)], cffi_extra_compile_args=compile_args
+        [(expr, points)], cffi_extra_compile_args=compile_args, backend=backend
     )
 
     ffi = cffi.FFI()
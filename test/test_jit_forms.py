@@ -14,6 +14,8 @@ import ufl
 from sympy.abc import x, y, z
 
 import ffcx.codegeneration.jit
+import ffcx.compiler
+import ffcx.options
 from ffcx.codegeneration.utils import dtype_to_c_type, dtype_to_scalar_dtype
 
 
@@ -1385,3 +1387,428 @@ def test_ds_prism(compile_args, dtype):
             ]
         ),
     )
+
+
+def test_split_translation_units(compile_args):
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx + u * v * ufl.ds + f * u * v * ufl.dx(1)
+    L = f * v * ufl.dx
+    forms = [a, L]
+
+    coords = np.array([[0.0, 0.0, 0.0], [2.0, 0.0, 0.0], [0.0, 1.0, 0.0]], dtype=np.float64)
+    w = np.arange(1, 7, dtype=np.float64)
+    c = np.array([], dtype=np.float64)
+    facet = np.array([1], dtype=np.intc)
+    perm = np.array([0], dtype=np.uint8)
+
+    def tabulate(compiled_forms, module):
+        ffi = module.ffi
+        tensors = []
+        for form in compiled_forms:
+            offsets = form.form_integral_offsets
+            for i in range(offsets[0], offsets[3]):
+                integral = form.form_integrals[i]
+                A = np.zeros((6,) * form.rank, dtype=np.float64)
+                integral.tabulate_tensor_float64(
+                    ffi.cast("double *", A.ctypes.data),
+                    ffi.cast("double *", w.ctypes.data),
+                    ffi.cast("double *", c.ctypes.data),
+                    ffi.cast("double *", coords.ctypes.data),
+                    ffi.cast("int *", facet.ctypes.data),
+                    ffi.cast("uint8_t *", perm.ctypes.data),
+                )
+                tensors.append(A)
+        return tensors
+
+    compiled_forms, module, _ = ffcx.codegeneration.jit.compile_forms(
+        forms, cffi_extra_compile_args=compile_args
+    )
+    reference = tabulate(compiled_forms, module)
+
+    compiled_forms, module, _ = ffcx.codegeneration.jit.compile_forms(
+        forms,
+        options={"table_atol": 1e-10},
+        cffi_extra_compile_args=compile_args,
+        split_translation_units=True,
+        compile_workers=2,
+    )
+    assert len(reference) == 4
+    for A, A_ref in zip(tabulate(compiled_forms, module), reference):
+        assert np.allclose(A, A_ref)
+
+
+@pytest.mark.parametrize(
+    "dtype",
+    [
+        "float64",
+        pytest.param(
+            "complex128",
+            marks=pytest.mark.xfail(
+                sys.platform.startswith("win32"),
+                raises=NotImplementedError,
+                reason="missing _Complex",
+            ),
+        ),
+    ],
+)
+def test_batched_kernels(dtype, compile_args):
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    k = ufl.Constant(domain)
+    n = ufl.FacetNormal(domain)
+    a = (
+        k * (1 + f**2) * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        + f * ufl.inner(ufl.inner(ufl.grad(u), n), v) * ufl.ds
+        + ufl.jump(f) * ufl.inner(ufl.avg(ufl.grad(u)), ufl.jump(ufl.grad(v))) * ufl.dS
+    )
+    compiled_forms, module, _ = ffcx.codegeneration.jit.compile_forms(
+        [a], options={"scalar_type": dtype, "batch_size": 4}, cffi_extra_compile_args=compile_args
+    )
+    ffi = module.ffi
+    form = compiled_forms[0]
+
+    batch_size = 4
+    rng = np.random.default_rng(0)
+    xdtype = dtype_to_scalar_dtype(dtype)
+    c_type, c_xtype = dtype_to_c_type(dtype), dtype_to_c_type(xdtype)
+    c = np.array([2.5], dtype=dtype)
+    for integral_type, num_cells in [("cell", 1), ("exterior_facet", 1), ("interior_facet", 2)]:
+        index = getattr(module.lib, integral_type)
+        integral = form.form_integrals[form.form_integral_offsets[index]]
+        assert integral.batch_size == batch_size
+
+        # Data of each cell in the batch
+        vertices = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        coords = vertices + rng.uniform(-0.2, 0.2, (batch_size, num_cells, 3, 3))
+        coords[..., 2] = 0
+        coords = coords.reshape(batch_size, -1).astype(xdtype)
+        w = rng.uniform(-1, 1, (batch_size, 6 * num_cells)).astype(dtype)
+        facets = rng.integers(0, 3, (batch_size, num_cells)).astype(np.intc)
+        perms = rng.integers(0, 2, (batch_size, num_cells)).astype(np.uint8)
+        A = np.zeros((batch_size, (6 * num_cells) ** 2), dtype=dtype)
+
+        def tabulate(kernel, A, w, coords, facets, perms):
+            kernel(
+                ffi.cast(f"{c_type} *", A.ctypes.data),
+                ffi.cast(f"{c_type} *", w.ctypes.data),
+                ffi.cast(f"{c_type} *", c.ctypes.data),
+                ffi.cast(f"{c_xtype} *", coords.ctypes.data),
+                ffi.cast("int *", facets.ctypes.data),
+                ffi.cast("uint8_t *", perms.ctypes.data),
+            )
+
+        kernel = getattr(integral, f"tabulate_tensor_{dtype}")
+        for b in range(batch_size):
+            tabulate(kernel, A[b], w[b], coords[b], facets[b], perms[b])
+        assert np.linalg.norm(A) > 0
+
+        # Arguments interleaved cell by cell
+        A_batch = np.zeros(A.T.shape, dtype=dtype)
+        kernel = getattr(integral, f"tabulate_tensor_batch_{dtype}")
+        data = [np.ascontiguousarray(x.T) for x in (w, coords, facets, perms)]
+        tabulate(kernel, A_batch, *data)
+        assert np.allclose(A_batch.T, A)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "complex128"])
+def test_action_kernels(dtype, compile_args):
+    element = basix.ufl.element("Lagrange", "triangle", 2, shape=(2,))
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    a = (
+        (1 + f[0] ** 2) * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        + ufl.inner(u[0], v[1]) * ufl.dx
+        + ufl.inner(ufl.dot(ufl.grad(u), f), v) * ufl.ds
+        + ufl.inner(ufl.jump(u), ufl.avg(v)) * ufl.dS
+    )
+    L = ufl.inner(f, v) * ufl.dx
+    compiled_forms, module, _ = ffcx.codegeneration.jit.compile_forms(
+        [a, L],
+        options={"scalar_type": dtype, "action_kernels": True},
+        cffi_extra_compile_args=compile_args,
+    )
+    ffi = module.ffi
+    form_a, form_L = compiled_forms
+    assert all(
+        getattr(form_L.form_integrals[i], f"tabulate_action_{dtype}") == ffi.NULL
+        for i in range(form_L.form_integral_offsets[3])
+    )
+
+    rng = np.random.default_rng(0)
+    xdtype = dtype_to_scalar_dtype(dtype)
+    c_type, c_xtype = dtype_to_c_type(dtype), dtype_to_c_type(xdtype)
+    c = np.array([], dtype=dtype)
+    facets = np.array([1, 2], dtype=np.intc)
+    perms = np.array([0, 1], dtype=np.uint8)
+    for integral_type, num_cells in [("cell", 1), ("exterior_facet", 1), ("interior_facet", 2)]:
+        offsets = form_a.form_integral_offsets
+        index = getattr(module.lib, integral_type)
+        ndofs = 12 * num_cells
+        coords = np.array([[0.1, 0.0, 0.0], [1.0, 0.2, 0.0], [0.0, 1.3, 0.0]] * num_cells)
+        coords = coords.astype(xdtype)
+        w = rng.uniform(-1, 1, ndofs).astype(dtype)
+        x = rng.uniform(-1, 1, ndofs).astype(dtype)
+        for i in range(offsets[index], offsets[index + 1]):
+            integral = form_a.form_integrals[i]
+            A = np.zeros((ndofs, ndofs), dtype=dtype)
+            y = np.zeros(ndofs, dtype=dtype)
+            args = [
+                ffi.cast(f"{c_type} *", w.ctypes.data),
+                ffi.cast(f"{c_type} *", c.ctypes.data),
+                ffi.cast(f"{c_xtype} *", coords.ctypes.data),
+                ffi.cast("int *", facets.ctypes.data),
+                ffi.cast("uint8_t *", perms.ctypes.data),
+            ]
+            getattr(integral, f"tabulate_tensor_{dtype}")(
+                ffi.cast(f"{c_type} *", A.ctypes.data), *args
+            )
+            getattr(integral, f"tabulate_action_{dtype}")(
+                ffi.cast(f"{c_type} *", y.ctypes.data),
+                ffi.cast(f"{c_type} *", x.ctypes.data),
+                *args,
+            )
+            assert np.linalg.norm(A) > 0
+            assert np.allclose(y, A @ x)
+
+
+@pytest.mark.parametrize("dtype", ["float64", "complex128"])
+def test_tensor_representation(dtype, compile_args):
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    vector_space = ufl.FunctionSpace(
+        domain, basix.ufl.element("Lagrange", "triangle", 1, shape=(2,))
+    )
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    b = ufl.Coefficient(vector_space)
+    k = ufl.Constant(domain)
+    forms = [
+        k * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        + ufl.inner((f**2 / k - 1) * u, v) * ufl.dx
+        + ufl.inner(ufl.dot(b, ufl.grad(u)), v) * ufl.dx(1)
+        + ufl.inner((f + 2) * u, v) * ufl.ds,
+        # Not polynomial in the coefficient: uses quadrature
+        ufl.inner(ufl.sin(f), v) * ufl.dx,
+        # Only the integral with metadata uses the tensor representation
+        ufl.inner(f, v) * ufl.dx(metadata={"representation": "tensor"})
+        + ufl.inner(f, v) * ufl.dx(1),
+    ]
+
+    compiled = {}
+    for representation in ("quadrature", "tensor"):
+        options = {
+            "scalar_type": dtype,
+            "representation": representation,
+            "action_kernels": True,
+        }
+        compiled[representation] = ffcx.codegeneration.jit.compile_forms(
+            forms, options=options, cffi_extra_compile_args=compile_args
+        )
+    _, code = ffcx.compiler.compile_ufl_objects(
+        forms, ffcx.options.get_options({"scalar_type": dtype, "representation": "tensor"})
+    )
+    assert code.count("Section: Tensor Contraction") == 4
+    # Integrals with reference tensors larger than the maximum size use quadrature
+    _, code = ffcx.compiler.compile_ufl_objects(
+        forms,
+        ffcx.options.get_options(
+            {"scalar_type": dtype, "representation": "tensor", "reference_tensor_max_size": 36}
+        ),
+    )
+    assert code.count("Section: Tensor Contraction") == 2
+
+    rng = np.random.default_rng(0)
+    xdtype = dtype_to_scalar_dtype(dtype)
+    c_type, c_xtype = dtype_to_c_type(dtype), dtype_to_c_type(xdtype)
+    coords = np.array([[0.1, 0.0, 0.0], [1.0, 0.2, 0.0], [0.0, 1.3, 0.0]], dtype=xdtype)
+    w = rng.uniform(-1, 1, 12).astype(dtype)
+    c = np.array([2.5], dtype=dtype)
+    x = rng.uniform(-1, 1, 6).astype(dtype)
+    perms = np.array([0], dtype=np.uint8)
+    for i, form in enumerate(forms):
+        rank = len(form.arguments())
+        for integral_type in ("cell", "exterior_facet"):
+            results = []
+            for compiled_forms, module, _ in compiled.values():
+                ffi = module.ffi
+                offsets = compiled_forms[i].form_integral_offsets
+                index = getattr(module.lib, integral_type)
+                for j in range(offsets[index], offsets[index + 1]):
+                    integral = compiled_forms[i].form_integrals[j]
+                    for facet in range(3):
+                        A = np.zeros((6,) * rank, dtype=dtype)
+                        y = np.zeros(6, dtype=dtype)
+                        args = [
+                            ffi.cast(f"{c_type} *", w.ctypes.data),
+                            ffi.cast(f"{c_type} *", c.ctypes.data),
+                            ffi.cast(f"{c_xtype} *", coords.ctypes.data),
+                            ffi.cast("int *", np.array([facet], dtype=np.intc).ctypes.data),
+                            ffi.cast("uint8_t *", perms.ctypes.data),
+                        ]
+                        getattr(integral, f"tabulate_tensor_{dtype}")(
+                            ffi.cast(f"{c_type} *", A.ctypes.data), *args
+                        )
+                        results.append(A)
+                        if rank == 2:
+                            getattr(integral, f"tabulate_action_{dtype}")(
+                                ffi.cast(f"{c_type} *", y.ctypes.data),
+                                ffi.cast(f"{c_type} *", x.ctypes.data),
+                                *args,
+                            )
+                            assert np.allclose(y, A @ x)
+            quadrature, tensor = results[: len(results) // 2], results[len(results) // 2 :]
+            assert len(quadrature) == len(tensor)
+            for A_quadrature, A_tensor in zip(quadrature, tensor):
+                assert np.allclose(A_tensor, A_quadrature)
+
+
+def test_tensor_representation_metadata():
+    element = basix.ufl.element("Lagrange", "triangle", 1)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    tensor = {"representation": "tensor"}
+    options = ffcx.options.get_options()
+
+    # Integrals of one kernel use the tensor representation only if all
+    # of them request it
+    for metadata, expected in [
+        ((tensor, tensor), True),
+        ((tensor, {}), False),
+        (({}, tensor), False),
+    ]:
+        a = ufl.inner(f * u, v) * ufl.dx(metadata=metadata[0]) + ufl.inner(
+            ufl.grad(u), ufl.grad(v)
+        ) * ufl.dx(metadata={**metadata[1], "quadrature_degree": 1})
+        _, code = ffcx.compiler.compile_ufl_objects([a], options)
+        assert ("Section: Tensor Contraction" in code) == expected
+
+
+@pytest.mark.parametrize("dtype", ["float64", "complex128"])
+def test_block_modes(dtype, compile_args, tmp_path):
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    k = ufl.Constant(domain)
+    a = (
+        k * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        + ufl.inner((1 + f**2) * u, v) * ufl.dx
+        + ufl.inner(k * u, v) * ufl.ds
+        + ufl.inner(f * u.dx(0), v) * ufl.ds
+        + ufl.inner(ufl.avg(f) * ufl.jump(u), ufl.jump(v)) * ufl.dS
+    )
+    options = {"scalar_type": dtype, "action_kernels": True, "ir_cache_dir": str(tmp_path / "ir")}
+    # Integrate all blocks in the quadrature loop, as before block modes
+    partial_options = {**options, "preintegration_max_size": 0, "premultiplication_max_size": 0}
+    _, code = ffcx.compiler.compile_ufl_objects([a], ffcx.options.get_options(options))
+    assert code.count("Section: Preintegrated Blocks") == 4
+    assert "PM0_" in code
+    _, code = ffcx.compiler.compile_ufl_objects([a], ffcx.options.get_options(partial_options))
+    assert "Preintegrated Blocks" not in code
+    assert "PM0_" not in code
+    assert "PI0_" not in code
+
+    compiled = [
+        ffcx.codegeneration.jit.compile_forms(
+            [a], options=opts, cache_dir=tmp_path / "cache", cffi_extra_compile_args=compile_args
+        )
+        for opts in (options, partial_options)
+    ]
+    assert compiled[0][1].__name__ != compiled[1][1].__name__
+
+    rng = np.random.default_rng(0)
+    xdtype = dtype_to_scalar_dtype(dtype)
+    c_type, c_xtype = dtype_to_c_type(dtype), dtype_to_c_type(xdtype)
+    c = np.array([2.5], dtype=dtype)
+    perms = np.array([0, 1], dtype=np.uint8)
+    for integral_type, num_cells in [("cell", 1), ("exterior_facet", 1), ("interior_facet", 2)]:
+        ndofs = 6 * num_cells
+        coords = np.array([[0.1, 0.0, 0.0], [1.0, 0.2, 0.0], [0.0, 1.3, 0.0]] * num_cells)
+        coords = coords.astype(xdtype)
+        w = rng.uniform(-1, 1, ndofs).astype(dtype)
+        x = rng.uniform(-1, 1, ndofs).astype(dtype)
+        results = []
+        for compiled_forms, module, _ in compiled:
+            ffi = module.ffi
+            offsets = compiled_forms[0].form_integral_offsets
+            index = getattr(module.lib, integral_type)
+            for i in range(offsets[index], offsets[index + 1]):
+                integral = compiled_forms[0].form_integrals[i]
+                for facet in range(3):
+                    A = np.zeros((ndofs, ndofs), dtype=dtype)
+                    y = np.zeros(ndofs, dtype=dtype)
+                    args = [
+                        ffi.cast(f"{c_type} *", w.ctypes.data),
+                        ffi.cast(f"{c_type} *", c.ctypes.data),
+                        ffi.cast(f"{c_xtype} *", coords.ctypes.data),
+                        ffi.cast("int *", np.array([facet, 1], dtype=np.intc).ctypes.data),
+                        ffi.cast("uint8_t *", perms.ctypes.data),
+                    ]
+                    getattr(integral, f"tabulate_tensor_{dtype}")(
+                        ffi.cast(f"{c_type} *", A.ctypes.data), *args
+                    )
+                    getattr(integral, f"tabulate_action_{dtype}")(
+                        ffi.cast(f"{c_type} *", y.ctypes.data),
+                        ffi.cast(f"{c_type} *", x.ctypes.data),
+                        *args,
+                    )
+                    assert np.allclose(y, A @ x)
+                    results.append(A)
+        modes, partial = results[: len(results) // 2], results[len(results) // 2 :]
+        assert len(modes) == len(partial) > 0
+        for A_modes, A_partial in zip(modes, partial):
+            assert np.linalg.norm(A_partial) > 0
+            assert np.allclose(A_modes, A_partial)
+
+
+def test_preintegration_max_size(compile_args, tmp_path):
+    # Facet tables of P8 on tetrahedra have 4 * 165 * 165 > 2**16 values
+    element = basix.ufl.element("Lagrange", "tetrahedron", 8)
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "tetrahedron", 1, shape=(3,)))
+    space = ufl.FunctionSpace(domain, element)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    a = ufl.inner(u, v) * ufl.ds
+
+    compiled = []
+    for max_size in (2**16, 2**20):
+        options = {"preintegration_max_size": max_size}
+        _, code = ffcx.compiler.compile_ufl_objects([a], ffcx.options.get_options(options))
+        assert ("Section: Preintegrated Blocks" in code) == (max_size > 2**16)
+        compiled.append(
+            ffcx.codegeneration.jit.compile_forms(
+                [a], options=options, cache_dir=tmp_path, cffi_extra_compile_args=compile_args
+            )
+        )
+
+    coords = np.array(
+        [[0.1, 0.0, 0.0], [1.0, 0.2, 0.0], [0.0, 1.3, 0.1], [0.2, 0.1, 0.9]], dtype=np.float64
+    )
+    results = []
+    for compiled_forms, module, _ in compiled:
+        ffi = module.ffi
+        integral = compiled_forms[0].form_integrals[0]
+        A = np.zeros((165, 165), dtype=np.float64)
+        integral.tabulate_tensor_float64(
+            ffi.cast("double *", A.ctypes.data),
+            ffi.NULL,
+            ffi.NULL,
+            ffi.cast("double *", coords.ctypes.data),
+            ffi.cast("int *", np.array([2], dtype=np.intc).ctypes.data),
+            ffi.NULL,
+        )
+        results.append(A)
+    assert np.linalg.norm(results[0]) > 0
+    assert np.allclose(results[0], results[1])
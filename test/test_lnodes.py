@@ -1,4 +1,5 @@
 import importlib
+import io
 
 import numpy as np
 import pytest
@@ -102,3 +103,81 @@ def test_gemv(dtype):
 
     gemv(py, pA, px)
     assert np.all(y == result)
+
+
+def test_format_nested_sections():
+    A = L.Symbol("A", dtype=L.DataType.SCALAR)
+    t = L.Symbol("t", dtype=L.DataType.REAL)
+    w = L.Symbol("w", dtype=L.DataType.REAL)
+    n = L.Symbol("n", dtype=L.DataType.INT)
+    i = L.Symbol("i", dtype=L.DataType.INT)
+    j = L.Symbol("j", dtype=L.DataType.INT)
+    values = np.array([[[0.0, -0.5], [1 / 3, 1e15]], [[2.0, 1e-20], [-1.0, 0.25]]])
+    table = L.ArrayDecl(t, values=values, const=True)
+    weight = L.VariableDecl(w, L.LiteralFloat(1.0))
+    inner = L.Section(
+        "inner",
+        [L.AssignAdd(A[i], t[0, j, i] * w)],
+        [L.ArrayDecl(n, values=np.array([1, 2]), const=True)],
+        input=[t],
+        output=[A],
+    )
+    loop = L.ForRange(i, 0, 2, body=[L.ForRange(j, 0, 2, body=[inner, L.Comment("done")])])
+    code = L.Section("outer", [loop], [table, weight], input=[t])
+
+    expected = [
+        "// ------------------------ ",
+        "// Section: outer",
+        "// Inputs: t",
+        "// Outputs: t, w",
+        "static const double t[2][2][2] = {{{0.0, -0.5},",
+        "  {0.3333333333333333, 1e+15}},",
+        "  {{2.0, 9.999999999999999e-21},",
+        "  {-1.0, 0.25}}};",
+        "double w = 1.0;",
+        "{",
+        "  for (int i = 0; i < 2; ++i)",
+        "  {",
+        "    for (int j = 0; j < 2; ++j)",
+        "    {",
+        "      // ------------------------ ",
+        "      // Section: inner",
+        "      // Inputs: t",
+        "      // Outputs: A, n",
+        "      static const int n[2] = {1, 2};",
+        "      {",
+        "        A[i] += t[0][j][i] * w;",
+        "      }",
+        "      // ------------------------ ",
+        "      // done",
+        "    }",
+        "  }",
+        "}",
+        "// ------------------------ ",
+        "",
+    ]
+    Q = CFormatter(dtype="float64")
+    assert Q.c_format(code) == "\n".join(expected)
+
+    # Streaming to a file gives the same code
+    stream = io.StringIO()
+    Q.write(code, stream)
+    assert stream.getvalue() == "\n".join(expected)
+
+
+def test_format_table_values():
+    rng = np.random.default_rng(0)
+    special = [0.0, -0.0, 1.0, -3.0, 1e14, 1e15, 1234567890123456.7, 1e16, 1e17, 5e-324]
+    special += [1.0000000000000002, 0.9999999999999999, 12345678901234.000001, np.inf, np.nan]
+    tables = [
+        np.array(special),
+        rng.uniform(-1, 1, (3, 4, 5)),
+        rng.uniform(-1, 1, 200) * 10.0 ** rng.integers(-30, 30, 200),
+        np.round(rng.uniform(-10, 10, 200)) + rng.uniform(-1e-14, 1e-14, 200),
+    ]
+    Q = CFormatter(dtype="float64")
+    for table in tables:
+        flat = [f"{x:.16}" for x in table.ravel()]
+        assert Q._build_initializer_lists(table).replace("{", "").replace("}", "").replace(
+            ",\n  ", ", "
+        ) == ", ".join(flat)
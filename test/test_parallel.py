@@ -0,0 +1,107 @@
+# Copyright (C) 2024 FEniCS Project
+#
+# This file is part of FFCx. (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import os
+import threading
+
+import basix.ufl
+import numpy as np
+import pytest
+import ufl
+
+import ffcx.codegeneration.filelock
+import ffcx.codegeneration.jit
+import ffcx.compiler
+import ffcx.options
+import ffcx.parallel
+
+pytestmark = pytest.mark.skipif(not ffcx.parallel.can_fork(), reason="needs fork")
+
+
+@pytest.fixture(autouse=True)
+def no_threads():
+    """Stop the threads of earlier asynchronous compilations, to fork workers."""
+    with ffcx.codegeneration.jit._executor_lock:
+        if ffcx.codegeneration.jit._executor is not None:
+            ffcx.codegeneration.jit._executor.shutdown()
+            ffcx.codegeneration.jit._executor = None
+    assert ffcx.parallel.other_threads() == []
+
+
+def _forms():
+    element = basix.ufl.element("Lagrange", "triangle", 2)
+    vector = basix.ufl.element("Lagrange", "triangle", 1, shape=(2,))
+    domain = ufl.Mesh(basix.ufl.element("Lagrange", "triangle", 1, shape=(2,)))
+    space = ufl.FunctionSpace(domain, element)
+    vector_space = ufl.FunctionSpace(domain, vector)
+    u, v = ufl.TrialFunction(space), ufl.TestFunction(space)
+    f = ufl.Coefficient(space)
+    b = ufl.Coefficient(vector_space)
+    k = ufl.Constant(domain)
+    n = ufl.FacetNormal(domain)
+    a = (
+        k * ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
+        + ufl.inner(b, ufl.grad(u)) * v * ufl.dx(1)
+        + f * u * v * ufl.ds
+        + ufl.jump(u) * ufl.jump(v) * ufl.dS
+    )
+    L = f * v * ufl.dx + ufl.inner(b, n) * v * ufl.ds
+    points = np.array([[0.25, 0.25], [0.5, 0.1]])
+    return [a, L, (ufl.grad(f) + b, points), (k * f, points)]
+
+
+def test_parallel_compilation():
+    forms = _forms()
+    serial = ffcx.compiler.compile_ufl_objects(forms, ffcx.options.get_options())
+    options = ffcx.options.get_options({"ir_workers": 3})
+    assert ffcx.compiler.compile_ufl_objects(forms, options) == serial
+    options = ffcx.options.get_options({"ir_workers": 2, "codegen_workers": 3})
+    assert ffcx.compiler.compile_ufl_objects(forms, options) == serial
+
+    signature = ffcx.codegeneration.jit._compute_option_signature
+    assert signature(options) == signature(ffcx.options.get_options())
+
+
+def test_parallel_run():
+    def task(i):
+        # Locks cannot be pickled, so this task is run again in the parent
+        return threading.Lock() if i == 2 else (i, os.getpid())
+
+    results = ffcx.parallel.run(task, [(i,) for i in range(4)], workers=2)
+    assert [r[0] for r in results if isinstance(r, tuple)] == [0, 1, 3]
+    assert {r[1] for r in results if isinstance(r, tuple)} != {os.getpid()}
+    assert isinstance(results[2], type(threading.Lock()))
+
+    shared = [object()]
+    results = ffcx.parallel.run(lambda i: shared[0], [(0,), (1,)], 2, lambda: shared)
+    assert results[0] is shared[0] and results[1] is shared[0]
+
+    with pytest.raises(ZeroDivisionError):
+        ffcx.parallel.run(lambda i: 1 / i, [(1,), (0,)], 2)
+
+
+def test_parallel_run_threads(tmp_path):
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        # Forking with other threads alive is unsafe
+        assert ffcx.parallel.other_threads() == [thread.name]
+        results = ffcx.parallel.run(lambda i: os.getpid(), [(0,), (1,)], workers=2)
+        assert results == [os.getpid()] * 2
+    finally:
+        stop.set()
+        thread.join()
+
+    # Lease heartbeats do not prevent forking
+    lock = ffcx.codegeneration.filelock.FileLock(tmp_path.joinpath("test.lock"))
+    lock._lease = True
+    assert lock.acquire(0)
+    try:
+        results = ffcx.parallel.run(lambda i: os.getpid(), [(0,), (1,)], workers=2)
+        assert os.getpid() not in results
+    finally:
+        lock.release()
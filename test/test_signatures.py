@@ -4,6 +4,7 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import gc
 import sys
 
 import basix.ufl
@@ -14,6 +15,7 @@ import ufl
 
 import ffcx.codegeneration.jit
 import ffcx.codegeneration.utils as utils
+import ffcx.naming
 
 
 def generate_kernel(forms, scalar_type, options):
@@ -77,7 +79,7 @@ def test_numba_kernel_signature(dtype):
     a = ufl.inner(ufl.grad(u), ufl.grad(v)) * ufl.dx
 
     # Generate and compile the kernel
-    kernel, code, module = generate_kernel([a], dtype, {})
+    kernel, _, _ = generate_kernel([a], dtype, {})
 
     # Convert to numpy dtype
     np_dtype = np.dtype(dtype)
@@ -97,3 +99,58 @@ def test_numba_kernel_signature(dtype):
         type_name = sig.name.replace(str(np_dtype), utils.dtype_to_c_type(np_dtype))
         ctypes_name = type_name.replace(" *", "*")
         assert ctypes_name == type_name
+
+
+def test_expression_signature_memo(monkeypatch):
+    calls = []
+    compute = ufl.algorithms.signature.compute_expression_signature
+
+    def counting_compute(*args):
+        calls.append(None)
+        return compute(*args)
+
+    monkeypatch.setattr(ufl.algorithms.signature, "compute_expression_signature", counting_compute)
+
+    e = basix.ufl.element("P", "triangle", 1)
+    mesh = ufl.Mesh(basix.ufl.element("P", "triangle", 1, shape=(2,)))
+    f = ufl.Coefficient(ufl.FunctionSpace(mesh, e))
+    expr = ufl.grad(f)
+    points = np.array([[0.0, 0.0], [1.0, 0.0]])
+
+    signature = ffcx.naming.compute_signature([(expr, points)], "")
+    ffcx.naming.expression_name((expr, points), "prefix")
+    assert ffcx.naming.compute_signature([(expr, points)], "") == signature
+    assert len(calls) == 1
+
+    # An equal expression has the same signature, points are not cached
+    assert ffcx.naming.compute_signature([(ufl.grad(f), points)], "") == signature
+    assert ffcx.naming.compute_signature([(expr, 2 * points)], "") != signature
+    assert len(calls) == 2
+
+    key = id(expr)
+    assert key in ffcx.naming._expression_signatures
+    del expr
+    gc.collect()
+    assert key not in ffcx.naming._expression_signatures
+
+
+def test_points_signature():
+    e = basix.ufl.element("P", "triangle", 1)
+    mesh = ufl.Mesh(basix.ufl.element("P", "triangle", 1, shape=(2,)))
+    f = ufl.Coefficient(ufl.FunctionSpace(mesh, e))
+    expr = ufl.grad(f)
+
+    # Arrays differing only in the part elided by repr
+    points0 = np.linspace(0.0, 1.0, 4000).reshape(-1, 2)
+    points1 = points0.copy()
+    points1[1000, 0] += 1e-3
+    assert repr(points0) == repr(points1)
+
+    signature = ffcx.naming.compute_signature([(expr, points0)], "")
+    assert ffcx.naming.compute_signature([(expr, points1)], "") != signature
+    assert ffcx.naming.compute_signature([(expr, points0.copy())], "") == signature
+
+    # Shape and dtype are part of the signature
+    assert ffcx.naming.compute_signature([(expr, points0.reshape(1000, 4))], "") != signature
+    assert ffcx.naming.compute_signature([(expr, points0.astype(np.float32))], "") != signature
+    assert ffcx.naming.compute_signature([(expr, np.asfortranarray(points0))], "") == signature
@@ -10,6 +10,8 @@ import pytest
 import ufl
 
 import ffcx.codegeneration.jit
+import ffcx.compiler
+import ffcx.options
 from ffcx.codegeneration.utils import dtype_to_c_type, dtype_to_scalar_dtype
 
 
@@ -34,7 +36,7 @@ def create_tensor_product_element(cell_type, degree, variant, shape=None):
         return basix.ufl.blocked_element(uflelement, shape=shape)
 
 
-def generate_kernel(forms, dtype, options):
+def generate_kernel(forms, dtype, options, integral_type="cell"):
     """Generate kernel for given forms."""
     # use a different cache directory for each option
     sf = options.get("sum_factorization", False)
@@ -49,7 +51,7 @@ def generate_kernel(forms, dtype, options):
     form0 = compiled_forms[0]
 
     offsets = form0.form_integral_offsets
-    cell = module.lib.cell
+    cell = getattr(module.lib, integral_type)
     assert offsets[cell + 1] - offsets[cell] == 1
     integral_id = form0.form_integral_ids[offsets[cell]]
     assert integral_id == -1
@@ -114,7 +116,7 @@ def test_bilinear_form(dtype, P, cell_type):
 
     # Use sum factorization
     A1 = np.zeros((ndofs, ndofs), dtype=dtype)
-    kernel, code, module = generate_kernel(
+    kernel, _, module = generate_kernel(
         [a], dtype, options={"scalar_type": dtype, "sum_factorization": True}
     )
     ffi = module.ffi
@@ -128,3 +130,76 @@ def test_bilinear_form(dtype, P, cell_type):
     )
 
     np.testing.assert_allclose(A, A1, rtol=1e-6, atol=1e-6)
+
+
+@pytest.mark.parametrize("P", [2, 3])
+@pytest.mark.parametrize("cell_type", [basix.CellType.quadrilateral, basix.CellType.hexahedron])
+@pytest.mark.parametrize("integral_type", ["cell", "exterior_facet"])
+def test_coefficients_and_geometry(P, cell_type, integral_type):
+    dtype = "float64"
+    gdim = cell_to_gdim(cell_type)
+    element = create_tensor_product_element(cell_type, P, basix.LagrangeVariant.gll_warped)
+    vector_element = create_tensor_product_element(
+        cell_type, P, basix.LagrangeVariant.gll_warped, shape=(gdim,)
+    )
+    coords = create_tensor_product_element(
+        cell_type, 1, basix.LagrangeVariant.gll_warped, shape=(gdim,)
+    )
+    mesh = ufl.Mesh(coords)
+    V = ufl.FunctionSpace(mesh, element)
+    W = ufl.FunctionSpace(mesh, vector_element)
+
+    u, v = ufl.TrialFunction(V), ufl.TestFunction(V)
+    f = ufl.Coefficient(V)
+    b = ufl.Coefficient(W)
+    x = ufl.SpatialCoordinate(mesh)
+    measure = ufl.dx if integral_type == "cell" else ufl.ds
+    a = (
+        (f + x[0]) * ufl.inner(ufl.grad(u), ufl.grad(v))
+        + ufl.inner(b, ufl.grad(f)) * u * v
+        + ufl.div(b) * u * v
+    ) * measure
+
+    rng = np.random.default_rng(0)
+    ndofs = element.dim
+    w = rng.random(ndofs + vector_element.dim)
+    c = np.array([], dtype=dtype)
+    # Perturbed vertices of the reference cell
+    vertices = basix.geometry(cell_type)
+    coords = np.zeros((vertices.shape[0], 3))
+    coords[:, :gdim] = vertices + 0.2 * rng.random(vertices.shape)
+
+    num_facets = len(basix.topology(cell_type)[-2])
+    entities = range(num_facets) if integral_type == "exterior_facet" else [0]
+    tensors = []
+    for sum_factorization in [False, True]:
+        options = {"scalar_type": dtype, "sum_factorization": sum_factorization}
+        # Coefficients and geometry are evaluated by sum factorisation
+        _, code = ffcx.compiler.compile_ufl_objects([a], ffcx.options.get_options(options))
+        sections = [
+            f"Section: {name} (sum factorisation)"
+            for name in ("Coefficient", "Jacobian", "SpatialCoordinate")
+        ]
+        assert all((section in code) == sum_factorization for section in sections)
+        if integral_type == "exterior_facet":
+            assert ("dof_strides" in code) == sum_factorization
+
+        kernel, _, module = generate_kernel([a], dtype, options, integral_type)
+        ffi = module.ffi
+        for entity in entities:
+            A = np.zeros((ndofs, ndofs), dtype=dtype)
+            entity_local_index = np.array([entity], dtype=np.intc)
+            kernel(
+                ffi.cast("double *", A.ctypes.data),
+                ffi.cast("double *", w.ctypes.data),
+                ffi.cast("double *", c.ctypes.data),
+                ffi.cast("double *", coords.ctypes.data),
+                ffi.cast("int *", entity_local_index.ctypes.data),
+                ffi.NULL,
+            )
+            tensors.append(A)
+
+    num_entities = len(entities)
+    for A, A1 in zip(tensors[:num_entities], tensors[num_entities:]):
+        assert np.abs(A).max() > 0
+        np.testing.assert_allclose(A, A1, rtol=1e-10, atol=1e-12)